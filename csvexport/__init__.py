@@ -0,0 +1,6 @@
+import django
+
+
+# The app-config is not discovered automatically before django 3.2.
+if django.VERSION < (3, 2):
+    default_app_config = 'csvexport.apps.CsvexportConfig'
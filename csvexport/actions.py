@@ -1,22 +1,131 @@
 # -*- coding: utf-8 -*-
 import csv
-import codecs
+from itertools import chain
+from itertools import islice
+import django
 from django.utils.translation import gettext_lazy as _
 from django.contrib import messages
+from django.contrib.admin import helpers
+from django.db import transaction
 from django.http import HttpResponse
+from django.http import HttpResponseRedirect
+from django.http import StreamingHttpResponse
 from django.shortcuts import render
+from django.urls import NoReverseMatch
+from django.urls import reverse
 from . import settings
+from .cache import ExportCache
 from .forms import CSVFormatForm
 from .forms import UniqueForm
 from .forms import CSVFieldsForm
-from .utils import CSVData
-from .utils import model_tree_factory
+from .forms import CompressionForm
+from .forms import IncrementalForm
+from .forms import OutputFormatForm
+from .compression import get_compression
+from .export import CSVExport
+from .jobs import submit_job
+from .metrics import ExportMetrics
+from .preview import estimate_count
+from .models import ExportCheckpoint
+from .models import ExportJob
+from .utils import get_csv_format
+from .utils import get_model_tree
+from .utils import get_partial_model_tree
+from .utils import get_relation_paths
+from .utils import is_relation_path
+from .utils import model_tree_factory  # deprecated, kept for backward compatibility
+from .views import SEARCH_PARAM
+from .views import TREE_PARAM
+from .views import search_view
+from .views import tree_view
+from .writers import get_writers
+
+try:
+    from django.core.handlers.asgi import ASGIRequest
+except ImportError:
+    ASGIRequest = None
+
+
+# Asynchronous streaming-responses and queryset-iteration are available since
+# django 4.2.
+ASYNC_EXPORTS = django.VERSION >= (4, 2)
+
+
+def use_async_export(modeladmin, request):
+    """
+    Check if the export should be streamed asynchronously. Set to 'auto' this
+    is done for requests served by asgi.
+    """
+    use_async = getattr(modeladmin, 'csvexport_async', settings.CSV_EXPORT_ASYNC)
+    if use_async == 'auto':
+        use_async = ASGIRequest is not None and isinstance(request, ASGIRequest)
+    return bool(use_async) and ASYNC_EXPORTS
+
+
+def get_lazy_field_paths(modeladmin, request):
+    """
+    Get the field-paths of the nodes to build a partial model-tree for: The
+    relations of the root-node, the nodes with selected fields by default and
+    the submitted nodes. Other post-data is no field-path of a node and is
+    left out.
+    """
+    field_paths = get_relation_paths(modeladmin.model)
+    for choice in getattr(modeladmin, 'csvexport_selected_fields', list()):
+        field_paths.append('__'.join(choice.split('.')[:-1]))
+    if 'csvexport' in request.POST:
+        max_depth = getattr(modeladmin, 'csvexport_reference_depth', settings.CSV_EXPORT_REFERENCE_DEPTH)
+        field_paths += [k for k in request.POST if is_relation_path(modeladmin.model, k, max_depth)]
+    return [p for p in field_paths if p]
+
+
+def get_lazy_nodes(model_tree, request):
+    """
+    Get the nodes to render the fields of a lazy model-tree for. Nodes not
+    rendered are loaded on demand.
+    """
+    for node in model_tree.iterate_nodes_with_choices_and_permission(request):
+        if node.is_root or node.initial or node.field_name in request.POST:
+            yield node
+
+
+def get_job_url(modeladmin, job):
+    """
+    Get the url of the status-page of an export-job. The admin of the
+    export-jobs is looked up on the modeladmin's admin-site and the default
+    one. Return None if it is registered on neither of them.
+    """
+    for site_name in [modeladmin.admin_site.name, 'admin']:
+        try:
+            return reverse('{}:csvexport_exportjob_change'.format(site_name), args=(job.pk,))
+        except NoReverseMatch:
+            continue
+
+
+def get_view_url(modeladmin, name):
+    """
+    Get the url of a view of the export form served by the modeladmin using
+    the CSVExportAdminMixin. Return None if the modeladmin does not serve it.
+    """
+    opts = modeladmin.model._meta
+    url_name = '{}:{}_{}_csvexport_{}'.format(modeladmin.admin_site.name, opts.app_label, opts.model_name, name)
+    try:
+        return reverse(url_name)
+    except NoReverseMatch:
+        return None
 
 
 def csvexport(modeladmin, request, queryset):
     """
     Admin-action to export items as csv-formatted data.
     """
+    # Nodes of a lazy model-tree and field-paths searched for are requested
+    # by the export-form using the admin-action unless the modeladmin serves
+    # them by its own urls.
+    if TREE_PARAM in request.POST:
+        return tree_view(modeladmin, request)
+    if SEARCH_PARAM in request.POST:
+        return search_view(modeladmin, request)
+
     # initiate the format-form
     if 'csvexport' in request.POST and settings.CSV_EXPORT_FORMAT_FORM:
         format_form = CSVFormatForm(request.POST)
@@ -36,74 +145,230 @@ def csvexport(modeladmin, request, queryset):
     else:
         unique_form = UniqueForm(dict(uniq=False))
 
+    # initiate compression-form
+    if 'csvexport' in request.POST and settings.CSV_EXPORT_COMPRESSION_FORM:
+        compression_form = CompressionForm(request.POST)
+    else:
+        compression_form = CompressionForm(dict(compression=settings.CSV_EXPORT_COMPRESSION))
+
+    # initiate output-format-form
+    formats = getattr(modeladmin, 'csvexport_formats', settings.CSV_EXPORT_FORMATS)
+    writers = get_writers(formats) or get_writers(['csv'])
+    if 'csvexport' in request.POST and len(writers) > 1:
+        output_format_form = OutputFormatForm(request.POST, writers=writers)
+    else:
+        output_format_form = OutputFormatForm(dict(output_format=writers[0].name), writers=writers)
+
+    # initiate incremental-form
+    incremental_field = getattr(modeladmin, 'csvexport_incremental_field', None)
+    if 'csvexport' in request.POST and incremental_field:
+        incremental_form = IncrementalForm(request.POST)
+    else:
+        incremental_form = IncrementalForm(dict(incremental=False))
+
     # initiate field-form
     if 'csvexport' in request.POST:
         fields_form = CSVFieldsForm(request.POST)
     else:
         fields_form = CSVFieldsForm()
 
-    # Build up the node-tree
-    tree_class = model_tree_factory(modeladmin, request)
-    model_tree = tree_class(modeladmin.model)
+    metrics = ExportMetrics(request, modeladmin.model)
+    lazy_tree = getattr(modeladmin, 'csvexport_lazy_tree', settings.CSV_EXPORT_LAZY_TREE)
+    with metrics.measure('tree'):
+        # Get the cached node-tree. A lazy tree is only build along the
+        # submitted nodes. Other nodes are loaded on demand.
+        if lazy_tree:
+            model_tree = get_partial_model_tree(modeladmin, get_lazy_field_paths(modeladmin, request))
+            nodes = list(get_lazy_nodes(model_tree, request))
+        else:
+            model_tree = get_model_tree(modeladmin)
+            nodes = list(model_tree.iterate_nodes_with_choices_and_permission(request))
 
-    # Add form-fields to form
-    for node in model_tree.iterate_nodes_with_choices_and_permission():
-        fields_form.fields[node.field_name] = node.get_form_field()
+        # Add form-fields to form
+        for node in nodes:
+            fields_form.fields[node.field_name] = node.get_form_field()
 
     # Write and return csv-data
-    if format_form.is_valid() and fields_form.is_valid() and unique_form.is_valid():
+    export_forms = [format_form, fields_form, unique_form, compression_form, output_format_form, incremental_form]
+    if all(form.is_valid() for form in export_forms):
         # get csv-format
-        csv_format = dict()
-        csv_format['delimiter'] = format_form.cleaned_data['delimiter']
-        csv_format['escapechar'] = format_form.cleaned_data['escapechar']
-        csv_format['quotechar'] = format_form.cleaned_data['quotechar']
-        csv_format['doublequote'] = format_form.cleaned_data['doublequote']
-        csv_format['quoting'] = getattr(csv, format_form.cleaned_data['quoting'])
-        newline = format_form.cleaned_data['lineterminator']
-        csv_format['lineterminator'] = codecs.decode(newline, 'unicode_escape')
+        csv_format = get_csv_format(**format_form.cleaned_data)
 
         # use select-options as csv-header
         header = list()
-        for node in model_tree.iterate_nodes_with_choices_and_permission():
+        for node in nodes:
             header += list(fields_form.cleaned_data[node.field_name])
 
-        csv_data = CSVData(unique_form.cleaned_data['unique'])
-        header_fields = [f.replace('.', '__') for f in header]
-        related_fields = ['__'.join(f.split('__')[:-1]) for f in header_fields if '__' in f]
-        if related_fields:
-            queryset = queryset.select_related(*related_fields)
+        streaming = getattr(modeladmin, 'csvexport_streaming', settings.CSV_EXPORT_STREAMING)
+        chunk_size = getattr(modeladmin, 'csvexport_chunk_size', settings.CSV_EXPORT_CHUNK_SIZE)
+        engine = getattr(modeladmin, 'csvexport_engine', settings.CSV_EXPORT_ENGINE)
+        workers = getattr(modeladmin, 'csvexport_workers', settings.CSV_EXPORT_WORKERS)
+        annotations = getattr(modeladmin, 'csvexport_annotations', dict())
+        unique = unique_form.cleaned_data['unique']
+        compression = get_compression(compression_form.cleaned_data['compression'])
+        output_format = output_format_form.cleaned_data['output_format']
+
+        checkpoint = None
+        if incremental_form.cleaned_data['incremental']:
+            checkpoint = ExportCheckpoint.objects.get_checkpoint(
+                modeladmin.model, incremental_field, request.user, incremental_form.cleaned_data['checkpoint'])
 
-        # write csv-header and -data and return csv-data as view or download
+        # Let an export-job write the csv-data in background.
+        if 'csvexport_background' in request.POST:
+            # The job rebuilds the queryset from the changelist's filters and
+            # the selected items.
+            pks = None
+            if request.POST.get('select_across') != '1':
+                pks = request.POST.getlist(helpers.ACTION_CHECKBOX_NAME)
+            job = ExportJob.objects.create_job(
+                modeladmin, header, csv_format, unique, engine, chunk_size, workers, output_format,
+                checkpoint, filters=dict(request.GET.lists()), pks=pks, user=request.user)
+            # The runner must not look for the job before it is committed.
+            transaction.on_commit(lambda: submit_job(job))
+            messages.info(request, _('Export-job started.'))
+            return HttpResponseRedirect(get_job_url(modeladmin, job) or request.get_full_path())
+
+        # Viewing the data must not use up the changes since the checkpoint.
+        # The items are filtered by the checkpoint without advancing it.
+        incremental = checkpoint is not None
+        if incremental and 'csvexport_view' in request.POST:
+            queryset = checkpoint.filter(queryset)
+            checkpoint = None
+
+        export = CSVExport(
+            queryset, header, csv_format, unique, engine, chunk_size, workers, output_format, annotations,
+            checkpoint)
+        writer = export.writer_class
+
+        # Preview the first rows of the export instead of viewing it all.
+        preview_rows = getattr(modeladmin, 'csvexport_preview_rows', settings.CSV_EXPORT_PREVIEW_ROWS)
+        if 'csvexport_view' in request.POST and preview_rows:
+            context = modeladmin.admin_site.each_context(request)
+            context.update({
+                'header': export.header,
+                'rows': export.get_preview(preview_rows),
+                'limit': preview_rows,
+                'estimate': estimate_count(export.queryset),
+                'opts': modeladmin.model._meta,
+                'title': _('CSV-Export Preview'),
+            })
+            return render(request, 'csvexport/preview.html', context)
+
+        # Serve repeated exports from the cache. Incremental exports must not
+        # be cached since they advance their checkpoint.
+        cache = None
+        cached = None
+        if getattr(modeladmin, 'csvexport_cache', settings.CSV_EXPORT_CACHE) and not incremental:
+            cache = ExportCache(export)
+            cached = cache.get()
+
+        # An asynchronous export does not hold a thread of the sync-to-async
+        # pool of an asgi-server while writing the rows. Cached and parallel
+        # exports are written synchronously.
+        use_async = cache is None and export.workers <= 1 and use_async_export(modeladmin, request)
+
+        metrics.start(export)
+        if cached is not None:
+            data, export.rows = cached
+            chunks = metrics.iterate([data])
+        elif use_async:
+            chunks = metrics.aiterate(export)
+        elif cache is not None:
+            chunks = metrics.iterate(cache.iterate(export))
+        else:
+            chunks = metrics.iterate(export)
+
+        # write header and data and return them as view or download
         try:
-            writer = csv.writer(csv_data, **csv_format)
-            writer.writerow(tuple(f for f in header))
-            for item in queryset.values_list(*header_fields):
-                row = tuple(f if f is not None and f != '' else settings.CSV_EXPORT_EMPTY_VALUE for f in item)
-                writer.writerow(row)
-        except (csv.Error, TypeError) as exc:
+            if use_async:
+                # The rows are written not until the response is consumed. The
+                # header and the first row are written upfront to catch errors
+                # before the response is returned.
+                export.check()
+                content = compression.acompress(chunks) if compression else chunks
+            elif streaming:
+                # Rows are written lazily while the response is consumed. The
+                # header and the first row are written upfront to catch
+                # errors before the response is returned.
+                lines = iter(chunks)
+                content = chain(list(islice(lines, 2)), lines)
+                if compression:
+                    content = compression.compress(content)
+            elif compression:
+                content = b''.join(compression.compress(chunks))
+            elif export.binary:
+                content = b''.join(chunks)
+            else:
+                content = ''.join(chunks)
+        except (csv.Error, TypeError, ValueError) as exc:
+            metrics.finish(exc)
             messages.error(request, 'Could not write csv-file: {}'.format(exc))
         else:
-            if 'csvexport_view' in request.POST:
+            response_class = StreamingHttpResponse if streaming or use_async else HttpResponse
+            # Binary formats could not be viewed and are always downloaded.
+            if 'csvexport_view' in request.POST and not export.binary:
                 content_type = "text/plain;charset=utf-8"
-                response = HttpResponse(csv_data, content_type=content_type)
-            elif 'csvexport_download' in request.POST:
-                content_type = "text/csv"
-                response = HttpResponse(csv_data, content_type=content_type)
-                filename = modeladmin.model._meta.label_lower + '.csv'
+                response = response_class(content, content_type=content_type)
+                if compression:
+                    response['Content-Encoding'] = compression.encoding
+            else:
+                content_type = compression.content_type if compression else writer.content_type
+                response = response_class(content, content_type=content_type)
+                filename = modeladmin.model._meta.label_lower + writer.extension
+                if compression:
+                    filename += compression.extension
                 content_disposition = 'attachment; filename="{}"'.format(filename)
                 response['Content-Disposition'] = content_disposition
+            if export.unique_path:
+                response['X-CSV-Export-Unique'] = export.unique_path
+            if cache is not None:
+                response['X-CSV-Export-Cache'] = 'hit' if cached is not None else 'miss'
+            if use_async:
+                response.streaming_content = metrics.aiterate_response(response.streaming_content)
+            elif streaming:
+                response.streaming_content = metrics.iterate_response(response.streaming_content)
+            else:
+                metrics.bytes = len(response.content)
+                metrics.finish()
             return response
 
     # If forms are invalid or csv-data couldn't be written return to the form
     format_form = format_form if settings.CSV_EXPORT_FORMAT_FORM else None
     unique_form = unique_form if settings.CSV_EXPORT_UNIQUE_FORM else None
+    compression_form = compression_form if settings.CSV_EXPORT_COMPRESSION_FORM else None
+    output_format_form = output_format_form if len(writers) > 1 else None
+    incremental_form = incremental_form if incremental_field else None
+
+    # Pass on the selection of the changelist without evaluating the queryset.
+    # If all items are selected the queryset is rebuilt from the filter-params
+    # of the url and only one pk is needed to run the action.
+    select_across = request.POST.get('select_across') == '1'
+    selected = request.POST.getlist(helpers.ACTION_CHECKBOX_NAME)
+    if select_across:
+        selected = selected[:1]
+
+    field_search = getattr(modeladmin, 'csvexport_field_search', settings.CSV_EXPORT_FIELD_SEARCH)
+
+    # Relations of the root-node to load on demand.
+    tree_nodes = list()
+    if lazy_tree:
+        tree_nodes = [(n.field_label, n.field_path) for n in model_tree.children]
 
     context = modeladmin.admin_site.each_context(request)
     context.update({
-        'objects': queryset.order_by('pk'),
+        'background': getattr(modeladmin, 'csvexport_background', settings.CSV_EXPORT_BACKGROUND),
+        'select_across': select_across,
+        'selected': selected,
         'format_form': format_form,
         'unique_form': unique_form,
+        'compression_form': compression_form,
+        'output_format_form': output_format_form,
+        'incremental_form': incremental_form,
         'fields_form': fields_form,
+        'tree_nodes': tree_nodes,
+        'tree_url': get_view_url(modeladmin, 'tree') if tree_nodes else None,
+        'field_search': field_search,
+        'search_url': get_view_url(modeladmin, 'search') if field_search else None,
         'title': _('CSV-Export')
         })
 
@@ -0,0 +1,150 @@
+# -*- coding: utf-8 -*-
+from django.contrib import admin
+from django.core.exceptions import PermissionDenied
+from django.http import Http404
+from django.http import HttpResponseNotAllowed
+from django.http import JsonResponse
+from django.shortcuts import get_object_or_404
+from django.urls import path
+from django.urls import reverse
+from django.utils.html import format_html
+from django.utils.translation import gettext_lazy as _
+from .download import serve_file
+from .models import ExportCheckpoint
+from .models import ExportJob
+from .views import search_view
+from .views import tree_view
+from .writers import get_writer
+
+
+class CSVExportAdminMixin:
+    """
+    Serve the nodes of the lazy model-tree and the field-search of the export
+    form by urls of the modeladmin. Other than the admin-action these views
+    do not build the changelist with its queries.
+    """
+    def get_urls(self):
+        info = self.model._meta.app_label, self.model._meta.model_name
+        urls = [
+            path('csvexport/tree/',
+                 self.admin_site.admin_view(self.csvexport_tree_view),
+                 name='%s_%s_csvexport_tree' % info),
+            path('csvexport/search/',
+                 self.admin_site.admin_view(self.csvexport_search_view),
+                 name='%s_%s_csvexport_search' % info),
+        ]
+        return urls + super().get_urls()
+
+    def csvexport_view(self, request, view):
+        if request.method != 'POST':
+            return HttpResponseNotAllowed(['POST'])
+        if not self.has_view_permission(request):
+            raise PermissionDenied
+        return view(self, request)
+
+    def csvexport_tree_view(self, request):
+        return self.csvexport_view(request, tree_view)
+
+    def csvexport_search_view(self, request):
+        return self.csvexport_view(request, search_view)
+
+
+@admin.register(ExportCheckpoint)
+class ExportCheckpointAdmin(admin.ModelAdmin):
+    """
+    Checkpoints of incremental exports. Deleting a checkpoint makes the next
+    incremental export a full one again.
+    """
+    list_display = ['model', 'name', 'user', 'field', 'value', 'updated']
+    list_filter = ['model']
+    fields = list_display
+    readonly_fields = ['model', 'field', 'updated']
+
+    def has_add_permission(self, request):
+        return False
+
+
+@admin.register(ExportJob)
+class ExportJobAdmin(admin.ModelAdmin):
+    """
+    Status- and download-pages of export-jobs. Staff-users could access their
+    own jobs.
+    """
+    change_form_template = 'csvexport/exportjob_change_form.html'
+    list_display = ['__str__', 'user', 'status', 'rows', 'created', 'finished', 'download_link']
+    list_filter = ['status']
+    fields = ['model', 'output_format', 'user', 'status', 'rows', 'created', 'started', 'finished', 'error', 'download_link']
+    readonly_fields = fields
+
+    def get_queryset(self, request):
+        queryset = super().get_queryset(request)
+        if not request.user.is_superuser:
+            queryset = queryset.filter(user=request.user)
+        return queryset
+
+    def has_module_permission(self, request):
+        return request.user.is_active and request.user.is_staff
+
+    def has_view_permission(self, request, obj=None):
+        return request.user.is_active and request.user.is_staff
+
+    def has_add_permission(self, request):
+        return False
+
+    def has_change_permission(self, request, obj=None):
+        return False
+
+    def change_view(self, request, object_id, form_url='', extra_context=None):
+        extra_context = extra_context or dict()
+        url_name = '{}:csvexport_exportjob_status'.format(self.admin_site.name)
+        extra_context['status_url'] = reverse(url_name, args=(object_id,))
+        return super().change_view(request, object_id, form_url, extra_context)
+
+    def get_urls(self):
+        info = self.model._meta.app_label, self.model._meta.model_name
+        urls = [
+            path('<int:pk>/status/',
+                 self.admin_site.admin_view(self.status_view),
+                 name='%s_%s_status' % info),
+            path('<int:pk>/download/',
+                 self.admin_site.admin_view(self.download_view, cacheable=True),
+                 name='%s_%s_download' % info),
+        ]
+        return urls + super().get_urls()
+
+    def get_download_url(self, job):
+        if job.status == ExportJob.FINISHED and job.file:
+            url_name = '{}:csvexport_exportjob_download'.format(self.admin_site.name)
+            return reverse(url_name, args=(job.pk,))
+
+    def download_link(self, job):
+        url = self.get_download_url(job)
+        if url:
+            return format_html('<a href="{}">{}</a>', url, job.file.name)
+        return '-'
+    download_link.short_description = _('Download')
+
+    def status_view(self, request, pk):
+        """
+        Status of the export-job as json to be polled by the status-page.
+        """
+        job = get_object_or_404(self.get_queryset(request), pk=pk)
+        return JsonResponse(dict(
+            status=job.status,
+            rows=job.rows,
+            error=job.error,
+            done=job.is_done,
+            download_url=self.get_download_url(job),
+        ))
+
+    def download_view(self, request, pk):
+        job = get_object_or_404(self.get_queryset(request), pk=pk)
+        if not self.get_download_url(job):
+            raise Http404
+        writer = get_writer(job.output_format)
+        filename = job.model.lower() + writer.extension
+        # The file of a finished job never changes. So the etag is derived
+        # from the job without reading the file.
+        etag = 'exportjob-{}-{}'.format(job.pk, job.file.name)
+        last_modified = int(job.finished.timestamp()) if job.finished else None
+        return serve_file(request, job.file, filename, writer.content_type, etag, last_modified)
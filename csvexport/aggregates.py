@@ -0,0 +1,76 @@
+# -*- coding: utf-8 -*-
+from django.db import connections
+from django.db import models
+from django.db.models import Aggregate
+from django.db.models import OuterRef
+from django.db.models import Subquery
+from django.db.models.functions import Cast
+
+
+# Placeholder-field for the values of aggregated columns.
+AGGREGATED_FIELD = models.TextField(null=True)
+
+
+class GroupConcat(Aggregate):
+    """
+    Concatenate the values of a group joined by a separator. For postgresql
+    use StringAgg. The separator is passed as parameter of the template since
+    django before 3.2 rejects aggregates of multiple expressions on sqlite.
+    """
+    function = 'GROUP_CONCAT'
+    template = '%(function)s(%(expressions)s, %%s)'
+    output_field = models.TextField()
+
+    def __init__(self, expression, separator, **extra):
+        super().__init__(Cast(expression, models.TextField()), **extra)
+        self.separator = separator
+
+    def as_sql(self, compiler, connection, **extra_context):
+        sql, params = super().as_sql(compiler, connection, **extra_context)
+        return sql, [*params, self.separator]
+
+    def as_mysql(self, compiler, connection, **extra_context):
+        return self.as_sql(
+            compiler, connection,
+            template='%(function)s(%(expressions)s SEPARATOR %%s)',
+            **extra_context)
+
+    def as_oracle(self, compiler, connection, **extra_context):
+        return self.as_sql(
+            compiler, connection,
+            template='%(function)s(%(expressions)s, %%s) WITHIN GROUP (ORDER BY 1)',
+            function='LISTAGG',
+            **extra_context)
+
+
+def is_to_many(model, field_path):
+    """
+    Check if a field-path crosses a one-to-many or many-to-many relation.
+    """
+    for relation in field_path.split('__')[:-1]:
+        field = model._meta.get_field(relation)
+        if field.one_to_many or field.many_to_many:
+            return True
+        model = field.related_model
+    return False
+
+
+def get_aggregate(vendor, field_path, separator):
+    if vendor == 'postgresql':
+        from django.contrib.postgres.aggregates import StringAgg
+        return StringAgg(Cast(field_path, models.TextField()), delimiter=separator)
+    else:
+        return GroupConcat(field_path, separator)
+
+
+def get_aggregation(queryset, field_path, separator):
+    """
+    Get a correlated subquery aggregating the values of a to-many field-path
+    for each item of the queryset into one string. Having one subquery per
+    column avoids multiplying the rows of different to-many relations.
+    """
+    model = queryset.model
+    vendor = connections[queryset.db].vendor
+    aggregation = model._base_manager.filter(pk=OuterRef('pk')).order_by().values('pk')
+    aggregation = aggregation.annotate(value=get_aggregate(vendor, field_path, separator)).values('value')
+    return Subquery(aggregation, output_field=models.TextField())
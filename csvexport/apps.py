@@ -1,5 +1,27 @@
 from django.apps import AppConfig
+from django.core.signals import setting_changed
+from django.db.models.signals import class_prepared
+from django.db.models.signals import post_delete
+from django.db.models.signals import post_save
 
 
 class CsvexportConfig(AppConfig):
     name = 'csvexport'
+    default_auto_field = 'django.db.models.AutoField'
+
+    def ready(self):
+        from .utils import clear_model_tree_cache
+        class_prepared.connect(clear_model_tree_cache, dispatch_uid='csvexport_class_prepared')
+        setting_changed.connect(clear_model_tree_cache, dispatch_uid='csvexport_setting_changed')
+
+        from .search import clear_field_path_index_cache
+        class_prepared.connect(clear_field_path_index_cache, dispatch_uid='csvexport_index_class_prepared')
+        setting_changed.connect(clear_field_path_index_cache, dispatch_uid='csvexport_index_setting_changed')
+
+        from . import settings
+        from .cache import invalidate_receiver
+        for label in settings.CSV_EXPORT_CACHE_INVALIDATE:
+            model = self.apps.get_model(label)
+            dispatch_uid = 'csvexport_invalidate_{}'.format(model._meta.label_lower)
+            post_save.connect(invalidate_receiver, sender=model, dispatch_uid=dispatch_uid)
+            post_delete.connect(invalidate_receiver, sender=model, dispatch_uid=dispatch_uid)
@@ -0,0 +1,173 @@
+# -*- coding: utf-8 -*-
+import hashlib
+import logging
+from django.core.cache import caches
+from django.core.exceptions import EmptyResultSet
+from django.core.exceptions import FieldDoesNotExist
+from django.db.models import F
+from django.utils import timezone
+from . import settings
+
+
+logger = logging.getLogger(__name__)
+
+
+def get_cache():
+    return caches[settings.CSV_EXPORT_CACHE_ALIAS]
+
+
+def get_version_key(model):
+    return 'csvexport:version:{}'.format(model._meta.label_lower)
+
+
+def get_versions(models):
+    """
+    Get the cache-versions of models. A model without version gets one.
+    """
+    cache = get_cache()
+    keys = [get_version_key(m) for m in models]
+    versions = cache.get_many(keys)
+    for key in keys:
+        if key not in versions:
+            cache.add(key, 1, None)
+            versions[key] = cache.get(key, 1)
+    return [versions[k] for k in keys]
+
+
+def invalidate(model):
+    """
+    Invalidate all cached exports including data of a model by bumping its
+    version.
+    """
+    cache = get_cache()
+    key = get_version_key(model)
+    try:
+        cache.incr(key)
+    except ValueError:
+        cache.set(key, 1, None)
+
+
+def invalidate_receiver(sender, **kwargs):
+    """
+    Receiver for the post_save- and post_delete-signals of the models
+    configured by CSV_EXPORT_CACHE_INVALIDATE.
+    """
+    invalidate(sender)
+
+
+def get_path_models(model, field_path):
+    """
+    Get the models along a field-path starting with the given model. Lookups
+    and transforms following the fields are ignored.
+    """
+    models = [model]
+    for name in field_path.split('__'):
+        try:
+            field = model._meta.get_field(name)
+        except FieldDoesNotExist:
+            break
+        if not field.is_relation or field.related_model is None:
+            break
+        model = field.related_model
+        models.append(model)
+    return models
+
+
+def get_expression_models(model, expression):
+    """
+    Get the models an expression refers to by field-paths or subqueries.
+    """
+    models = list()
+    expressions = expression.flatten() if hasattr(expression, 'flatten') else [expression]
+    for expr in expressions:
+        if isinstance(expr, F):
+            models += get_path_models(model, expr.name)
+        query = getattr(expr, 'query', None) or getattr(getattr(expr, 'queryset', None), 'query', None)
+        if query is not None and query.model is not None:
+            models.append(query.model)
+    return models
+
+
+class ExportCache:
+    """
+    Cache the data of an export. The key is build from the sql-query, the
+    columns, the format and all settings affecting the written data. It
+    includes the versions of the involved models. So invalidating a model
+    makes all cached exports of it unreachable.
+
+    Data is only stored if it was written completely and does not exceed
+    CSV_EXPORT_CACHE_MAX_SIZE.
+    """
+    def __init__(self, export):
+        self.export = export
+        self.cache = get_cache()
+        self.key = self.get_key()
+
+    def get_models(self):
+        """
+        Get all models the data of the export depends on. These are the models
+        along the field-paths including those joined by to-many relations
+        and the models referred to by annotations.
+        """
+        root = self.export.queryset.model
+        models = [root]
+        for path in self.export.field_paths:
+            if path in self.export.annotations:
+                models += get_expression_models(root, self.export.annotations[path])
+            else:
+                models += get_path_models(root, path)
+        return list(dict.fromkeys(models))
+
+    def get_key(self):
+        """
+        Get the cache-key for the export. Return None if the export could not
+        be cached.
+        """
+        queryset = self.export.queryset.values_list(*self.export.columns)
+        try:
+            sql, params = queryset.query.get_compiler(queryset.db).as_sql()
+        except EmptyResultSet:
+            return None
+        parts = [
+            queryset.db,
+            sql,
+            params,
+            self.export.header,
+            sorted(self.export.csv_format.items()) if self.export.csv_format else None,
+            self.export.unique_path,
+            self.export.output_format,
+            settings.CSV_EXPORT_CHOICES_DISPLAY,
+            settings.CSV_EXPORT_EMPTY_VALUE,
+            timezone.get_current_timezone_name(),
+            get_versions(self.get_models()),
+        ]
+        digest = hashlib.sha256(repr(parts).encode('utf-8')).hexdigest()
+        return 'csvexport:export:{}'.format(digest)
+
+    def get(self):
+        """
+        Get the cached data and number of rows of the export or None.
+        """
+        if self.key is not None:
+            return self.cache.get(self.key)
+
+    def iterate(self, chunks):
+        """
+        Iterate the chunks of the export and store them when they were
+        consumed completely.
+        """
+        size = 0
+        stored = list()
+        for chunk in chunks:
+            if stored is not None:
+                size += len(chunk)
+                stored.append(chunk)
+                if size > settings.CSV_EXPORT_CACHE_MAX_SIZE:
+                    stored = None
+            yield chunk
+
+        if stored is None or self.key is None:
+            return
+        data = (b'' if self.export.binary else '').join(stored)
+        self.cache.set(self.key, (data, self.export.rows), settings.CSV_EXPORT_CACHE_TIMEOUT)
+        logger.debug('Cached export of %s with %s bytes.', self.export.queryset.model._meta.label, size)
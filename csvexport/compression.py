@@ -0,0 +1,95 @@
+# -*- coding: utf-8 -*-
+import zlib
+from django.utils.translation import gettext_lazy as _
+
+try:
+    from compression import zstd
+except ImportError:
+    try:
+        import zstandard as zstd
+    except ImportError:
+        zstd = None
+
+
+class Compression:
+    """
+    Incremental compression of the exported data.
+    """
+    name = None
+    label = None
+    encoding = None
+    extension = None
+    content_type = None
+
+    def get_compressor(self):
+        """
+        Get an object with a compress- and a flush-method like the one of
+        zlib.compressobj.
+        """
+        raise NotImplementedError
+
+    def compress(self, content):
+        """
+        Compress the chunks of content while iterating them. Chunks could be
+        str or bytes.
+        """
+        compressor = self.get_compressor()
+        for chunk in content:
+            if isinstance(chunk, str):
+                chunk = chunk.encode('utf-8')
+            data = compressor.compress(chunk)
+            if data:
+                yield data
+        yield compressor.flush()
+
+    async def acompress(self, content):
+        """
+        Compress the chunks of an asynchronous iterable while iterating them.
+        """
+        compressor = self.get_compressor()
+        async for chunk in content:
+            if isinstance(chunk, str):
+                chunk = chunk.encode('utf-8')
+            data = compressor.compress(chunk)
+            if data:
+                yield data
+        yield compressor.flush()
+
+
+class GzipCompression(Compression):
+    name = 'gzip'
+    label = _('gzip')
+    encoding = 'gzip'
+    extension = '.gz'
+    content_type = 'application/gzip'
+
+    def get_compressor(self):
+        return zlib.compressobj(6, zlib.DEFLATED, 31)
+
+
+class ZstdCompression(Compression):
+    name = 'zstd'
+    label = _('zstd')
+    encoding = 'zstd'
+    extension = '.zst'
+    content_type = 'application/zstd'
+
+    def get_compressor(self):
+        if hasattr(zstd, 'ZstdCompressor') and hasattr(zstd.ZstdCompressor, 'compressobj'):
+            return zstd.ZstdCompressor().compressobj()
+        else:
+            return zstd.ZstdCompressor()
+
+
+COMPRESSIONS = [GzipCompression()]
+if zstd is not None:
+    COMPRESSIONS.append(ZstdCompression())
+
+
+def get_compression(name):
+    """
+    Get an available compression by name. Return None for no compression.
+    """
+    for compression in COMPRESSIONS:
+        if compression.name == name:
+            return compression
@@ -0,0 +1,112 @@
+# -*- coding: utf-8 -*-
+import re
+from django.http import FileResponse
+from django.http import HttpResponse
+from django.http import StreamingHttpResponse
+from django.utils.cache import get_conditional_response
+from django.utils.cache import patch_cache_control
+from django.utils.http import http_date
+from django.utils.http import parse_etags
+from django.utils.http import parse_http_date_safe
+from django.utils.http import quote_etag
+from .utils import read_blocks
+
+
+RANGE_RE = re.compile(r'^bytes=(\d*)-(\d*)$')
+
+
+def get_range(header, size):
+    """
+    Get the first and last byte of a range-header for a file of the given
+    size. Return None if the header could not be parsed or asks for multiple
+    ranges, which are served as full content. Raise ValueError if the range
+    is not satisfiable.
+    """
+    match = RANGE_RE.match(header.strip())
+    if match is None:
+        return None
+    first, last = match.groups()
+    if not first and not last:
+        return None
+    if not first:
+        # suffix-range of the last bytes
+        length = int(last)
+        if not length or not size:
+            raise ValueError('Unsatisfiable range: {}'.format(header))
+        return max(0, size - length), size - 1
+    first = int(first)
+    if last and int(last) < first:
+        return None
+    if first >= size:
+        raise ValueError('Unsatisfiable range: {}'.format(header))
+    last = min(int(last), size - 1) if last else size - 1
+    return first, last
+
+
+def if_range_matches(request, etag, last_modified):
+    """
+    Check if the If-Range-header, if any, matches the current version of the
+    file. Only strong etags match.
+    """
+    if_range = request.META.get('HTTP_IF_RANGE')
+    if not if_range:
+        return True
+    if if_range.startswith(('"', 'W/"')):
+        return not if_range.startswith('W/') and etag in parse_etags(if_range)
+    timestamp = parse_http_date_safe(if_range)
+    return timestamp is not None and last_modified is not None and int(last_modified) == timestamp
+
+
+def iterate_range(file, first, last):
+    try:
+        file.seek(first)
+        yield from read_blocks(file, last - first + 1)
+    finally:
+        file.close()
+
+
+def serve_file(request, file, filename, content_type, etag, last_modified=None):
+    """
+    Serve a stored file supporting conditional and range-requests. Unchanged
+    files are answered by 304 responses using the ETag and Last-Modified
+    headers. A single byte-range is served as partial content to resume
+    interrupted downloads. Responses are private and must be revalidated by
+    the client.
+
+    :param file: the FieldFile to serve
+    :param str etag: unquoted etag of the file's current version
+    :param float last_modified: timestamp of the last modification
+    """
+    etag = quote_etag(etag)
+    response = get_conditional_response(request, etag=etag, last_modified=last_modified)
+    if response is None:
+        response = get_file_response(request, file, filename, content_type, etag, last_modified)
+    response['Accept-Ranges'] = 'bytes'
+    response['ETag'] = etag
+    patch_cache_control(response, private=True, no_cache=True)
+    if last_modified is not None:
+        response['Last-Modified'] = http_date(last_modified)
+    return response
+
+
+def get_file_response(request, file, filename, content_type, etag, last_modified):
+    size = file.size
+    byte_range = None
+    if 'HTTP_RANGE' in request.META and if_range_matches(request, etag, last_modified):
+        try:
+            byte_range = get_range(request.META['HTTP_RANGE'], size)
+        except ValueError:
+            response = HttpResponse(status=416)
+            response['Content-Range'] = 'bytes */{}'.format(size)
+            return response
+
+    if byte_range is None:
+        return FileResponse(file.open('rb'), as_attachment=True, filename=filename, content_type=content_type)
+
+    first, last = byte_range
+    response = StreamingHttpResponse(
+        iterate_range(file.open('rb'), first, last), status=206, content_type=content_type)
+    response['Content-Length'] = str(last - first + 1)
+    response['Content-Range'] = 'bytes {}-{}/{}'.format(first, last, size)
+    response['Content-Disposition'] = 'attachment; filename="{}"'.format(filename)
+    return response
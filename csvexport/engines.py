@@ -0,0 +1,115 @@
+# -*- coding: utf-8 -*-
+from itertools import islice
+
+
+def iterate_cursor(queryset, field_paths, chunk_size):
+    """
+    Iterate the rows of the queryset using a single query. Rows are fetched in
+    chunks using server-side cursors where supported.
+    """
+    return queryset.values_list(*field_paths).iterator(chunk_size=chunk_size)
+
+
+def get_keyset_ordering(queryset):
+    """
+    Get the pk-ordering to walk the queryset in keyset pages without changing
+    its order. Return None if the queryset is ordered by other fields than the
+    primary key.
+    """
+    query = queryset.query
+    if query.distinct or query.low_mark or query.high_mark is not None:
+        return None
+
+    if query.order_by:
+        ordering = list(query.order_by)
+    elif query.default_ordering:
+        ordering = list(queryset.model._meta.ordering)
+    else:
+        ordering = list()
+
+    pk = queryset.model._meta.pk
+    pk_names = ['pk', pk.name, pk.attname]
+    if not ordering:
+        return 'pk'
+    elif len(ordering) == 1 and ordering[0] in pk_names:
+        return 'pk'
+    elif len(ordering) == 1 and ordering[0] in ['-' + n for n in pk_names]:
+        return '-pk'
+    else:
+        return None
+
+
+def iterate_keyset(queryset, field_paths, chunk_size):
+    """
+    Iterate the rows of the queryset in pk-ordered pages. Each page is fetched
+    by its own short query::
+
+        WHERE pk > last_pk ORDER BY pk LIMIT chunk_size
+    """
+    ordering = get_keyset_ordering(queryset)
+    if ordering is None:
+        raise ValueError('Keyset pagination needs a queryset ordered by pk.')
+    lookup = 'pk__lt' if ordering == '-pk' else 'pk__gt'
+
+    pages = queryset.order_by(ordering).values_list('pk', *field_paths)
+    page = pages
+    while True:
+        rows = list(page[:chunk_size])
+        for row in rows:
+            yield row[1:]
+        if len(rows) < chunk_size:
+            break
+        page = pages.filter(**{lookup: rows[-1][0]})
+
+
+async def aiterate_cursor(queryset, field_paths, chunk_size):
+    """
+    Iterate the rows of the queryset asynchronously using a single query. The
+    database-backends are synchronous. So each chunk is fetched by a thread of
+    the sync-to-async pool like QuerySet.aiterator does. But the query is
+    executed within this thread as well, which QuerySet.aiterator does not do
+    for values-querysets of all django-versions.
+    """
+    from asgiref.sync import sync_to_async
+    rows = iterate_cursor(queryset, field_paths, chunk_size)
+    fetch = sync_to_async(lambda: list(islice(rows, chunk_size)))
+    try:
+        while True:
+            chunk = await fetch()
+            for row in chunk:
+                yield row
+            if len(chunk) < chunk_size:
+                break
+    finally:
+        await sync_to_async(rows.close)()
+
+
+async def aiterate_keyset(queryset, field_paths, chunk_size):
+    """
+    Iterate the rows of the queryset asynchronously in pk-ordered pages.
+    """
+    ordering = get_keyset_ordering(queryset)
+    if ordering is None:
+        raise ValueError('Keyset pagination needs a queryset ordered by pk.')
+    lookup = 'pk__lt' if ordering == '-pk' else 'pk__gt'
+
+    pages = queryset.order_by(ordering).values_list('pk', *field_paths)
+    page = pages
+    while True:
+        rows = [row async for row in page[:chunk_size]]
+        for row in rows:
+            yield row[1:]
+        if len(rows) < chunk_size:
+            break
+        page = pages.filter(**{lookup: rows[-1][0]})
+
+
+ENGINES = {
+    'cursor': iterate_cursor,
+    'keyset': iterate_keyset,
+}
+
+ASYNC_ENGINES = {
+    'cursor': aiterate_cursor,
+    'keyset': aiterate_keyset,
+}
@@ -0,0 +1,266 @@
+# -*- coding: utf-8 -*-
+import time
+import logging
+from . import settings
+from .aggregates import AGGREGATED_FIELD
+from .aggregates import get_aggregation
+from .aggregates import is_to_many
+from .engines import ASYNC_ENGINES
+from .engines import ENGINES
+from .engines import get_keyset_ordering
+from .parallel import SHARDS_PER_WORKER
+from .parallel import get_executor
+from .parallel import get_pk_ranges
+from .parallel import iterate_shards
+from .unique import afilter_unique
+from .unique import filter_unique
+from .utils import allows_distinct
+from .utils import get_distinct_ordering
+from .utils import get_field_paths
+from .utils import get_model_field
+from .utils import is_nullable
+from .utils import get_related_paths
+from .writers import get_writer
+
+
+logger = logging.getLogger(__name__)
+
+
+class CSVExport:
+    """
+    Export the items of a queryset as csv-formatted data or in another format
+    of the available writers. The data is written while iterating the export.
+
+    :param queryset: items to export
+    :param list header: dotted field-paths as used by the csv-header
+    :param dict csv_format: format-parameters for the csv-writer
+    :param bool unique: make the rows unique
+    :param str engine: engine to fetch the rows with
+    :param int chunk_size: number of rows fetched at once
+    :param int workers: number of processes to export pk-ranges in parallel
+    :param str output_format: name of the writer to write the data with
+    :param dict annotations: expressions by their labels used in the header
+    :param checkpoint: export only items changed since this checkpoint and
+                       advance it when the export is complete
+    """
+    def __init__(self, queryset, header, csv_format, unique=False, engine=None, chunk_size=None, workers=1,
+                 output_format='csv', annotations=None, checkpoint=None):
+        self.checkpoint = checkpoint
+        if checkpoint is not None:
+            queryset = checkpoint.filter(queryset)
+
+        self.header = list(header)
+        self.annotations = dict(annotations or dict())
+        self.field_paths = get_field_paths(self.header)
+
+        # Computed columns and the values of to-many relations are evaluated
+        # by annotations. The columns to fetch are the field-paths or the
+        # names of these annotations.
+        self.columns = list()
+        model_paths = list()
+        related_paths = list()
+        expressions = dict()
+        for index, path in enumerate(self.field_paths):
+            if path in self.annotations:
+                column = 'csvexport_annotation_{}'.format(index)
+                expression = self.annotations[path]
+            elif is_to_many(queryset.model, path):
+                column = 'csvexport_aggregation_{}'.format(index)
+                expression = get_aggregation(queryset, path, settings.CSV_EXPORT_TO_MANY_SEPARATOR)
+                model_paths.append(path)
+            else:
+                column = path
+                expression = None
+                model_paths.append(path)
+                related_paths.append(path)
+            if expression is not None and column not in queryset.query.annotations:
+                expressions[column] = expression
+            self.columns.append(column)
+        if expressions:
+            queryset = queryset.annotate(**expressions)
+
+        self.fields = list()
+        self.nullable = list()
+        for path, column in zip(self.field_paths, self.columns):
+            if path in self.annotations:
+                self.fields.append(queryset.query.annotations[column].output_field)
+                self.nullable.append(True)
+            elif column != path:
+                self.fields.append(AGGREGATED_FIELD)
+                self.nullable.append(True)
+            else:
+                self.fields.append(get_model_field(queryset.model, path))
+                self.nullable.append(is_nullable(queryset.model, path))
+
+        self.output_format = output_format or 'csv'
+        self.writer_class = get_writer(self.output_format)
+        self.csv_format = csv_format
+        self.chunk_size = chunk_size or settings.CSV_EXPORT_CHUNK_SIZE
+        self.engine = engine or settings.CSV_EXPORT_ENGINE
+        self.workers = workers or 1
+
+        related_paths = get_related_paths(related_paths)
+        if related_paths:
+            queryset = queryset.select_related(*related_paths)
+
+        if self.engine == 'keyset' and get_keyset_ordering(queryset) is None:
+            logger.warning('Queryset of %s is not ordered by pk. Use cursor engine instead of keyset engine.',
+                           queryset.model._meta.label)
+            self.engine = 'cursor'
+
+        # Let the database make the rows unique if possible. Otherwise unique
+        # rows are filtered while writing the data.
+        self.unique = False
+        self.unique_path = None
+        if unique and self.engine == 'cursor' and allows_distinct(queryset, model_paths):
+            ordering = get_distinct_ordering(queryset, self.field_paths)
+            queryset = queryset.order_by(*ordering).distinct()
+            self.unique_path = 'sql'
+        elif unique:
+            self.unique = True
+            self.unique_path = 'python'
+        if self.unique_path:
+            logger.debug('Unique rows for %s are filtered by %s.', queryset.model._meta.label, self.unique_path)
+
+        self.queryset = queryset
+        self.rows = 0
+        self.durations = dict()
+
+    @property
+    def binary(self):
+        return self.writer_class.binary
+
+    def get_writer(self):
+        return self.writer_class(self.header, self.fields, self.csv_format, self.chunk_size, self.nullable)
+
+    def count(self, rows):
+        """
+        Count the rows while iterating them. The time to fetch the first row is
+        taken as duration of the query.
+        """
+        start = time.perf_counter()
+        rows = iter(rows)
+        first = next(rows, None)
+        self.durations['query'] = time.perf_counter() - start
+        if first is None:
+            return
+        self.rows += 1
+        yield first
+        for row in rows:
+            self.rows += 1
+            yield row
+
+    def get_rows(self):
+        """
+        Iterate the rows to export.
+        """
+        rows = ENGINES[self.engine](self.queryset, self.columns, self.chunk_size)
+        if self.unique:
+            rows = filter_unique(rows)
+        return self.count(rows)
+
+    def get_lines(self):
+        """
+        Iterate the lines of the data without header.
+        """
+        return self.get_writer().write_rows(self.get_rows())
+
+    def get_preview(self, limit):
+        """
+        Get the first rows of the export limited by the query. The values are
+        converted as for the csv-format.
+        """
+        rows = self.queryset.values_list(*self.columns)[:limit]
+        if self.unique:
+            rows = filter_unique(rows)
+        writer = get_writer('csv')(self.header, self.fields, self.csv_format, nullable=self.nullable)
+        return [list(row) for row in writer.get_plan().convert(rows)]
+
+    def check(self):
+        """
+        Write the header and the first row without keeping them to raise
+        errors of the format before the data is streamed.
+        """
+        writer = self.get_writer()
+        for chunk in writer.write_header():
+            pass
+        for chunk in writer.write_rows(self.queryset.values_list(*self.columns)[:1]):
+            pass
+
+    def get_pk_ranges(self):
+        """
+        Get the pk-ranges to export in parallel. Return None if the export
+        could not be done in parallel.
+        """
+        if self.workers > 1 and not self.unique_path and self.writer_class.lines:
+            pk_ranges = get_pk_ranges(self.queryset, self.workers * SHARDS_PER_WORKER)
+            if pk_ranges is None:
+                logger.debug('Queryset of %s could not be sharded by pk.', self.queryset.model._meta.label)
+            return pk_ranges
+
+    def __iter__(self):
+        """
+        Iterate the chunks of the data starting with the header. For the
+        csv-format and other line-based formats each chunk is a line.
+        """
+        writer = self.get_writer()
+        yield from writer.write_header()
+
+        pk_ranges = self.get_pk_ranges()
+        if pk_ranges is None:
+            yield from writer.write_rows(self.get_rows())
+        else:
+            yield from iterate_shards(self, pk_ranges, get_executor(self.workers), self.workers)
+
+        yield from writer.write_footer()
+
+        if self.checkpoint is not None:
+            self.checkpoint.advance()
+
+    async def acount(self, rows):
+        """
+        Count the rows of an asynchronous iterable like :meth:`count`.
+        """
+        start = time.perf_counter()
+        async for row in rows:
+            if 'query' not in self.durations:
+                self.durations['query'] = time.perf_counter() - start
+            self.rows += 1
+            yield row
+        self.durations.setdefault('query', time.perf_counter() - start)
+
+    def aget_rows(self):
+        """
+        Iterate the rows to export asynchronously.
+        """
+        rows = ASYNC_ENGINES[self.engine](self.queryset, self.columns, self.chunk_size)
+        if self.unique:
+            rows = afilter_unique(rows)
+        return self.acount(rows)
+
+    async def __aiter__(self):
+        """
+        Iterate the chunks of the data asynchronously. Rows are fetched using
+        the asynchronous iteration of the queryset and written in chunks of
+        chunk_size rows. Pk-ranges are not exported in parallel.
+        """
+        writer = self.get_writer()
+        for chunk in writer.write_header():
+            yield chunk
+
+        batch = list()
+        async for row in self.aget_rows():
+            batch.append(row)
+            if len(batch) >= self.chunk_size:
+                for chunk in writer.write_rows(batch):
+                    yield chunk
+                batch = list()
+        for chunk in writer.write_rows(batch):
+            yield chunk
+
+        for chunk in writer.write_footer():
+            yield chunk
+
+        if self.checkpoint is not None:
+            from asgiref.sync import sync_to_async
+            await sync_to_async(self.checkpoint.advance)()
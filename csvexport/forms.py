@@ -1,6 +1,7 @@
 # -*- coding: utf-8 -*-
 from django import forms
 from django.utils.translation import gettext_lazy as _
+from .compression import COMPRESSIONS
 
 
 class CheckboxSelectAll(forms.CheckboxSelectMultiple):
@@ -44,6 +45,46 @@ class UniqueForm(forms.Form):
     )
 
 
+class CompressionForm(forms.Form):
+    compression = forms.ChoiceField(
+        label=_('Compression'),
+        help_text=_("Compress the csv-data."),
+        required=False
+    )
+
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        choices = [('none', _('None'))]
+        choices += [(c.name, c.label) for c in COMPRESSIONS]
+        self.fields['compression'].choices = choices
+
+
+class IncrementalForm(forms.Form):
+    incremental = forms.BooleanField(
+        label=_('Only changed rows'),
+        help_text=_("Export only rows changed since the last export."),
+        required=False
+    )
+    checkpoint = forms.CharField(
+        label=_('Checkpoint'),
+        help_text=_("Name of a shared checkpoint to track the last export. "
+                    "Leave it empty to use your own checkpoint."),
+        max_length=255,
+        required=False
+    )
+
+
+class OutputFormatForm(forms.Form):
+    output_format = forms.ChoiceField(
+        label=_('Format'),
+        help_text=_("Format of the exported data."),
+    )
+
+    def __init__(self, *args, writers=(), **kwargs):
+        super().__init__(*args, **kwargs)
+        self.fields['output_format'].choices = [(w.name, w.label) for w in writers]
+
+
 class CSVFormatForm(forms.Form):
     delimiter = forms.CharField(
         label=_('Delimiter'),
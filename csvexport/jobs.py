@@ -0,0 +1,97 @@
+# -*- coding: utf-8 -*-
+import logging
+import tempfile
+from concurrent.futures import ThreadPoolExecutor
+from django.core.files import File
+from django.db import connections
+from django.utils import timezone
+from django.utils.module_loading import import_string
+from . import settings
+from .export import CSVExport
+from .models import ExportJob
+from .parallel import create_process_pool
+
+
+logger = logging.getLogger(__name__)
+
+_executor = None
+
+
+def get_executor():
+    """
+    Get the local pool to run export-jobs in as configured by
+    CSV_EXPORT_JOB_POOL and CSV_EXPORT_JOB_WORKERS.
+    """
+    global _executor
+    if _executor is None:
+        workers = settings.CSV_EXPORT_JOB_WORKERS
+        if settings.CSV_EXPORT_JOB_POOL == 'process':
+            _executor = create_process_pool(workers)
+        else:
+            _executor = ThreadPoolExecutor(workers, thread_name_prefix='csvexport')
+    return _executor
+
+
+def submit_job(job):
+    """
+    Pass an export-job to the runner configured by CSV_EXPORT_JOB_RUNNER.
+    """
+    runner = import_string(settings.CSV_EXPORT_JOB_RUNNER)
+    runner(job.pk)
+
+
+def run_in_pool(job_pk):
+    """
+    Job-runner using a local thread- or process-pool.
+    """
+    get_executor().submit(run_pooled_job, job_pk)
+
+
+def run_pooled_job(job_pk):
+    # Nobody waits for the result of the pool. So errors are logged here.
+    try:
+        run_job(job_pk)
+    except Exception:
+        logger.exception('Export-job %s could not be run.', job_pk)
+    finally:
+        connections.close_all()
+
+
+def run_job(job_pk):
+    """
+    Write the data of an export-job to its file.
+    """
+    job = ExportJob.objects.get(pk=job_pk)
+    job.status = ExportJob.RUNNING
+    job.started = timezone.now()
+    job.save(update_fields=['status', 'started'])
+
+    # The values are written in the timezone active when the job was created.
+    try:
+        with timezone.override(job.time_zone or None):
+            export = CSVExport(
+                job.get_queryset(),
+                job.get_header(),
+                job.get_csv_format(),
+                job.unique,
+                job.engine or None,
+                job.chunk_size,
+                job.workers,
+                job.output_format,
+                job.get_annotations(),
+                job.checkpoint)
+            with tempfile.TemporaryFile() as tmp:
+                for chunk in export:
+                    tmp.write(chunk if export.binary else chunk.encode('utf-8'))
+                tmp.seek(0)
+                filename = '{}.{}{}'.format(job.model.lower(), job.pk, export.writer_class.extension)
+                job.file.save(filename, File(tmp), save=False)
+    except Exception as exc:
+        logger.exception('Export-job %s failed.', job.pk)
+        job.status = ExportJob.FAILED
+        job.error = str(exc)
+    else:
+        job.status = ExportJob.FINISHED
+        job.rows = export.rows
+    job.finished = timezone.now()
+    job.save()
@@ -0,0 +1,146 @@
+# -*- coding: utf-8 -*-
+from django.apps import apps
+from django.contrib import admin
+from django.core.exceptions import FieldError
+from django.core.exceptions import ValidationError
+from django.core.management.base import BaseCommand
+from django.core.management.base import CommandError
+from ... import settings
+from ...export import CSVExport
+from ...models import ExportCheckpoint
+from ...utils import get_default_csv_format
+from ...utils import get_model_tree
+from ...writers import WRITERS
+
+
+class Command(BaseCommand):
+    help = 'Export items of a model as csv-formatted data.'
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            'model',
+            help='Model to export as app_label.ModelName.')
+        parser.add_argument(
+            '-f', '--fields',
+            help='Comma-separated fields to export. Use dots for fields of '
+                 'related models like model_b.field_a. By default all fields '
+                 'of the model itself are exported.')
+        parser.add_argument(
+            '--filter',
+            action='append',
+            default=list(),
+            metavar='LOOKUP=VALUE',
+            help='Filter the items to export. Could be used multiple times.')
+        parser.add_argument(
+            '-o', '--output',
+            help='File to write the data to. Default is stdout.')
+        parser.add_argument(
+            '--format',
+            choices=[w.name for w in WRITERS],
+            default='csv',
+            help='Format of the exported data. Default is csv.')
+        parser.add_argument(
+            '--checkpoint',
+            metavar='NAME',
+            help='Export only items changed since the last export using this '
+                 'named checkpoint. The model-admin must define a '
+                 'csvexport_incremental_field.')
+        parser.add_argument(
+            '-u', '--unique',
+            action='store_true',
+            help='Make the rows unique.')
+        parser.add_argument(
+            '--engine',
+            choices=['cursor', 'keyset'],
+            help='Engine to fetch the rows with.')
+        parser.add_argument(
+            '--chunk-size',
+            type=int,
+            help='Number of rows fetched at once.')
+        parser.add_argument(
+            '--workers',
+            type=int,
+            help='Number of processes to export pk-ranges in parallel.')
+
+    def get_model(self, label):
+        try:
+            return apps.get_model(label)
+        except (LookupError, ValueError) as exc:
+            raise CommandError(exc)
+
+    def get_modeladmin(self, model):
+        return admin.site._registry.get(model, object())
+
+    def get_header(self, model, fields):
+        """
+        Resolve the fields against the model-tree as build for the modeladmin
+        of the model. Permissions are not regarded.
+        """
+        modeladmin = self.get_modeladmin(model)
+        model_tree = get_model_tree(modeladmin, model)
+        choices = list()
+        for node in model_tree.iterate_nodes_with_choices_and_permission(ignore_permissions=True):
+            choices += [c[0] for c in node.choices]
+
+        if not fields:
+            return [f.name for f in model._meta.get_fields() if not f.is_relation and f.name in choices]
+
+        header = [f.strip() for f in fields.split(',') if f.strip()]
+        unknown = [f for f in header if f not in choices]
+        if unknown:
+            raise CommandError('Unknown fields: {}'.format(', '.join(unknown)))
+        return header
+
+    def get_queryset(self, model, filters):
+        queryset = model._default_manager.all()
+        lookups = dict()
+        for lookup in filters:
+            if '=' not in lookup:
+                raise CommandError('Invalid filter: {}'.format(lookup))
+            key, value = lookup.split('=', 1)
+            lookups[key] = value
+        try:
+            return queryset.filter(**lookups).order_by('pk')
+        except (FieldError, ValidationError, ValueError) as exc:
+            raise CommandError(exc)
+
+    def get_checkpoint(self, model, name):
+        field = getattr(self.get_modeladmin(model), 'csvexport_incremental_field', None)
+        if not field:
+            raise CommandError('No csvexport_incremental_field defined for {}.'.format(model._meta.label))
+        return ExportCheckpoint.objects.get_checkpoint(model, field, name=name)
+
+    def handle(self, *args, **options):
+        model = self.get_model(options['model'])
+        header = self.get_header(model, options['fields'])
+        queryset = self.get_queryset(model, options['filter'])
+        checkpoint = None
+        if options['checkpoint']:
+            checkpoint = self.get_checkpoint(model, options['checkpoint'])
+        export = CSVExport(
+            queryset,
+            header,
+            get_default_csv_format(),
+            unique=options['unique'],
+            engine=options['engine'] or settings.CSV_EXPORT_ENGINE,
+            chunk_size=options['chunk_size'] or settings.CSV_EXPORT_CHUNK_SIZE,
+            workers=options['workers'] or settings.CSV_EXPORT_WORKERS,
+            output_format=options['format'],
+            annotations=getattr(self.get_modeladmin(model), 'csvexport_annotations', dict()),
+            checkpoint=checkpoint,
+        )
+
+        if export.binary and not options['output']:
+            raise CommandError('The {} format could only be written to a file.'.format(options['format']))
+
+        if export.binary:
+            with open(options['output'], 'wb') as file:
+                for chunk in export:
+                    file.write(chunk)
+        elif options['output']:
+            with open(options['output'], 'w', encoding='utf-8', newline='') as file:
+                for line in export:
+                    file.write(line)
+        else:
+            for line in export:
+                self.stdout.write(line, ending='')
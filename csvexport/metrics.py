@@ -0,0 +1,189 @@
+# -*- coding: utf-8 -*-
+import time
+import socket
+import logging
+from contextlib import contextmanager
+from django.core.exceptions import EmptyResultSet
+from django.utils.module_loading import import_string
+from . import settings
+from .signals import export_finished
+from .signals import export_started
+
+
+logger = logging.getLogger(__name__)
+
+
+def get_sql(queryset):
+    try:
+        return str(queryset.query)
+    except EmptyResultSet:
+        return None
+
+
+class ExportMetrics:
+    """
+    Measure the phases of an export done by the admin-action and report them
+    by signals, a log-record and the hook configured by
+    CSV_EXPORT_METRICS_HOOK.
+
+    The phases are:
+
+    * tree: building the model-tree and the forms
+    * query: executing the query up to the first row
+    * rows: fetching and writing the rows
+    * response: assembling and sending the response
+    """
+    def __init__(self, request, model):
+        self.request = request
+        self.model = model
+        self.export = None
+        self.durations = dict()
+        self.bytes = 0
+        self.writing = 0
+        self.started = None
+        self.finished = False
+
+    @contextmanager
+    def measure(self, phase):
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.durations[phase] = self.durations.get(phase, 0) + time.perf_counter() - start
+
+    def start(self, export):
+        self.export = export
+        self.started = time.perf_counter()
+        export_started.send(sender=self.model, request=self.request, export=export)
+
+    def iterate(self, chunks):
+        """
+        Iterate the chunks of the export measuring the time spent on writing
+        them.
+        """
+        chunks = iter(chunks)
+        while True:
+            start = time.perf_counter()
+            try:
+                chunk = next(chunks)
+            except StopIteration:
+                break
+            finally:
+                self.writing += time.perf_counter() - start
+            yield chunk
+
+    def iterate_response(self, content):
+        """
+        Iterate the streamed content of a response counting its bytes. The
+        export is finished when the content is consumed.
+        """
+        error = None
+        try:
+            for chunk in content:
+                self.bytes += len(chunk)
+                yield chunk
+        except BaseException as exc:
+            error = exc
+            raise
+        finally:
+            self.finish(error)
+
+    async def aiterate(self, chunks):
+        """
+        Iterate the chunks of an asynchronous export like :meth:`iterate`.
+        """
+        chunks = chunks.__aiter__()
+        while True:
+            start = time.perf_counter()
+            try:
+                chunk = await chunks.__anext__()
+            except StopAsyncIteration:
+                break
+            finally:
+                self.writing += time.perf_counter() - start
+            yield chunk
+
+    async def aiterate_response(self, content):
+        """
+        Iterate the asynchronously streamed content of a response like
+        :meth:`iterate_response`. Finishing the export could hit the database
+        by receivers of the signal and is done synchronously.
+        """
+        from asgiref.sync import sync_to_async
+        error = None
+        try:
+            async for chunk in content:
+                self.bytes += len(chunk)
+                yield chunk
+        except BaseException as exc:
+            error = exc
+            raise
+        finally:
+            await sync_to_async(self.finish)(error)
+
+    def get_record(self, error=None):
+        return dict(
+            model=self.model._meta.label,
+            fields=self.export.field_paths,
+            sql=get_sql(self.export.queryset),
+            output_format=self.export.output_format,
+            unique=self.export.unique_path,
+            rows=self.export.rows,
+            bytes=self.bytes,
+            durations=self.durations,
+            error=(str(error) or type(error).__name__) if error is not None else None,
+        )
+
+    def finish(self, error=None):
+        if self.finished:
+            return
+        self.finished = True
+        total = time.perf_counter() - self.started
+        query = self.export.durations.get('query', 0)
+        self.durations['query'] = query
+        self.durations['rows'] = max(0, self.writing - query)
+        self.durations['response'] = max(0, total - self.writing)
+
+        record = self.get_record(error)
+        export_finished.send(
+            sender=self.model,
+            request=self.request,
+            export=self.export,
+            durations=self.durations,
+            rows=record['rows'],
+            bytes=record['bytes'],
+            error=error)
+
+        level = logging.INFO if error is None else logging.WARNING
+        logger.log(level, 'Export of %s %s: %s rows, %s bytes in %.3fs.',
+                   record['model'], 'finished' if error is None else 'failed',
+                   record['rows'], record['bytes'], sum(self.durations.values()),
+                   extra=dict(csvexport=record))
+
+        if settings.CSV_EXPORT_METRICS_HOOK:
+            try:
+                import_string(settings.CSV_EXPORT_METRICS_HOOK)(record)
+            except Exception:
+                logger.exception('Metrics-hook for the export of %s failed.', record['model'])
+
+
+def send_to_statsd(record):
+    """
+    Metrics-hook sending the metrics of an export as a single udp-packet to a
+    statsd-server as configured by CSV_EXPORT_STATSD_HOST,
+    CSV_EXPORT_STATSD_PORT and CSV_EXPORT_STATSD_PREFIX.
+    """
+    prefix = settings.CSV_EXPORT_STATSD_PREFIX
+    metrics = [
+        '{}.exports:1|c'.format(prefix),
+        '{}.rows:{}|c'.format(prefix, record['rows']),
+        '{}.bytes:{}|c'.format(prefix, record['bytes']),
+    ]
+    if record['error']:
+        metrics.append('{}.errors:1|c'.format(prefix))
+    for phase, seconds in record['durations'].items():
+        metrics.append('{}.{}:{:.3f}|ms'.format(prefix, phase, seconds * 1000))
+
+    address = (settings.CSV_EXPORT_STATSD_HOST, settings.CSV_EXPORT_STATSD_PORT)
+    with socket.socket(socket.AF_INET, socket.SOCK_DGRAM) as sock:
+        sock.sendto('\n'.join(metrics).encode('ascii'), address)
@@ -0,0 +1,66 @@
+# Generated by Django 5.2.18 on 2026-10-18 16:40
+
+import django.db.models.deletion
+from django.conf import settings
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    initial = True
+
+    dependencies = [
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='ExportCheckpoint',
+            fields=[
+                ('id', models.AutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('name', models.CharField(blank=True, max_length=255, verbose_name='Name')),
+                ('model', models.CharField(max_length=255, verbose_name='Model')),
+                ('field', models.CharField(max_length=255, verbose_name='Field')),
+                ('value', models.TextField(blank=True, verbose_name='Value')),
+                ('updated', models.DateTimeField(auto_now=True, verbose_name='Updated')),
+                ('user', models.ForeignKey(blank=True, null=True, on_delete=django.db.models.deletion.CASCADE, to=settings.AUTH_USER_MODEL, verbose_name='User')),
+            ],
+            options={
+                'verbose_name': 'Export-checkpoint',
+                'verbose_name_plural': 'Export-checkpoints',
+                'ordering': ['model', 'name'],
+            },
+        ),
+        migrations.CreateModel(
+            name='ExportJob',
+            fields=[
+                ('id', models.AutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('model', models.CharField(max_length=255, verbose_name='Model')),
+                ('admin_site', models.CharField(default='admin', max_length=255, verbose_name='Admin-site')),
+                ('filters', models.TextField(default='{}', verbose_name='Filters')),
+                ('pks', models.TextField(blank=True, null=True, verbose_name='Selected items')),
+                ('header', models.TextField(verbose_name='Fields')),
+                ('csv_format', models.TextField(verbose_name='CSV-Format')),
+                ('unique', models.BooleanField(default=False, verbose_name='Unique rows')),
+                ('engine', models.CharField(blank=True, max_length=32, verbose_name='Engine')),
+                ('chunk_size', models.PositiveIntegerField(blank=True, null=True, verbose_name='Chunk size')),
+                ('workers', models.PositiveIntegerField(default=1, verbose_name='Workers')),
+                ('output_format', models.CharField(default='csv', max_length=32, verbose_name='Format')),
+                ('time_zone', models.CharField(blank=True, max_length=64, verbose_name='Timezone')),
+                ('status', models.CharField(choices=[('pending', 'Pending'), ('running', 'Running'), ('finished', 'Finished'), ('failed', 'Failed')], default='pending', max_length=16, verbose_name='Status')),
+                ('rows', models.PositiveIntegerField(default=0, verbose_name='Rows')),
+                ('file', models.FileField(blank=True, upload_to='csvexport', verbose_name='File')),
+                ('error', models.TextField(blank=True, verbose_name='Error')),
+                ('created', models.DateTimeField(auto_now_add=True, verbose_name='Created')),
+                ('started', models.DateTimeField(blank=True, null=True, verbose_name='Started')),
+                ('finished', models.DateTimeField(blank=True, null=True, verbose_name='Finished')),
+                ('checkpoint', models.ForeignKey(blank=True, null=True, on_delete=django.db.models.deletion.SET_NULL, to='csvexport.exportcheckpoint', verbose_name='Checkpoint')),
+                ('user', models.ForeignKey(blank=True, null=True, on_delete=django.db.models.deletion.SET_NULL, to=settings.AUTH_USER_MODEL, verbose_name='User')),
+            ],
+            options={
+                'verbose_name': 'Export-job',
+                'verbose_name_plural': 'Export-jobs',
+                'ordering': ['-created'],
+            },
+        ),
+    ]
@@ -0,0 +1,235 @@
+# -*- coding: utf-8 -*-
+import json
+from django.apps import apps
+from django.conf import settings
+from django.contrib.auth.models import AnonymousUser
+from django.db import models
+from django.db.models import Max
+from django.http import HttpRequest
+from django.http import QueryDict
+from django.utils import timezone
+from django.utils.translation import gettext_lazy as _
+
+
+class ExportCheckpointManager(models.Manager):
+    def get_checkpoint(self, model, field, user=None, name=''):
+        """
+        Get the checkpoint of a model either for a user or by name. An unsaved
+        checkpoint is returned if there is none yet.
+        """
+        lookups = dict(model=model._meta.label, name=name or '')
+        if not name:
+            lookups['user'] = user
+        checkpoint = self.filter(**lookups).first()
+        if checkpoint is None:
+            checkpoint = self.model(**lookups)
+        if checkpoint.field != field:
+            # The checkpoint of another field is worthless.
+            checkpoint.field = field
+            checkpoint.value = ''
+        return checkpoint
+
+
+class ExportCheckpoint(models.Model):
+    """
+    The value of the incremental field up to which the items of a model were
+    exported. Checkpoints are kept per user or by name.
+    """
+    user = models.ForeignKey(
+        settings.AUTH_USER_MODEL,
+        on_delete=models.CASCADE,
+        null=True,
+        blank=True,
+        verbose_name=_('User'))
+    name = models.CharField(_('Name'), max_length=255, blank=True)
+    model = models.CharField(_('Model'), max_length=255)
+    field = models.CharField(_('Field'), max_length=255)
+    value = models.TextField(_('Value'), blank=True)
+    updated = models.DateTimeField(_('Updated'), auto_now=True)
+
+    objects = ExportCheckpointManager()
+
+    class Meta:
+        ordering = ['model', 'name']
+        verbose_name = _('Export-checkpoint')
+        verbose_name_plural = _('Export-checkpoints')
+
+    def __str__(self):
+        return '{} ({})'.format(self.model, self.name or self.user)
+
+    def get_model_field(self):
+        return apps.get_model(self.model)._meta.get_field(self.field)
+
+    def get_value(self):
+        if self.value:
+            return self.get_model_field().to_python(self.value)
+
+    def set_value(self, value):
+        self.value = value.isoformat() if hasattr(value, 'isoformat') else str(value)
+
+    def filter(self, queryset):
+        """
+        Filter the items changed since the checkpoint up to the latest change
+        at the time the export starts. The latest change is the next value of
+        the checkpoint.
+        """
+        value = self.get_value()
+        if value is not None:
+            queryset = queryset.filter(**{self.field + '__gt': value})
+        self.next_value = queryset.aggregate(value=Max(self.field))['value']
+        if self.next_value is not None:
+            queryset = queryset.filter(**{self.field + '__lte': self.next_value})
+        return queryset
+
+    def advance(self):
+        """
+        Advance the checkpoint to the latest change of the exported items.
+        """
+        if getattr(self, 'next_value', None) is not None:
+            self.set_value(self.next_value)
+            self.save()
+
+
+# Url-parameters of the changelist not regarded to rebuild its queryset.
+FILTER_PARAMS_IGNORED = ['p', 'e']
+
+
+class ExportJobManager(models.Manager):
+    def create_job(self, modeladmin, header, csv_format, unique=False, engine='', chunk_size=None, workers=1,
+                   output_format='csv', checkpoint=None, filters=None, pks=None, user=None):
+        """
+        Create an export-job for the items of a modeladmin's changelist. The
+        queryset is rebuilt from the modeladmin when the job is run.
+
+        :param dict filters: lists of the changelist's url-parameters
+        :param list pks: pks of the selected items or None to export all items
+                         of the changelist
+        """
+        filters = {k: list(v) for k, v in (filters or dict()).items() if k not in FILTER_PARAMS_IGNORED}
+        job = self.model(
+            user=user,
+            model=modeladmin.model._meta.label,
+            admin_site=modeladmin.admin_site.name,
+            filters=json.dumps(filters),
+            pks=json.dumps([str(pk) for pk in pks]) if pks is not None else None,
+            header=json.dumps(list(header)),
+            csv_format=json.dumps(csv_format),
+            unique=unique,
+            engine=engine or '',
+            chunk_size=chunk_size,
+            workers=workers or 1,
+            output_format=output_format or 'csv',
+            time_zone=timezone.get_current_timezone_name(),
+        )
+        if checkpoint is not None:
+            checkpoint.save()
+            job.checkpoint = checkpoint
+        job.save()
+        return job
+
+
+class ExportJob(models.Model):
+    """
+    An export running in background. The data is written to a file.
+    """
+    PENDING = 'pending'
+    RUNNING = 'running'
+    FINISHED = 'finished'
+    FAILED = 'failed'
+    STATUS_CHOICES = (
+        (PENDING, _('Pending')),
+        (RUNNING, _('Running')),
+        (FINISHED, _('Finished')),
+        (FAILED, _('Failed')),
+    )
+
+    user = models.ForeignKey(
+        settings.AUTH_USER_MODEL,
+        on_delete=models.SET_NULL,
+        null=True,
+        blank=True,
+        verbose_name=_('User'))
+    model = models.CharField(_('Model'), max_length=255)
+    admin_site = models.CharField(_('Admin-site'), max_length=255, default='admin')
+    filters = models.TextField(_('Filters'), default='{}')
+    pks = models.TextField(_('Selected items'), null=True, blank=True)
+    header = models.TextField(_('Fields'))
+    csv_format = models.TextField(_('CSV-Format'))
+    unique = models.BooleanField(_('Unique rows'), default=False)
+    engine = models.CharField(_('Engine'), max_length=32, blank=True)
+    chunk_size = models.PositiveIntegerField(_('Chunk size'), null=True, blank=True)
+    workers = models.PositiveIntegerField(_('Workers'), default=1)
+    output_format = models.CharField(_('Format'), max_length=32, default='csv')
+    time_zone = models.CharField(_('Timezone'), max_length=64, blank=True)
+    checkpoint = models.ForeignKey(
+        ExportCheckpoint,
+        on_delete=models.SET_NULL,
+        null=True,
+        blank=True,
+        verbose_name=_('Checkpoint'))
+    status = models.CharField(_('Status'), max_length=16, choices=STATUS_CHOICES, default=PENDING)
+    rows = models.PositiveIntegerField(_('Rows'), default=0)
+    file = models.FileField(_('File'), upload_to='csvexport', blank=True)
+    error = models.TextField(_('Error'), blank=True)
+    created = models.DateTimeField(_('Created'), auto_now_add=True)
+    started = models.DateTimeField(_('Started'), null=True, blank=True)
+    finished = models.DateTimeField(_('Finished'), null=True, blank=True)
+
+    objects = ExportJobManager()
+
+    class Meta:
+        ordering = ['-created']
+        verbose_name = _('Export-job')
+        verbose_name_plural = _('Export-jobs')
+
+    def __str__(self):
+        return '{} #{}'.format(self.model, self.pk)
+
+    @property
+    def is_done(self):
+        return self.status in [self.FINISHED, self.FAILED]
+
+    def get_header(self):
+        return json.loads(self.header)
+
+    def get_csv_format(self):
+        return json.loads(self.csv_format)
+
+    def get_modeladmin(self):
+        """
+        Get the modeladmin of the exported model from the admin-site the job
+        was started from.
+        """
+        from django.contrib.admin.sites import all_sites
+        model = apps.get_model(self.model)
+        for site in all_sites:
+            if site.name == self.admin_site and model in site._registry:
+                return site._registry[model]
+        raise LookupError('No modeladmin for {} on admin-site {}.'.format(self.model, self.admin_site))
+
+    def get_request(self):
+        """
+        Get a request of the job's user for the changelist with its filters.
+        """
+        request = HttpRequest()
+        request.method = 'GET'
+        request.GET = QueryDict(mutable=True)
+        for key, values in json.loads(self.filters).items():
+            request.GET.setlist(key, values)
+        request.user = self.user or AnonymousUser()
+        return request
+
+    def get_annotations(self):
+        return dict(getattr(self.get_modeladmin(), 'csvexport_annotations', dict()))
+
+    def get_queryset(self):
+        """
+        Rebuild the queryset of the items to export as the changelist of the
+        modeladmin does with the job's filters and selected items.
+        """
+        modeladmin = self.get_modeladmin()
+        request = self.get_request()
+        queryset = modeladmin.get_changelist_instance(request).get_queryset(request)
+        if self.pks is not None:
+            queryset = queryset.filter(pk__in=json.loads(self.pks))
+        return queryset
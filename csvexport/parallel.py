@@ -0,0 +1,143 @@
+# -*- coding: utf-8 -*-
+import os
+import pickle
+import tempfile
+import threading
+import multiprocessing
+from collections import deque
+from concurrent.futures import ProcessPoolExecutor
+from django.apps import apps
+from django.db import models
+from django.db.models import Max
+from django.db.models import Min
+from django.utils import timezone
+from . import settings
+from .engines import get_keyset_ordering
+from .utils import read_blocks
+
+
+# Number of shards per worker. Using more shards than workers balances the load
+# of sparse pk-ranges.
+SHARDS_PER_WORKER = 4
+
+_executor = None
+_executor_lock = threading.Lock()
+
+
+def setup_worker():
+    """
+    Initialize django within a spawned worker-process.
+    """
+    import django
+    django.setup()
+
+
+def create_process_pool(workers):
+    """
+    Create a pool of spawned processes with django set up.
+    """
+    context = multiprocessing.get_context('spawn')
+    return ProcessPoolExecutor(workers, mp_context=context, initializer=setup_worker)
+
+
+def get_executor(workers):
+    """
+    Get the process-pool to export the shards with. The pool is started once
+    and shared by all parallel exports of the process. So the number of
+    processes is bounded no matter how many exports run at the same time. Its
+    size is the number of workers configured by CSV_EXPORT_WORKERS or of the
+    first parallel export if this is larger.
+    """
+    global _executor
+    with _executor_lock:
+        if _executor is None:
+            _executor = create_process_pool(max(workers, settings.CSV_EXPORT_WORKERS))
+    return _executor
+
+
+def get_pk_ranges(queryset, shards):
+    """
+    Split the queryset into pk-ranges of equal size following the order of the
+    queryset. Return None if the queryset could not be sharded by pk.
+    """
+    ordering = get_keyset_ordering(queryset)
+    pk = queryset.model._meta.pk
+    if ordering is None or not isinstance(pk, (models.AutoField, models.IntegerField)):
+        return None
+
+    bounds = queryset.order_by().aggregate(min=Min('pk'), max=Max('pk'))
+    if bounds['min'] is None:
+        return list()
+
+    size = (bounds['max'] - bounds['min']) // shards + 1
+    ranges = list()
+    for start in range(bounds['min'], bounds['max'] + 1, size):
+        ranges.append((start, min(start + size - 1, bounds['max'])))
+    if ordering == '-pk':
+        ranges.reverse()
+    return ranges
+
+
+def export_shard(model_label, query, params, pk_range, timezone_name):
+    """
+    Write the data of a pk-range without header to a temporary file. Return
+    the path of the file and the number of written rows. This runs in the
+    worker-process within the timezone active for the export.
+    """
+    from .export import CSVExport
+    with timezone.override(timezone_name):
+        model = apps.get_model(model_label)
+        queryset = model._default_manager.all()
+        queryset.query = pickle.loads(query)
+        queryset = queryset.filter(pk__gte=pk_range[0], pk__lte=pk_range[1])
+        export = CSVExport(queryset, **params)
+
+        fd, path = tempfile.mkstemp(prefix='csvexport-', suffix='.csv')
+        with os.fdopen(fd, 'w', encoding='utf-8', newline='') as file:
+            for line in export.get_lines():
+                file.write(line)
+    return path, export.rows
+
+
+def read_shard(path):
+    try:
+        with open(path, encoding='utf-8', newline='') as file:
+            yield from read_blocks(file)
+    finally:
+        os.remove(path)
+
+
+def iterate_shards(export, pk_ranges, executor, workers):
+    """
+    Export the pk-ranges in parallel and iterate the data of the shards in
+    order. Only a limited number of shards is exported ahead.
+    """
+    query = pickle.dumps(export.queryset.query)
+    model_label = export.queryset.model._meta.label
+    params = dict(
+        header=export.header,
+        csv_format=export.csv_format,
+        engine=export.engine,
+        chunk_size=export.chunk_size,
+        output_format=export.output_format,
+        annotations=export.annotations,
+    )
+    timezone_name = timezone.get_current_timezone_name()
+    ranges = deque(pk_ranges)
+    futures = deque()
+    ahead = workers * 2
+    try:
+        while ranges or futures:
+            while ranges and len(futures) < ahead:
+                futures.append(executor.submit(
+                    export_shard, model_label, query, params, ranges.popleft(), timezone_name))
+            path, rows = futures.popleft().result()
+            export.rows += rows
+            yield from read_shard(path)
+    finally:
+        for future in futures:
+            if not future.cancel():
+                try:
+                    os.remove(future.result()[0])
+                except Exception:
+                    pass
@@ -0,0 +1,113 @@
+# -*- coding: utf-8 -*-
+from django.conf import settings as django_settings
+from django.utils import timezone
+from . import settings
+
+
+# Field-types whose values could be empty strings.
+STRING_FIELD_TYPES = [
+    'CharField', 'TextField', 'EmailField', 'SlugField', 'URLField', 'FilePathField',
+    'GenericIPAddressField', 'IPAddressField',
+]
+
+
+def get_db_field(field):
+    """
+    Get the field holding the values of a relation-field.
+    """
+    while field is not None and field.is_relation:
+        field = field.target_field
+    return field
+
+
+def get_internal_type(field):
+    field = get_db_field(field)
+    return field.get_internal_type() if field is not None else None
+
+
+def skip_none(converter):
+    """
+    Let a converter pass None through.
+    """
+    def convert(value):
+        return None if value is None else converter(value)
+    return convert
+
+
+def with_empty_value(converter, empty_value):
+    """
+    Let a converter replace None and empty strings by the empty value.
+    """
+    if converter is None:
+        def convert(value):
+            return empty_value if value is None or value == '' else value
+    else:
+        def convert(value):
+            return empty_value if value is None or value == '' else converter(value)
+    return convert
+
+
+def to_bytes(value):
+    return bytes(value) if isinstance(value, memoryview) else value
+
+
+def to_localtime(value):
+    return timezone.localtime(value) if timezone.is_aware(value) else value
+
+
+def get_choices_converter(field):
+    choices = dict(get_db_field(field).flatchoices)
+
+    def convert(value):
+        return choices.get(value, value)
+    return convert
+
+
+def get_csv_converter(field, nullable):
+    """
+    Get the converter for the values of a field written to csv. Return None if
+    the values could be written as they are.
+    """
+    internal_type = get_internal_type(field)
+    converter = None
+    if settings.CSV_EXPORT_CHOICES_DISPLAY and get_db_field(field).choices:
+        converter = get_choices_converter(field)
+    elif internal_type == 'DateTimeField' and django_settings.USE_TZ:
+        converter = skip_none(to_localtime)
+    elif internal_type == 'BinaryField':
+        converter = to_bytes
+
+    # The csv-writer writes None as empty string. So empty values only need to
+    # be replaced if another empty value is configured.
+    empty_value = settings.CSV_EXPORT_EMPTY_VALUE
+    if empty_value != '' and (nullable or internal_type in STRING_FIELD_TYPES):
+        converter = with_empty_value(converter, empty_value)
+    return converter
+
+
+class ExportPlan:
+    """
+    Converters for the columns of an export compiled once before the rows are
+    written. Columns without converter are passed through untouched.
+
+    :param list converters: a converter or None for each column
+    """
+    def __init__(self, converters):
+        self.converters = [(i, c) for i, c in enumerate(converters) if c is not None]
+
+    def __bool__(self):
+        return bool(self.converters)
+
+    def convert(self, rows):
+        """
+        Iterate the rows with converted values.
+        """
+        if not self.converters:
+            yield from rows
+            return
+        converters = self.converters
+        for row in rows:
+            row = list(row)
+            for index, converter in converters:
+                row[index] = converter(row[index])
+            yield row
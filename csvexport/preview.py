@@ -0,0 +1,42 @@
+# -*- coding: utf-8 -*-
+import json
+import logging
+from django.core.exceptions import EmptyResultSet
+from django.db import DatabaseError
+from django.db import connections
+
+
+logger = logging.getLogger(__name__)
+
+
+def estimate_count(queryset):
+    """
+    Get the number of rows of a queryset as estimated by the query-planner
+    without counting them. Return None if the database backend does not
+    provide an estimate.
+    """
+    vendor = connections[queryset.db].vendor
+    if vendor != 'postgresql':
+        return None
+    try:
+        return get_plan_rows(json.loads(queryset.explain(format='json')))
+    except (DatabaseError, EmptyResultSet, ValueError, TypeError, KeyError, IndexError):
+        logger.debug('Could not estimate the rows of %s.', queryset.model._meta.label, exc_info=True)
+        return None
+
+
+def get_plan_rows(plan):
+    """
+    Get the estimated rows of the top-level node of a json-formatted plan of
+    postgresql. The plan is a list holding one object with the Plan-node or
+    the object itself. Return None for any other structure.
+    """
+    if isinstance(plan, list):
+        plan = plan[0] if plan else None
+    if not isinstance(plan, dict):
+        return None
+    node = plan.get('Plan')
+    if not isinstance(node, dict):
+        return None
+    rows = node.get('Plan Rows')
+    return int(rows) if isinstance(rows, (int, float)) else None
@@ -0,0 +1,113 @@
+# -*- coding: utf-8 -*-
+from bisect import bisect_left
+from collections import defaultdict
+from functools import lru_cache
+from .utils import build_model_tree
+from .utils import get_model_tree_params
+from .utils import get_view_permissions
+
+
+# Number of results returned by default.
+SEARCH_LIMIT = 20
+
+
+def get_trigrams(value):
+    return {value[i:i + 3] for i in range(len(value) - 2)}
+
+
+class FieldPathIndex:
+    """
+    Search-index of the exportable field-paths of a model-tree. Field-paths are
+    found by prefix using a sorted list and by substring using trigrams.
+
+    :param list entries: tuples of the dotted field-path, the name of the
+                         form-field it belongs to and the model of the node
+    """
+    def __init__(self, entries):
+        self.entries = sorted(entries, key=lambda e: e[0].lower())
+        self.keys = [e[0].lower() for e in self.entries]
+        self.trigrams = defaultdict(set)
+        for position, key in enumerate(self.keys):
+            for trigram in get_trigrams(key):
+                self.trigrams[trigram].add(position)
+
+    def __len__(self):
+        return len(self.entries)
+
+    def iterate_prefix(self, query):
+        position = bisect_left(self.keys, query)
+        while position < len(self.keys) and self.keys[position].startswith(query):
+            yield position
+            position += 1
+
+    def iterate_substring(self, query):
+        trigrams = get_trigrams(query)
+        if trigrams:
+            positions = set.intersection(*[self.trigrams.get(t, set()) for t in trigrams])
+            positions = sorted(positions)
+        else:
+            positions = range(len(self.keys))
+        for position in positions:
+            if query in self.keys[position]:
+                yield position
+
+    def search(self, query, filter=None, limit=SEARCH_LIMIT):
+        """
+        Search the entries by a query. Entries starting with the query come
+        first followed by those containing it.
+
+        :param str query: part of a dotted field-path
+        :param callable filter: callable taking an entry and returning a boolean
+        :param int limit: max number of entries to return
+        :return list: entries found
+        """
+        query = query.strip().lower()
+        if not query:
+            return list()
+        results = list()
+        found = set()
+        for positions in (self.iterate_prefix(query), self.iterate_substring(query)):
+            for position in positions:
+                if position in found:
+                    continue
+                found.add(position)
+                entry = self.entries[position]
+                if filter is None or filter(entry):
+                    results.append(entry)
+                    if len(results) >= limit:
+                        return results
+        return results
+
+
+@lru_cache(maxsize=None)
+def build_field_path_index(*params):
+    model_tree = build_model_tree(*params)
+    entries = list()
+    for node in model_tree.iterate_nodes_with_choices_and_permission(ignore_permissions=True):
+        entries += [(choice, node.field_name, node.model) for choice, label in node.choices]
+    return FieldPathIndex(entries)
+
+
+def get_field_path_index(modeladmin, model=None):
+    """
+    Get the search-index of the field-paths of the model-tree of a modeladmin.
+    Indexes are build once for each configuration and cached like the
+    model-trees.
+    """
+    return build_field_path_index(*get_model_tree_params(modeladmin, model))
+
+
+def search_field_paths(modeladmin, request, query, limit=SEARCH_LIMIT):
+    """
+    Search the field-paths of a modeladmin the user has view-permission for.
+    """
+    permissions = get_view_permissions(request)
+    index = get_field_path_index(modeladmin)
+    return index.search(query, lambda e: permissions.has_view_permission(e[2]), limit)
+
+
+def clear_field_path_index_cache(**kwargs):
+    """
+    Clear the cached search-indexes. Connected to signals changing the models.
+    """
+    build_field_path_index.cache_clear()
@@ -12,5 +12,40 @@ CSV_EXPORT_QUOTING = getattr(settings, 'CSV_EXPORT_QUOTING', 'QUOTE_ALL')
 
 CSV_EXPORT_FORMAT_FORM = getattr(settings, 'CSV_EXPORT_FORMAT_FORM', True)
 CSV_EXPORT_UNIQUE_FORM = getattr(settings, 'CSV_EXPORT_UNIQUE_FORM', False)
+CSV_EXPORT_UNIQUE_BACKEND = getattr(settings, 'CSV_EXPORT_UNIQUE_BACKEND', 'memory')
+CSV_EXPORT_UNIQUE_CAPACITY = getattr(settings, 'CSV_EXPORT_UNIQUE_CAPACITY', 10000000)
+CSV_EXPORT_UNIQUE_ERROR_RATE = getattr(settings, 'CSV_EXPORT_UNIQUE_ERROR_RATE', 0.0001)
+CSV_EXPORT_UNIQUE_MEMORY_LIMIT = getattr(settings, 'CSV_EXPORT_UNIQUE_MEMORY_LIMIT', 1000000)
+CSV_EXPORT_UNIQUE_TEMP_DIR = getattr(settings, 'CSV_EXPORT_UNIQUE_TEMP_DIR', None)
+CSV_EXPORT_COMPRESSION = getattr(settings, 'CSV_EXPORT_COMPRESSION', 'none')
+CSV_EXPORT_COMPRESSION_FORM = getattr(settings, 'CSV_EXPORT_COMPRESSION_FORM', False)
+CSV_EXPORT_FORMATS = getattr(settings, 'CSV_EXPORT_FORMATS', ['csv'])
+CSV_EXPORT_CHOICES_DISPLAY = getattr(settings, 'CSV_EXPORT_CHOICES_DISPLAY', False)
 CSV_EXPORT_EMPTY_VALUE = getattr(settings, 'CSV_EXPORT_EMPTY_VALUE', '')
 CSV_EXPORT_REFERENCE_DEPTH = getattr(settings, 'CSV_EXPORT_REFERENCE_DEPTH', 3)
+CSV_EXPORT_LAZY_TREE = getattr(settings, 'CSV_EXPORT_LAZY_TREE', False)
+CSV_EXPORT_FIELD_SEARCH = getattr(settings, 'CSV_EXPORT_FIELD_SEARCH', False)
+CSV_EXPORT_TO_MANY = getattr(settings, 'CSV_EXPORT_TO_MANY', False)
+CSV_EXPORT_TO_MANY_SEPARATOR = getattr(settings, 'CSV_EXPORT_TO_MANY_SEPARATOR', ', ')
+CSV_EXPORT_STREAMING = getattr(settings, 'CSV_EXPORT_STREAMING', False)
+CSV_EXPORT_ASYNC = getattr(settings, 'CSV_EXPORT_ASYNC', False)
+CSV_EXPORT_PREVIEW_ROWS = getattr(settings, 'CSV_EXPORT_PREVIEW_ROWS', None)
+CSV_EXPORT_CHUNK_SIZE = getattr(settings, 'CSV_EXPORT_CHUNK_SIZE', 2000)
+CSV_EXPORT_ENGINE = getattr(settings, 'CSV_EXPORT_ENGINE', 'cursor')
+CSV_EXPORT_WORKERS = getattr(settings, 'CSV_EXPORT_WORKERS', 1)
+
+CSV_EXPORT_CACHE = getattr(settings, 'CSV_EXPORT_CACHE', False)
+CSV_EXPORT_CACHE_ALIAS = getattr(settings, 'CSV_EXPORT_CACHE_ALIAS', 'default')
+CSV_EXPORT_CACHE_TIMEOUT = getattr(settings, 'CSV_EXPORT_CACHE_TIMEOUT', 300)
+CSV_EXPORT_CACHE_MAX_SIZE = getattr(settings, 'CSV_EXPORT_CACHE_MAX_SIZE', 10 * 1024 * 1024)
+CSV_EXPORT_CACHE_INVALIDATE = getattr(settings, 'CSV_EXPORT_CACHE_INVALIDATE', list())
+
+CSV_EXPORT_BACKGROUND = getattr(settings, 'CSV_EXPORT_BACKGROUND', False)
+CSV_EXPORT_JOB_RUNNER = getattr(settings, 'CSV_EXPORT_JOB_RUNNER', 'csvexport.jobs.run_in_pool')
+CSV_EXPORT_JOB_POOL = getattr(settings, 'CSV_EXPORT_JOB_POOL', 'thread')
+CSV_EXPORT_JOB_WORKERS = getattr(settings, 'CSV_EXPORT_JOB_WORKERS', 2)
+
+CSV_EXPORT_METRICS_HOOK = getattr(settings, 'CSV_EXPORT_METRICS_HOOK', None)
+CSV_EXPORT_STATSD_HOST = getattr(settings, 'CSV_EXPORT_STATSD_HOST', 'localhost')
+CSV_EXPORT_STATSD_PORT = getattr(settings, 'CSV_EXPORT_STATSD_PORT', 8125)
+CSV_EXPORT_STATSD_PREFIX = getattr(settings, 'CSV_EXPORT_STATSD_PREFIX', 'csvexport')
@@ -0,0 +1,12 @@
+# -*- coding: utf-8 -*-
+from django.dispatch import Signal
+
+
+# Sent by the admin-action before the data of an export is written. Arguments
+# are the request and the export.
+export_started = Signal()
+
+# Sent by the admin-action after the data of an export was written. Arguments
+# are the request, the export, the durations of the phases in seconds, the
+# number of rows and bytes and the error if the export failed.
+export_finished = Signal()
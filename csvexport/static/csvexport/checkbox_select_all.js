@@ -1,6 +1,6 @@
 $(document).ready(function () {
-    inputs = $('input[id$="_select_all"]');
-    inputs.change(function() {
+    // Delegated to also handle the fields of nodes loaded on demand.
+    $(document).on('change', 'input[id$="_select_all"]', function() {
         options = $('#' + this.id.slice(0,-11)).find('input');
         if (this.checked) {
             options.each(function(){$(this).prop('checked', true);})
@@ -0,0 +1,45 @@
+$(document).ready(function () {
+    // Autocomplete field-paths and check them within the fields-form. Fields of
+    // nodes that are not rendered are added as checked checkboxes. Field-paths
+    // are searched by the url of the modeladmin if there is one. Otherwise they
+    // are searched by the admin-action like the export itself.
+    var search = $('#csvexport-search');
+    var form = search.closest('form');
+    var results = $('#csvexport-search-results');
+    var selected = $('#csvexport-search-selected');
+    var timeout = null;
+
+    function select(result) {
+        var input = $('input[name="' + result.field_name + '"]').filter(function () {
+            return this.value === result.value;
+        });
+        if (!input.length) {
+            input = $('<input type="checkbox">').attr('name', result.field_name).val(result.value);
+            $('<li>').append($('<label>').append(input, ' ', document.createTextNode(result.value))).appendTo(selected);
+        }
+        input.prop('checked', true);
+    }
+
+    $('#csvexport-search-input').on('input', function () {
+        var query = this.value;
+        window.clearTimeout(timeout);
+        timeout = window.setTimeout(function () {
+            var params = form.find(
+                'input[name="csrfmiddlewaretoken"], input[name="action"], ' +
+                'input[name="_selected_action"], input[name="select_across"]'
+            ).serializeArray();
+            params.push({name: 'csvexport_search', value: query});
+            $.post(search.data('url') || window.location.href, $.param(params), function (data) {
+                results.empty();
+                $.each(data.results, function (index, result) {
+                    var link = $('<a href="#">').text(result.value);
+                    link.on('click', function (event) {
+                        event.preventDefault();
+                        select(result);
+                    });
+                    $('<li>').append(link).appendTo(results);
+                });
+            }, 'json');
+        }, 200);
+    });
+});
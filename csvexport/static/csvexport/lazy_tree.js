@@ -0,0 +1,39 @@
+$(document).ready(function () {
+    // Load the fields and relations of a node of the model-tree on demand. The
+    // node is requested from the url of the modeladmin if there is one.
+    // Otherwise it is requested from the admin-action like the export itself.
+    var tree = $('#csvexport-tree');
+    var form = tree.closest('form');
+
+    function getNode(fieldPath, callback) {
+        var params = form.find(
+            'input[name="csrfmiddlewaretoken"], input[name="action"], ' +
+            'input[name="_selected_action"], input[name="select_across"]'
+        ).serializeArray();
+        params.push({name: 'csvexport_tree', value: fieldPath});
+        $.post(tree.data('url') || window.location.href, $.param(params), callback, 'json');
+    }
+
+    tree.on('click', 'a.csvexport-expand', function (event) {
+        event.preventDefault();
+        var link = $(this);
+        if (link.data('loaded')) {
+            return;
+        }
+        link.data('loaded', true);
+        getNode(link.attr('data-node'), function (node) {
+            if (node.html && !$('[name="' + node.field_name + '"]').length) {
+                $('#csvexport-fields').append(node.html);
+            }
+            if (node.children.length) {
+                var list = $('<ul>');
+                $.each(node.children, function (index, child) {
+                    var childLink = $('<a href="#" class="csvexport-expand">').text(child.label);
+                    childLink.attr('data-node', child.field_path);
+                    $('<li>').append(childLink).appendTo(list);
+                });
+                link.after(list);
+            }
+        });
+    });
+});
@@ -0,0 +1,182 @@
+# -*- coding: utf-8 -*-
+import os
+import math
+import sqlite3
+import hashlib
+import tempfile
+from . import settings
+
+
+def get_digest(data):
+    """
+    Get a 16 byte digest of a row.
+    """
+    if isinstance(data, str):
+        data = data.encode('utf-8', 'surrogatepass')
+    return hashlib.blake2b(data, digest_size=16).digest()
+
+
+class DigestSet:
+    """
+    Exact row-filter keeping the digests of all rows in memory.
+    """
+    def __init__(self):
+        self.digests = set()
+
+    def add(self, data):
+        """
+        Add a row to the filter. Return True if the row is new.
+        """
+        digest = get_digest(data)
+        if digest in self.digests:
+            return False
+        self.digests.add(digest)
+        return True
+
+    def close(self):
+        self.digests.clear()
+
+
+class BloomFilter:
+    """
+    Probabilistic row-filter with a fixed memory footprint. The capacity is the
+    number of unique rows the filter is designed for. Up to this number a row
+    is wrongly regarded as duplicate with a probability of error_rate.
+    """
+    def __init__(self, capacity, error_rate):
+        self.size = max(8, int(-capacity * math.log(error_rate) / math.log(2) ** 2))
+        self.hashes = max(1, round(self.size / capacity * math.log(2)))
+        self.bits = bytearray((self.size + 7) // 8)
+
+    def add(self, data):
+        """
+        Add a row to the filter. Return True if the row is new.
+        """
+        digest = get_digest(data)
+        h1 = int.from_bytes(digest[:8], 'little')
+        h2 = int.from_bytes(digest[8:], 'little') | 1
+        new = False
+        for i in range(self.hashes):
+            index, bit = divmod((h1 + i * h2) % self.size, 8)
+            mask = 1 << bit
+            if not self.bits[index] & mask:
+                self.bits[index] |= mask
+                new = True
+        return new
+
+    def close(self):
+        self.bits = bytearray()
+
+
+class PartitionedDigestSet:
+    """
+    Exact row-filter with bounded memory. Digests are distributed over hash
+    partitions. A partition exceeding its share of the memory limit is spilled
+    into a sqlite database within a temporary directory.
+    """
+    def __init__(self, memory_limit, partitions=16, directory=None):
+        self.limit = max(1, memory_limit // partitions)
+        self.directory = directory
+        self.tempdir = None
+        self.partitions = [set() for _ in range(partitions)]
+        self.databases = [None] * partitions
+
+    def add(self, data):
+        """
+        Add a row to the filter. Return True if the row is new.
+        """
+        digest = get_digest(data)
+        index = digest[0] % len(self.partitions)
+        partition = self.partitions[index]
+        if digest in partition:
+            return False
+        database = self.databases[index]
+        if database is not None:
+            query = 'SELECT 1 FROM digests WHERE digest = ?'
+            if database.execute(query, (digest,)).fetchone():
+                return False
+        partition.add(digest)
+        if len(partition) >= self.limit:
+            self.spill(index)
+        return True
+
+    def spill(self, index):
+        """
+        Move the digests of a partition from memory into its database.
+        """
+        if self.tempdir is None:
+            self.tempdir = tempfile.TemporaryDirectory(prefix='csvexport-', dir=self.directory)
+        if self.databases[index] is None:
+            path = os.path.join(self.tempdir.name, '{}.sqlite3'.format(index))
+            database = sqlite3.connect(path, check_same_thread=False)
+            database.execute('PRAGMA journal_mode = OFF')
+            database.execute('PRAGMA synchronous = OFF')
+            database.execute('CREATE TABLE digests (digest BLOB PRIMARY KEY) WITHOUT ROWID')
+            self.databases[index] = database
+        database = self.databases[index]
+        database.executemany('INSERT INTO digests VALUES (?)', ((d,) for d in self.partitions[index]))
+        database.commit()
+        self.partitions[index].clear()
+
+    def close(self):
+        for database in self.databases:
+            if database is not None:
+                database.close()
+        self.databases = [None] * len(self.partitions)
+        for partition in self.partitions:
+            partition.clear()
+        if self.tempdir is not None:
+            self.tempdir.cleanup()
+            self.tempdir = None
+
+
+def get_row_filter():
+    """
+    Get a row-filter as configured by CSV_EXPORT_UNIQUE_BACKEND.
+    """
+    backend = settings.CSV_EXPORT_UNIQUE_BACKEND
+    if backend == 'memory':
+        return DigestSet()
+    elif backend == 'bloom':
+        return BloomFilter(
+            settings.CSV_EXPORT_UNIQUE_CAPACITY,
+            settings.CSV_EXPORT_UNIQUE_ERROR_RATE)
+    elif backend == 'disk':
+        return PartitionedDigestSet(
+            settings.CSV_EXPORT_UNIQUE_MEMORY_LIMIT,
+            directory=settings.CSV_EXPORT_UNIQUE_TEMP_DIR)
+    else:
+        raise ValueError('Unknown unique-backend: {}'.format(backend))
+
+
+def get_row_key(row):
+    """
+    Get a representation of a database row to compare rows by.
+    """
+    return repr(tuple(bytes(v) if isinstance(v, memoryview) else v for v in row))
+
+
+def filter_unique(rows):
+    """
+    Iterate the rows skipping duplicates.
+    """
+    row_filter = get_row_filter()
+    try:
+        for row in rows:
+            if row_filter.add(get_row_key(row)):
+                yield row
+    finally:
+        row_filter.close()
+
+
+async def afilter_unique(rows):
+    """
+    Iterate the rows of an asynchronous iterable skipping duplicates.
+    """
+    row_filter = get_row_filter()
+    try:
+        async for row in rows:
+            if row_filter.add(get_row_key(row)):
+                yield row
+    finally:
+        row_filter.close()
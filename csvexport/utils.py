@@ -1,32 +1,246 @@
+import csv
+import codecs
+import warnings
+from functools import lru_cache
 from modeltree import ModelTree
+from django.core.exceptions import FieldDoesNotExist
+from django.db import connections
 from django.utils.translation import gettext_lazy as _
 from django import forms
 from . import settings
 from .forms import CheckboxSelectAll
+from .unique import get_row_filter
+
+
+# Size of the blocks read from files.
+BLOCK_SIZE = 64 * 1024
+
+# Field-types whose values could not be compared by the database backend and
+# therefore not be used with SELECT DISTINCT.
+NON_DISTINCT_FIELD_TYPES = {
+    None: ['BinaryField'],
+    'oracle': ['BinaryField', 'TextField', 'JSONField'],
+}
+
+
+def get_csv_format(delimiter, escapechar, quotechar, doublequote, quoting, lineterminator):
+    """
+    Get the format-parameters for the csv-writer. Quoting is the name of one
+    of the quoting-constants of the csv-module and the lineterminator could
+    contain escape-sequences.
+    """
+    return dict(
+        delimiter=delimiter,
+        escapechar=escapechar or None,
+        quotechar=quotechar or None,
+        doublequote=doublequote,
+        quoting=getattr(csv, quoting),
+        lineterminator=codecs.decode(lineterminator, 'unicode_escape'),
+    )
+
+
+def get_default_csv_format():
+    """
+    Get the format-parameters for the csv-writer as configured by settings.
+    """
+    return get_csv_format(
+        settings.CSV_EXPORT_DELIMITER,
+        settings.CSV_EXPORT_ESCAPECHAR,
+        settings.CSV_EXPORT_QUOTECHAR,
+        settings.CSV_EXPORT_DOUBLEQUOTE,
+        settings.CSV_EXPORT_QUOTING,
+        settings.CSV_EXPORT_LINETERMINATOR,
+    )
+
+
+def read_blocks(file, length=None):
+    """
+    Iterate the data of a file in blocks starting at its current position.
+    Stop after length bytes or characters if given.
+    """
+    remaining = length
+    while remaining is None or remaining > 0:
+        block = file.read(BLOCK_SIZE if remaining is None else min(BLOCK_SIZE, remaining))
+        if not block:
+            break
+        if remaining is not None:
+            remaining -= len(block)
+        yield block
+
+
+def get_field_paths(header):
+    """
+    Get the field-paths for a values-query from the dotted csv-header.
+    """
+    return [f.replace('.', '__') for f in header]
+
+
+def get_related_paths(field_paths):
+    """
+    Get the paths of the relations to join for the given field-paths.
+    """
+    return ['__'.join(f.split('__')[:-1]) for f in field_paths if '__' in f]
+
+
+def get_model_field(model, field_path):
+    """
+    Get the model-field referenced by a field-path like model_a__field_a.
+    """
+    *relations, field_name = field_path.split('__')
+    for relation in relations:
+        model = model._meta.get_field(relation).related_model
+    return model._meta.get_field(field_name)
+
+
+def get_relation_paths(model, field_path=None):
+    """
+    Get the field-paths of the relations of the model a node of the model-tree
+    with the given field-path refers to.
+    """
+    if field_path:
+        model = get_model_field(model, field_path).related_model
+        prefix = field_path + '__'
+    else:
+        prefix = ''
+    return [prefix + f.name for f in model._meta.get_fields() if f.is_relation]
+
+
+def is_relation_path(model, field_path, max_depth=None):
+    """
+    Check if a field-path only consists of relations starting from the model
+    and does not exceed max_depth relations.
+    """
+    names = field_path.split('__')
+    if not field_path or (max_depth is not None and len(names) > max_depth):
+        return False
+    for name in names:
+        try:
+            field = model._meta.get_field(name)
+        except FieldDoesNotExist:
+            return False
+        if not field.is_relation or field.related_model is None:
+            return False
+        model = field.related_model
+    return True
+
+
+def is_nullable(model, field_path):
+    """
+    Check if the values of a field-path could be NULL because the field itself
+    or a relation on the way is nullable.
+    """
+    *relations, field_name = field_path.split('__')
+    for relation in relations:
+        field = model._meta.get_field(relation)
+        if field.null:
+            return True
+        model = field.related_model
+    return model._meta.get_field(field_name).null
+
+
+def allows_distinct(queryset, field_paths):
+    """
+    Check if the values of the given field-paths could be made distinct by the
+    database.
+    """
+    vendor = connections[queryset.db].vendor
+    field_types = NON_DISTINCT_FIELD_TYPES.get(vendor, NON_DISTINCT_FIELD_TYPES[None])
+    fields = [get_model_field(queryset.model, p) for p in field_paths]
+    return not any(f.get_internal_type() in field_types for f in fields)
+
+
+def get_distinct_ordering(queryset, field_paths):
+    """
+    Get the leading part of the queryset's ordering that only refers to the
+    given field-paths. Other fields would be added to the select-clause and
+    break the distinct. So the rows are only ordered by this part.
+    """
+    if queryset.query.order_by:
+        ordering = queryset.query.order_by
+    elif queryset.query.default_ordering:
+        ordering = queryset.model._meta.ordering
+    else:
+        ordering = list()
+
+    pk_name = queryset.model._meta.pk.name
+    distinct_ordering = list()
+    for field in ordering:
+        if not isinstance(field, str):
+            break
+        name = field.lstrip('-')
+        if name not in field_paths and not (name == 'pk' and pk_name in field_paths):
+            break
+        distinct_ordering.append(field)
+    return distinct_ordering
 
 
 class CSVData:
     """
     Simple replacement for the filelike-object passed to the csv-writer.
+
+    Deprecated: The data is written by the writers of
+    :mod:`csvexport.writers`.
     """
     def __init__(self, unique=False):
+        warnings.warn('CSVData is deprecated. Use the writers of csvexport.writers instead.',
+                      DeprecationWarning, stacklevel=2)
         self.data = list()
         self.unique = unique
+        self.rows = get_row_filter() if unique else None
 
     def write(self, data):
-        if not self.unique or data not in self.data:
+        if not self.unique or self.rows.add(data):
             self.data.append(data)
 
+    def close(self):
+        if self.rows is not None:
+            self.rows.close()
+
     def __str__(self):
         return ''.join(self.data)
 
 
+class ViewPermissions:
+    """
+    View-permissions of a user for models. All permissions of the user are
+    loaded at once and the results are memoized per model.
+    """
+    def __init__(self, user):
+        self.user = user
+        self.is_superuser = user.is_active and user.is_superuser
+        if self.is_superuser or not user.is_active:
+            self.perms = set()
+        else:
+            self.perms = set(user.get_all_permissions())
+        self.models = dict()
+
+    def has_view_permission(self, model):
+        if model not in self.models:
+            perm = f'{model._meta.app_label}.view_{model._meta.model_name}'
+            self.models[model] = self.is_superuser or perm in self.perms
+        return self.models[model]
+
+
+def get_view_permissions(request):
+    """
+    Get the view-permissions of the request's user. They are resolved once per
+    request.
+    """
+    permissions = getattr(request, '_csvexport_view_permissions', None)
+    if not isinstance(permissions, ViewPermissions) or permissions.user is not request.user:
+        permissions = ViewPermissions(request.user)
+        request._csvexport_view_permissions = permissions
+    return permissions
+
+
 class BaseModelTree(ModelTree):
     """
     A node per model to map their relations and access their fields.
     """
+    request = None
     export_fields = list()
     selected_fields = list()
+    annotations = list()
 
     FOLLOW_ACROSS_APPS = True
 
@@ -35,6 +249,11 @@ class BaseModelTree(ModelTree):
         'many_to_one',
     ]
 
+    TO_MANY_RELATION_TYPES = [
+        'one_to_many',
+        'many_to_many',
+    ]
+
     def __init__(self, *args, **kwargs):
         super().__init__(*args, **kwargs)
         self.choices = list()
@@ -49,27 +268,52 @@ class BaseModelTree(ModelTree):
     def field_label(self):
         return str(self)
 
+    @property
+    def is_to_many(self):
+        """
+        Check if the path of the node crosses a to-many relation.
+        """
+        return any(getattr(n.field, t) for n in self.path[1:] for t in self.TO_MANY_RELATION_TYPES)
+
     @property
     def user_has_view_permission(self):
-        perm = f'{self.model._meta.app_label}.view_{self.model._meta.model_name}'
-        return self.request.user.has_perm(perm)
+        """
+        Deprecated: Use :meth:`has_view_permission` with the request instead.
+        """
+        return self.has_view_permission(self.request)
+
+    def has_view_permission(self, request):
+        """
+        Check if the user of the request has view-permission for the model of
+        the node. Without a request permission is denied.
+        """
+        if request is None:
+            return False
+        return get_view_permissions(request).has_view_permission(self.model)
 
     def build_choices(self):
         """
-        Get choice-tuples for a given model.
+        Get choice-tuples for a given model. The root-node also offers the
+        labels of the annotations.
         """
         path = '.'.join(n.field.name for n in self.path[1:])
         fields = [f for f in self.model._meta.get_fields() if not f.is_relation]
-        for field in fields:
-            choice = '{}.{}'.format(path, field.name).lstrip('.')
+        choices = [('{}.{}'.format(path, f.name).lstrip('.'), f.name) for f in fields]
+        if self.is_root:
+            choices += [(label, label) for label in self.annotations]
+        for choice, label in choices:
             if not self.export_fields or choice in self.export_fields:
-                self.choices.append((choice, field.name))
+                self.choices.append((choice, label))
                 if self.selected_fields and choice in self.selected_fields:
                     self.initial.append(choice)
 
     def get_form_field(self):
         if self.choices:
-            help_text = _('Which fields do you want to export?')
+            if self.is_to_many:
+                help_text = _('Which fields do you want to export? The values of all '
+                              'related items are joined into one field.')
+            else:
+                help_text = _('Which fields do you want to export?')
             return forms.MultipleChoiceField(
                 label=self.field_label,
                 help_text=help_text,
@@ -78,16 +322,113 @@ class BaseModelTree(ModelTree):
                 initial=self.initial,
                 required=False)
 
-    def iterate_nodes_with_choices_and_permission(self):
-        filter_func = lambda node: node.choices and node.user_has_view_permission
+    def iterate_nodes_with_choices_and_permission(self, request=None, ignore_permissions=False):
+        """
+        Iterate the nodes with choices the user of the request has
+        view-permission for. The request defaults to the one of a tree-class
+        build by :func:`model_tree_factory`. Nodes are only iterated regardless
+        of any permissions if ignore_permissions is set explicitly.
+        """
+        request = request or self.request
+        if ignore_permissions:
+            filter_func = lambda node: bool(node.choices)
+        elif type(self).user_has_view_permission is not BaseModelTree.user_has_view_permission:
+            warnings.warn('Overriding user_has_view_permission is deprecated. Override '
+                          'has_view_permission instead.', DeprecationWarning, stacklevel=2)
+            filter_func = lambda node: node.choices and node.user_has_view_permission
+        else:
+            filter_func = lambda node: node.choices and node.has_view_permission(request)
         return super().iterate(by_level=True, filter=filter_func)
 
 
-def model_tree_factory(modeladmin, request):
+def get_relation_types(to_many):
+    """
+    Get the relation-types to follow building the model-tree.
+    """
+    if to_many:
+        return BaseModelTree.RELATION_TYPES + BaseModelTree.TO_MANY_RELATION_TYPES
+    return BaseModelTree.RELATION_TYPES
+
+
+def model_tree_factory(modeladmin, request=None):
+    """
+    Build a tree-class for a modeladmin bound to a request.
+
+    Deprecated: Use :func:`get_model_tree` to get the cached model-tree and
+    pass the request to
+    :meth:`~BaseModelTree.iterate_nodes_with_choices_and_permission`.
+    """
+    warnings.warn('model_tree_factory is deprecated. Use get_model_tree instead.',
+                  DeprecationWarning, stacklevel=2)
+    to_many = getattr(modeladmin, 'csvexport_to_many', settings.CSV_EXPORT_TO_MANY)
     params = dict(
-        request = request,
+        request=request,
         export_fields=getattr(modeladmin, 'csvexport_export_fields', list()),
         selected_fields=getattr(modeladmin, 'csvexport_selected_fields', list()),
+        annotations=list(getattr(modeladmin, 'csvexport_annotations', dict())),
         MAX_DEPTH=getattr(modeladmin, 'csvexport_reference_depth', settings.CSV_EXPORT_REFERENCE_DEPTH),
+        RELATION_TYPES=get_relation_types(to_many),
     )
     return type('ExportModelTree', (BaseModelTree,), params)
+
+
+@lru_cache(maxsize=None)
+def build_model_tree(model, export_fields, selected_fields, max_depth, to_many=False, annotations=(),
+                     field_paths=None):
+    params = dict(
+        export_fields=list(export_fields),
+        selected_fields=list(selected_fields),
+        annotations=list(annotations),
+        MAX_DEPTH=max_depth,
+        RELATION_TYPES=get_relation_types(to_many),
+        FIELD_PATHS=list(field_paths) if field_paths is not None else None,
+    )
+    tree_class = type('ExportModelTree', (BaseModelTree,), params)
+    return tree_class(model)
+
+
+# Partial trees depend on the field-paths requested by the users. So only a
+# limited number of them is cached.
+build_partial_model_tree = lru_cache(maxsize=256)(build_model_tree.__wrapped__)
+
+
+def get_model_tree_params(modeladmin, model=None):
+    return (
+        model or modeladmin.model,
+        tuple(getattr(modeladmin, 'csvexport_export_fields', list())),
+        tuple(getattr(modeladmin, 'csvexport_selected_fields', list())),
+        getattr(modeladmin, 'csvexport_reference_depth', settings.CSV_EXPORT_REFERENCE_DEPTH),
+        getattr(modeladmin, 'csvexport_to_many', settings.CSV_EXPORT_TO_MANY),
+        tuple(getattr(modeladmin, 'csvexport_annotations', dict())),
+    )
+
+
+def get_model_tree(modeladmin, model=None):
+    """
+    Get the model-tree for a modeladmin. Trees are build once for each
+    configuration and cached. Since the tree is shared between requests it is
+    not bound to any request. Pass the request to
+    :meth:`~BaseModelTree.iterate_nodes_with_choices_and_permission` to regard
+    the user's permissions.
+    """
+    return build_model_tree(*get_model_tree_params(modeladmin, model))
+
+
+def get_partial_model_tree(modeladmin, field_paths, model=None):
+    """
+    Get a model-tree that is only build along the given field-paths of its
+    nodes. Other branches are left out. Field-paths not found in the complete
+    model-tree are ignored.
+    """
+    # An empty list of field-paths would build the complete tree. The empty
+    # path matches no relation and only leaves the root-node.
+    field_paths = tuple(sorted(set(field_paths))) or ('',)
+    return build_partial_model_tree(*get_model_tree_params(modeladmin, model), field_paths)
+
+
+def clear_model_tree_cache(**kwargs):
+    """
+    Clear the cached model-trees. Connected to signals changing the models.
+    """
+    build_model_tree.cache_clear()
+    build_partial_model_tree.cache_clear()
@@ -0,0 +1,65 @@
+# -*- coding: utf-8 -*-
+from django import forms
+from django.core.exceptions import FieldDoesNotExist
+from django.http import Http404
+from django.http import JsonResponse
+from .search import search_field_paths
+from .utils import get_partial_model_tree
+from .utils import get_relation_paths
+
+
+# Post-parameters the export-form uses to request these views. Requests are
+# posted to the urls of the CSVExportAdminMixin or otherwise to the changelist
+# and dispatched by the admin-action. So they pass the permission-checks of
+# the modeladmin of the exported model.
+TREE_PARAM = 'csvexport_tree'
+SEARCH_PARAM = 'csvexport_search'
+
+
+def tree_view(modeladmin, request):
+    """
+    A node of the model-tree of a modeladmin as json. The node is given by
+    its field-path. Used to load the fields of related models on demand.
+    """
+    field_path = request.POST.get(TREE_PARAM, '')
+    try:
+        field_paths = [field_path] + get_relation_paths(modeladmin.model, field_path)
+    except (FieldDoesNotExist, AttributeError):
+        raise Http404
+    model_tree = get_partial_model_tree(modeladmin, field_paths)
+    node = model_tree.get(field_path) if field_path else model_tree
+    if node is None:
+        raise Http404
+
+    html = ''
+    choices = list()
+    if node.choices and node.has_view_permission(request):
+        choices = node.choices
+        form = forms.Form()
+        form.fields[node.field_name] = node.get_form_field()
+        html = str(form)
+
+    children = [dict(
+        field_name=child.field_name,
+        field_path=child.field_path,
+        label=child.field_label,
+    ) for child in node.children]
+
+    return JsonResponse(dict(
+        field_name=node.field_name,
+        label=node.field_label,
+        choices=choices,
+        initial=node.initial,
+        html=html,
+        children=children,
+    ))
+
+
+def search_view(modeladmin, request):
+    """
+    Search the exportable field-paths of a modeladmin. Used to autocomplete
+    field-paths in the export form.
+    """
+    results = search_field_paths(modeladmin, request, request.POST.get(SEARCH_PARAM, ''))
+    return JsonResponse(dict(results=[
+        dict(value=value, field_name=field_name) for value, field_name, model in results]))
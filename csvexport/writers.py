@@ -0,0 +1,350 @@
+# -*- coding: utf-8 -*-
+import csv
+import base64
+import datetime
+import tempfile
+from django.conf import settings as django_settings
+from django.core.serializers.json import DjangoJSONEncoder
+from django.utils import timezone
+from django.utils.translation import gettext_lazy as _
+from . import settings
+from .plan import ExportPlan
+from .plan import STRING_FIELD_TYPES
+from .plan import get_choices_converter
+from .plan import get_csv_converter
+from .plan import get_db_field
+from .plan import get_internal_type
+from .plan import skip_none
+from .utils import read_blocks
+
+try:
+    import openpyxl
+    from openpyxl.cell.cell import ILLEGAL_CHARACTERS_RE
+except ImportError:
+    openpyxl = None
+
+try:
+    import pyarrow
+    import pyarrow.parquet
+except ImportError:
+    pyarrow = None
+
+
+class Writer:
+    """
+    Write the rows of an export in a specific format. Writers yield chunks of
+    str or of bytes if binary is True. Writers whose data consists of a line
+    per row could write the rows in independent parts.
+
+    Values are converted column-wise by the converters returned by
+    get_converter before they are written.
+
+    :param list header: dotted field-paths of the exported columns
+    :param list fields: model-fields of the exported columns
+    :param dict csv_format: format-parameters for the csv-writer
+    :param int chunk_size: number of rows written at once
+    :param list nullable: whether the values of a column could be None
+    """
+    name = None
+    label = None
+    extension = None
+    content_type = None
+    binary = False
+    lines = False
+
+    def __init__(self, header, fields, csv_format=None, chunk_size=None, nullable=None):
+        self.header = list(header)
+        self.fields = list(fields)
+        self.csv_format = csv_format or dict()
+        self.chunk_size = chunk_size or settings.CSV_EXPORT_CHUNK_SIZE
+        self.nullable = list(nullable) if nullable is not None else [True] * len(self.fields)
+
+    def get_converter(self, field, nullable):
+        """
+        Get the converter for the values of a column. Return None if the values
+        are written as they are.
+        """
+        if settings.CSV_EXPORT_CHOICES_DISPLAY and get_db_field(field).choices:
+            return get_choices_converter(field)
+
+    def get_plan(self):
+        converters = [self.get_converter(f, n) for f, n in zip(self.fields, self.nullable)]
+        return ExportPlan(converters)
+
+    def write_header(self):
+        """
+        Iterate the chunks written before the rows.
+        """
+        return iter(())
+
+    def write_rows(self, rows):
+        """
+        Iterate the chunks of the written rows.
+        """
+        raise NotImplementedError
+
+    def write_footer(self):
+        """
+        Iterate the chunks written after the rows.
+        """
+        return iter(())
+
+
+class Echo:
+    """
+    Filelike-object for the csv-writer returning the written data instead of
+    storing it.
+    """
+    def write(self, data):
+        return data
+
+
+class CSVWriter(Writer):
+    name = 'csv'
+    label = _('CSV')
+    extension = '.csv'
+    content_type = 'text/csv'
+    lines = True
+
+    def get_converter(self, field, nullable):
+        return get_csv_converter(field, nullable)
+
+    def write_header(self):
+        writer = csv.writer(Echo(), **self.csv_format)
+        yield writer.writerow(tuple(self.header))
+
+    def write_rows(self, rows):
+        writer = csv.writer(Echo(), **self.csv_format)
+        for row in self.get_plan().convert(rows):
+            yield writer.writerow(row)
+
+
+class JSONEncoder(DjangoJSONEncoder):
+    """
+    Encode binary data base64 in addition to the types of the
+    DjangoJSONEncoder.
+    """
+    def default(self, o):
+        if isinstance(o, (bytes, memoryview)):
+            return base64.b64encode(o).decode('ascii')
+        return super().default(o)
+
+
+class JSONLinesWriter(Writer):
+    name = 'jsonl'
+    label = _('JSON Lines')
+    extension = '.jsonl'
+    content_type = 'application/x-ndjson'
+    lines = True
+
+    def write_rows(self, rows):
+        encoder = JSONEncoder(ensure_ascii=False)
+        for row in self.get_plan().convert(rows):
+            yield encoder.encode(dict(zip(self.header, row))) + '\n'
+
+
+class XLSXWriter(Writer):
+    """
+    Write the rows into a workbook in write-only mode. The workbook could only
+    be read when completed. So all data is written after the rows.
+    """
+    name = 'xlsx'
+    label = _('Excel (xlsx)')
+    extension = '.xlsx'
+    content_type = 'application/vnd.openxmlformats-officedocument.spreadsheetml.sheet'
+    binary = True
+
+    # Field-types whose values could be written as they are.
+    NATIVE_FIELD_TYPES = [
+        'AutoField', 'BigAutoField', 'SmallAutoField', 'IntegerField', 'BigIntegerField',
+        'SmallIntegerField', 'PositiveIntegerField', 'PositiveSmallIntegerField',
+        'PositiveBigIntegerField', 'BooleanField', 'NullBooleanField', 'FloatField',
+        'DecimalField', 'DateField', 'TimeField', 'DurationField',
+    ]
+
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        self.workbook = openpyxl.Workbook(write_only=True)
+        self.worksheet = self.workbook.create_sheet()
+
+    def get_value(self, value):
+        if value is None or isinstance(value, (bool, int, float)):
+            return value
+        elif isinstance(value, str):
+            return ILLEGAL_CHARACTERS_RE.sub('', value)
+        elif isinstance(value, datetime.datetime):
+            if timezone.is_aware(value):
+                value = timezone.make_naive(value)
+            return value
+        elif isinstance(value, (datetime.date, datetime.time, datetime.timedelta)):
+            return value
+        else:
+            return str(value)
+
+    def get_converter(self, field, nullable):
+        internal_type = get_internal_type(field)
+        if settings.CSV_EXPORT_CHOICES_DISPLAY and get_db_field(field).choices:
+            choices = get_choices_converter(field)
+            return lambda v: self.get_value(choices(v))
+        elif internal_type in self.NATIVE_FIELD_TYPES:
+            return None
+        elif internal_type in STRING_FIELD_TYPES:
+            return skip_none(lambda v: ILLEGAL_CHARACTERS_RE.sub('', v))
+        else:
+            return self.get_value
+
+    def write_header(self):
+        self.worksheet.append(self.header)
+        return iter(())
+
+    def write_rows(self, rows):
+        for row in self.get_plan().convert(rows):
+            self.worksheet.append(row)
+        return iter(())
+
+    def write_footer(self):
+        with tempfile.TemporaryFile() as file:
+            self.workbook.save(file)
+            file.seek(0)
+            yield from read_blocks(file)
+
+
+class ChunkBuffer:
+    """
+    Write-only filelike-object collecting the data written by pyarrow until it
+    is taken.
+    """
+    closed = False
+
+    def __init__(self):
+        self.chunks = list()
+        self.position = 0
+
+    def write(self, data):
+        data = bytes(data)
+        self.chunks.append(data)
+        self.position += len(data)
+        return len(data)
+
+    def tell(self):
+        return self.position
+
+    def flush(self):
+        pass
+
+    def close(self):
+        self.closed = True
+
+    def take(self):
+        data = b''.join(self.chunks)
+        self.chunks = list()
+        return data
+
+
+class ParquetWriter(Writer):
+    """
+    Write the rows as parquet-file. Each chunk of rows is written as row-group.
+    The schema is derived from the model-fields.
+    """
+    name = 'parquet'
+    label = _('Parquet')
+    extension = '.parquet'
+    content_type = 'application/vnd.apache.parquet'
+    binary = True
+
+    INTEGER_FIELDS = [
+        'AutoField', 'BigAutoField', 'SmallAutoField', 'IntegerField', 'BigIntegerField',
+        'SmallIntegerField', 'PositiveIntegerField', 'PositiveSmallIntegerField',
+        'PositiveBigIntegerField',
+    ]
+
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        self.schema = pyarrow.schema([
+            (name, self.get_type(field)) for name, field in zip(self.header, self.fields)])
+        self.buffer = ChunkBuffer()
+        self.writer = None
+
+    def get_type(self, field):
+        """
+        Get the arrow-type of a model-field. Values of fields without a
+        matching type are written as strings.
+        """
+        field = get_db_field(field)
+        internal_type = get_internal_type(field)
+        if internal_type in self.INTEGER_FIELDS:
+            return pyarrow.int64()
+        elif internal_type in ['BooleanField', 'NullBooleanField']:
+            return pyarrow.bool_()
+        elif internal_type == 'FloatField':
+            return pyarrow.float64()
+        elif internal_type == 'DecimalField' and field.max_digits and field.max_digits <= 38:
+            return pyarrow.decimal128(field.max_digits, field.decimal_places)
+        elif internal_type == 'DateField':
+            return pyarrow.date32()
+        elif internal_type == 'DateTimeField':
+            return pyarrow.timestamp('us', tz='UTC' if django_settings.USE_TZ else None)
+        elif internal_type == 'TimeField':
+            return pyarrow.time64('us')
+        elif internal_type == 'DurationField':
+            return pyarrow.duration('us')
+        elif internal_type == 'BinaryField':
+            return pyarrow.binary()
+        else:
+            return pyarrow.string()
+
+    def get_column(self, values, arrow_type):
+        if arrow_type == pyarrow.string():
+            values = [v if v is None or isinstance(v, str) else str(v) for v in values]
+        elif arrow_type == pyarrow.binary():
+            values = [bytes(v) if isinstance(v, memoryview) else v for v in values]
+        return pyarrow.array(values, type=arrow_type)
+
+    def write_batch(self, rows):
+        columns = zip(*rows) if rows else [[] for _ in self.header]
+        arrays = [self.get_column(list(c), t) for c, t in zip(columns, self.schema.types)]
+        table = pyarrow.Table.from_arrays(arrays, schema=self.schema)
+        self.writer.write_table(table)
+        return self.buffer.take()
+
+    def write_header(self):
+        self.writer = pyarrow.parquet.ParquetWriter(self.buffer, self.schema)
+        yield self.buffer.take()
+
+    def write_rows(self, rows):
+        batch = list()
+        for row in rows:
+            batch.append(row)
+            if len(batch) >= self.chunk_size:
+                yield self.write_batch(batch)
+                batch = list()
+        if batch:
+            yield self.write_batch(batch)
+
+    def write_footer(self):
+        self.writer.close()
+        yield self.buffer.take()
+
+
+WRITERS = [CSVWriter, JSONLinesWriter]
+if openpyxl is not None:
+    WRITERS.append(XLSXWriter)
+if pyarrow is not None:
+    WRITERS.append(ParquetWriter)
+
+
+def get_writer(name):
+    """
+    Get an available writer-class by name.
+    """
+    for writer in WRITERS:
+        if writer.name == name:
+            return writer
+    raise ValueError('Unknown or unavailable format: {}'.format(name))
+
+
+def get_writers(names):
+    """
+    Get the available writer-classes for the given names.
+    """
+    return [w for w in WRITERS if w.name in names]
@@ -2,6 +2,7 @@
 
 from django.contrib import admin
 from csvexport.actions import csvexport
+from csvexport.admin import CSVExportAdminMixin
 
 from .models import ModelA
 from .models import ModelB
@@ -10,7 +11,7 @@ from .models import ModelD
 
 
 @admin.register(ModelA)
-class ModelAAdmin(admin.ModelAdmin):
+class ModelAAdmin(CSVExportAdminMixin, admin.ModelAdmin):
     actions = [csvexport]
 
 
@@ -0,0 +1,167 @@
+# -*- coding: utf-8 -*-
+"""
+Benchmark of the csvexport admin-action using a synthetic dataset.
+"""
+import time
+import platform
+import tracemalloc
+from contextlib import contextmanager
+from datetime import timedelta
+
+import django
+from django.contrib import admin
+from django.contrib.auth.models import User
+from django.db import connection
+from django.test import Client
+from django.urls import reverse
+
+from csvexport import settings
+from csvexport.utils import get_model_tree
+from .models import ModelA, ModelB, ModelC, ModelD
+
+try:
+    import resource
+except ImportError:
+    resource = None
+
+
+BATCH_SIZE = 5000
+
+
+def create_benchmark_data(count, distinct=None, batch_size=BATCH_SIZE):
+    """
+    Create count graphs of ModelA to ModelD items using bulk_create. The
+    char-fields hold distinct values of a limited number to benchmark unique
+    exports. Items get explicit pks to not depend on the database returning
+    them from bulk_create.
+    """
+    distinct = distinct or max(1, count // 10)
+    start = max([m.objects.order_by('-pk').values_list('pk', flat=True).first() or 0
+                 for m in (ModelA, ModelB, ModelC, ModelD)]) + 1
+
+    for offset in range(start, start + count, batch_size):
+        pks = range(offset, min(offset + batch_size, start + count))
+        items = dict(a=list(), b=list(), c=list(), d=list())
+        for pk in pks:
+            values = dict(
+                char_field='char {}'.format(pk % distinct),
+                integer_field=pk % distinct,
+                duration_field=timedelta(seconds=pk % distinct),
+            )
+            items['d'].append(ModelD(pk=pk, **values))
+            items['c'].append(ModelC(pk=pk, model_d_id=pk, **values))
+            items['b'].append(ModelB(pk=pk, model_c_id=pk, **values))
+            items['a'].append(ModelA(pk=pk, model_b_id=pk, model_c_id=pk, **values))
+        for model, key in [(ModelD, 'd'), (ModelC, 'c'), (ModelB, 'b'), (ModelA, 'a')]:
+            model.objects.bulk_create(items[key], batch_size=batch_size)
+
+
+def get_fields(depth):
+    """
+    Get the post-data selecting all fields of the model-tree of ModelA up to
+    the given depth.
+    """
+    modeladmin = admin.site._registry[ModelA]
+    fields = dict()
+    for node in get_model_tree(modeladmin).iterate_nodes_with_choices_and_permission(ignore_permissions=True):
+        if node.depth <= depth:
+            fields[node.field_name] = [c[0] for c in node.choices]
+    return fields
+
+
+@contextmanager
+def alter_settings(**kwargs):
+    origin = {k: getattr(settings, k) for k in kwargs}
+    for key, value in kwargs.items():
+        setattr(settings, key, value)
+    try:
+        yield
+    finally:
+        for key, value in origin.items():
+            setattr(settings, key, value)
+
+
+def get_max_rss():
+    """
+    Get the peak resident set size of the process in bytes.
+    """
+    if resource is None:
+        return None
+    max_rss = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    return max_rss if platform.system() == 'Darwin' else max_rss * 1024
+
+
+def export(client, post_data):
+    """
+    Run the export and measure the time to the first byte and the total time.
+    """
+    url = reverse('admin:testapp_modela_changelist')
+    start = time.perf_counter()
+    response = client.post(url, post_data)
+    content = iter(response.streaming_content)
+    chunk = next(content, b'')
+    ttfb = time.perf_counter() - start
+    size, lines = len(chunk), chunk.count(b'\n')
+    for chunk in content:
+        size += len(chunk)
+        lines += chunk.count(b'\n')
+    return dict(seconds=time.perf_counter() - start, ttfb=ttfb, rows=max(0, lines - 1), bytes=size)
+
+
+def run_benchmark(depth, unique, repeat=1, memory=True):
+    """
+    Export all items of ModelA through the admin-action with the fields up to
+    the given depth and return the measured values.
+    """
+    client = Client()
+    client.force_login(User.objects.filter(is_superuser=True).first())
+    fields = get_fields(depth)
+    post_data = dict(
+        action='csvexport',
+        csvexport='csvexport',
+        csvexport_download='Download',
+        select_across='1',
+        index='0',
+        _selected_action=[ModelA.objects.values_list('pk', flat=True).first()],
+        delimiter=settings.CSV_EXPORT_DELIMITER,
+        escapechar=settings.CSV_EXPORT_ESCAPECHAR,
+        lineterminator=settings.CSV_EXPORT_LINETERMINATOR,
+        quotechar=settings.CSV_EXPORT_QUOTECHAR,
+        doublequote=settings.CSV_EXPORT_DOUBLEQUOTE,
+        quoting=settings.CSV_EXPORT_QUOTING,
+        **fields)
+    if unique:
+        post_data['unique'] = 'on'
+
+    with alter_settings(CSV_EXPORT_STREAMING=True, CSV_EXPORT_UNIQUE_FORM=True):
+        runs = [export(client, post_data) for _ in range(repeat)]
+        result = min(runs, key=lambda r: r['seconds'])
+
+        # Tracing allocations slows down the export. So memory is measured by
+        # a separate run.
+        if memory:
+            tracemalloc.start()
+            try:
+                export(client, post_data)
+                result['tracemalloc_peak'] = tracemalloc.get_traced_memory()[1]
+            finally:
+                tracemalloc.stop()
+            result['max_rss'] = get_max_rss()
+
+    result.update(
+        depth=depth,
+        unique=unique,
+        fields=sum(len(f) for f in fields.values()),
+        rows_per_second=round(result['rows'] / result['seconds']) if result['seconds'] else None,
+    )
+    return result
+
+
+def get_meta(count):
+    return dict(
+        items=count,
+        database=connection.vendor,
+        django=django.get_version(),
+        python=platform.python_version(),
+        timestamp=time.strftime('%Y-%m-%dT%H:%M:%S'),
+    )
@@ -0,0 +1,72 @@
+# -*- coding: utf-8 -*-
+import json
+
+from django.contrib.auth.models import User
+from django.core.management.base import BaseCommand
+from django.db import connection
+from django.test.utils import setup_test_environment
+from django.test.utils import teardown_test_environment
+
+from ...benchmark import create_benchmark_data
+from ...benchmark import get_meta
+from ...benchmark import run_benchmark
+
+
+class Command(BaseCommand):
+    help = 'Benchmark the csvexport admin-action within a test-database.'
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '-n', '--items',
+            type=int,
+            default=10000,
+            help='Number of items per model. Default is 10000.')
+        parser.add_argument(
+            '--depths',
+            default='0,1,2,3',
+            help='Comma-separated depths of the model-tree to export the '
+                 'fields of. Default is 0,1,2,3.')
+        parser.add_argument(
+            '--repeat',
+            type=int,
+            default=1,
+            help='Number of runs per scenario. The fastest one is recorded.')
+        parser.add_argument(
+            '--no-memory',
+            action='store_true',
+            help='Skip measuring the memory usage.')
+        parser.add_argument(
+            '--label',
+            help='Label to tag the results with, like a commit-hash.')
+        parser.add_argument(
+            '-o', '--output',
+            help='File to write the results to as json. Default is stdout.')
+
+    def handle(self, *args, **options):
+        depths = [int(d) for d in options['depths'].split(',')]
+        setup_test_environment()
+        old_name = connection.creation.create_test_db(verbosity=0, autoclobber=True)
+        try:
+            User.objects.create_superuser('admin', 'admin@testapp.org', 'adminpassword')
+            self.stderr.write('Create {} items per model...'.format(options['items']))
+            create_benchmark_data(options['items'])
+
+            results = list()
+            for depth in depths:
+                for unique in (False, True):
+                    result = run_benchmark(depth, unique, options['repeat'], not options['no_memory'])
+                    self.stderr.write('depth={depth} unique={unique}: {rows} rows in {seconds:.2f}s '
+                                      '({rows_per_second} rows/s, ttfb {ttfb:.3f}s)'.format(**result))
+                    results.append(result)
+        finally:
+            connection.creation.destroy_test_db(old_name, verbosity=0)
+            teardown_test_environment()
+
+        meta = get_meta(options['items'])
+        meta['label'] = options['label']
+        data = json.dumps(dict(meta=meta, results=results), indent=2)
+        if options['output']:
+            with open(options['output'], 'w') as file:
+                file.write(data)
+        else:
+            self.stdout.write(data)
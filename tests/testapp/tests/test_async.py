@@ -0,0 +1,104 @@
+import gzip
+from unittest import skipIf
+from unittest.mock import MagicMock
+from unittest.mock import patch
+import django
+
+from csvexport.export import CSVExport
+from csvexport.models import ExportCheckpoint
+from csvexport.signals import export_finished
+from csvexport.utils import get_default_csv_format
+from ..admin import ModelAAdmin
+from ..models import ModelA
+from .test_export import AlterSettings
+from .test_export import BaseTestCase
+
+if django.VERSION >= (4, 2):
+    from asgiref.sync import async_to_sync
+    from asgiref.sync import sync_to_async
+    from django.test import AsyncClient
+
+
+async def collect(chunks):
+    return [chunk async for chunk in chunks]
+
+
+@skipIf(django.VERSION < (4, 2), 'Asynchronous exports need django 4.2 or higher.')
+class AsyncExportTest(BaseTestCase):
+    def setUp(self):
+        super().setUp()
+        self.async_client = AsyncClient()
+        self.async_client.force_login(self.admin)
+        self.post_data = self.export_post_data.copy()
+        self.post_data.update(self.csv_format)
+        self.post_data['root'] = ['id', 'char_field', 'binary_field']
+        self.post_data['model_b'] = ['model_b.char_field']
+        self.post_data['csvexport_download'] = 'Download'
+
+    def test_async_iteration(self):
+        header = ['id', 'char_field', 'binary_field', 'model_b.char_field']
+        queryset = ModelA.objects.order_by('pk')
+        for options in [
+                dict(),
+                dict(unique=True),
+                dict(engine='keyset', chunk_size=2),
+                dict(output_format='jsonl', chunk_size=2)]:
+            export = CSVExport(queryset, header, get_default_csv_format(), **options)
+            async_export = CSVExport(queryset, header, get_default_csv_format(), **options)
+            self.assertEqual(async_to_sync(collect)(async_export), list(export))
+            self.assertEqual(async_export.rows, export.rows)
+
+    async def test_asgi_export(self):
+        resp = await sync_to_async(self.client.post)(self.url_a, self.post_data)
+        content = resp.content
+
+        # asynchronous exports must be enabled
+        resp = await self.async_client.post(self.url_a, self.post_data)
+        self.assertFalse(resp.streaming)
+        self.assertEqual(resp.content, content)
+
+        finished = MagicMock()
+        export_finished.connect(finished)
+        self.addCleanup(export_finished.disconnect, finished)
+        with AlterSettings(CSV_EXPORT_ASYNC='auto'):
+            resp = await self.async_client.post(self.url_a, self.post_data)
+        self.assertTrue(resp.is_async)
+        self.assertEqual(resp['Content-Disposition'], 'attachment; filename="testapp.modela.csv"')
+        self.assertEqual(finished.call_count, 0)
+        self.assertEqual(b''.join(await collect(resp.streaming_content)), content)
+        self.assertEqual(finished.call_count, 1)
+        self.assertEqual(finished.call_args[1]['rows'], 5)
+        self.assertEqual(finished.call_args[1]['bytes'], len(content))
+
+        # compression
+        post_data = self.post_data.copy()
+        post_data['compression'] = 'gzip'
+        with AlterSettings(CSV_EXPORT_ASYNC='auto', CSV_EXPORT_COMPRESSION_FORM=True):
+            resp = await self.async_client.post(self.url_a, post_data)
+        self.assertTrue(resp.is_async)
+        self.assertEqual(gzip.decompress(b''.join(await collect(resp.streaming_content))), content)
+
+    async def test_async_export_error(self):
+        # errors of the first row are reported by the form
+        self.post_data['quoting'] = 'QUOTE_NONE'
+        self.post_data['root'] = ['text_field']
+        with AlterSettings(CSV_EXPORT_ASYNC='auto'):
+            with self.assertLogs('csvexport.metrics', 'WARNING'):
+                resp = await self.async_client.post(self.url_a, self.post_data)
+        self.assertFalse(resp.streaming)
+        self.assertIn('Could not write csv-file', resp.content.decode('utf-8'))
+
+    def test_forced_async_export(self):
+        with AlterSettings(CSV_EXPORT_ASYNC=True):
+            resp = self.client.post(self.url_a, self.post_data)
+        self.assertTrue(resp.is_async)
+
+    async def test_async_incremental_export(self):
+        self.post_data['incremental'] = 'on'
+        with patch.object(ModelAAdmin, 'csvexport_incremental_field', 'integer_field', create=True), \
+                AlterSettings(CSV_EXPORT_ASYNC='auto'):
+            resp = await self.async_client.post(self.url_a, self.post_data)
+            self.assertFalse(await ExportCheckpoint.objects.aexists())
+            self.assertEqual(len(b''.join(await collect(resp.streaming_content)).splitlines()), 6)
+        checkpoint = await ExportCheckpoint.objects.aget()
+        self.assertEqual(checkpoint.value, '1234')
@@ -0,0 +1,29 @@
+from django.contrib.auth.models import User
+from django.test import TestCase
+
+from ..benchmark import create_benchmark_data
+from ..benchmark import run_benchmark
+from ..models import ModelA
+from ..models import ModelD
+
+
+class BenchmarkTest(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        User.objects.create_superuser('admin', 'admin@testapp.org', 'adminpassword')
+        create_benchmark_data(25, distinct=5, batch_size=10)
+
+    def test_benchmark_data(self):
+        self.assertEqual(ModelA.objects.count(), 25)
+        self.assertEqual(ModelD.objects.values('char_field').distinct().count(), 5)
+        self.assertEqual(ModelA.objects.filter(model_b__model_c__model_d__isnull=False).count(), 25)
+
+    def test_run_benchmark(self):
+        result = run_benchmark(1, False)
+        self.assertEqual(result['rows'], 25)
+        for key in ['seconds', 'ttfb', 'rows_per_second', 'tracemalloc_peak', 'max_rss', 'bytes']:
+            self.assertIn(key, result)
+
+        result = run_benchmark(3, True, repeat=2, memory=False)
+        self.assertEqual(result['rows'], 25)
+        self.assertNotIn('tracemalloc_peak', result)
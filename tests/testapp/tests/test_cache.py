@@ -0,0 +1,116 @@
+from unittest.mock import patch
+from django.db import connection
+from django.db.models import F
+from django.db.models import Subquery
+from django.db.models.signals import post_save
+from django.test.utils import CaptureQueriesContext
+
+from csvexport.cache import ExportCache
+from csvexport.cache import get_cache
+from csvexport.cache import invalidate
+from csvexport.cache import invalidate_receiver
+from csvexport.export import CSVExport
+from ..admin import ModelAAdmin
+from ..models import ModelA
+from ..models import ModelB
+from ..models import ModelC
+from ..models import ModelD
+from .test_export import AlterSettings
+from .test_export import BaseTestCase
+
+
+class ExportCacheTest(BaseTestCase):
+    def setUp(self):
+        super().setUp()
+        get_cache().clear()
+        self.addCleanup(get_cache().clear)
+        self.post_data = self.export_post_data.copy()
+        self.post_data.update(self.csv_format)
+        self.post_data['root'] = ['id', 'char_field']
+        self.post_data['model_b'] = ['model_b.char_field']
+        self.post_data['csvexport_view'] = 'View'
+
+    def export(self, post_data=None):
+        with CaptureQueriesContext(connection) as queries:
+            resp = self.client.post(self.url_a, post_data or self.post_data)
+        exports = [q for q in queries if '"testapp_modelb"."char_field"' in q['sql']]
+        return resp, len(exports)
+
+    def test_cache(self):
+        resp, queries = self.export()
+        self.assertNotIn('X-CSV-Export-Cache', resp)
+        self.assertEqual(queries, 1)
+
+        with AlterSettings(CSV_EXPORT_CACHE=True):
+            resp, queries = self.export()
+            self.assertEqual(resp['X-CSV-Export-Cache'], 'miss')
+            content = resp.content
+
+            resp, queries = self.export()
+            self.assertEqual(resp['X-CSV-Export-Cache'], 'hit')
+            self.assertEqual(queries, 0)
+            self.assertEqual(resp.content, content)
+
+            # other fields or another csv-format are exported again
+            post_data = self.post_data.copy()
+            post_data['delimiter'] = ';'
+            resp, queries = self.export(post_data)
+            self.assertEqual(resp['X-CSV-Export-Cache'], 'miss')
+            del post_data['model_b']
+            resp = self.client.post(self.url_a, post_data)
+            self.assertEqual(resp['X-CSV-Export-Cache'], 'miss')
+
+            # invalidation of a related model
+            invalidate(ModelB)
+            resp, queries = self.export()
+            self.assertEqual(resp['X-CSV-Export-Cache'], 'miss')
+            self.assertEqual(queries, 1)
+            self.assertEqual(resp.content, content)
+
+    def test_streaming(self):
+        with AlterSettings(CSV_EXPORT_CACHE=True, CSV_EXPORT_STREAMING=True):
+            resp, queries = self.export()
+            self.assertEqual(resp['X-CSV-Export-Cache'], 'miss')
+            content = b''.join(resp.streaming_content)
+
+            resp, queries = self.export()
+            self.assertEqual(resp['X-CSV-Export-Cache'], 'hit')
+            self.assertEqual(b''.join(resp.streaming_content), content)
+
+    def test_max_size(self):
+        with AlterSettings(CSV_EXPORT_CACHE=True, CSV_EXPORT_CACHE_MAX_SIZE=100):
+            self.export()
+            resp, queries = self.export()
+            self.assertEqual(resp['X-CSV-Export-Cache'], 'miss')
+            self.assertEqual(queries, 1)
+
+    def test_invalidate_receiver(self):
+        post_save.connect(invalidate_receiver, sender=ModelA)
+        self.addCleanup(post_save.disconnect, invalidate_receiver, sender=ModelA)
+        with AlterSettings(CSV_EXPORT_CACHE=True):
+            self.export()
+            ModelA.objects.first().save()
+            resp, queries = self.export()
+            self.assertEqual(resp['X-CSV-Export-Cache'], 'miss')
+
+    def test_invalidate_intermediate_models(self):
+        post_data = self.post_data.copy()
+        del post_data['model_b']
+        post_data['model_b__model_c'] = ['model_b.model_c.char_field']
+        annotations = dict(model_d_char=F('model_c__model_d__char_field'))
+        post_data['root'] = ['id', 'model_d_char']
+        with AlterSettings(CSV_EXPORT_CACHE=True), \
+                patch.object(ModelAAdmin, 'csvexport_annotations', annotations, create=True):
+            for model in [ModelB, ModelC, ModelD]:
+                self.client.post(self.url_a, post_data)
+                resp = self.client.post(self.url_a, post_data)
+                self.assertEqual(resp['X-CSV-Export-Cache'], 'hit')
+                invalidate(model)
+                resp = self.client.post(self.url_a, post_data)
+                self.assertEqual(resp['X-CSV-Export-Cache'], 'miss')
+
+    def test_get_models(self):
+        header = ['id', 'model_b.model_c.modelb.char_field', 'count']
+        annotations = dict(count=Subquery(ModelD.objects.values('pk')[:1]))
+        export = CSVExport(ModelA.objects.all(), header, dict(), annotations=annotations)
+        self.assertEqual(ExportCache(export).get_models(), [ModelA, ModelB, ModelC, ModelD])
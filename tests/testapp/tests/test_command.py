@@ -0,0 +1,88 @@
+import os
+import tempfile
+from io import StringIO
+from unittest.mock import patch
+from concurrent.futures import ThreadPoolExecutor
+from django.core.management import call_command
+from django.core.management.base import CommandError
+from django.test import TestCase
+from django.test import TransactionTestCase
+
+from ..admin import ModelAAdmin
+from ..models import ModelA
+from ..models import UNICODE_STRING
+from ..management.commands.testapp import create_test_data
+
+
+def export(*args, **kwargs):
+    out = StringIO()
+    call_command('csvexport', *args, stdout=out, **kwargs)
+    return out.getvalue()
+
+
+class CommandTest(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        create_test_data()
+
+    def test_export(self):
+        content = export('testapp.ModelA', fields='id,char_field,model_b.model_c.char_field')
+        lines = content.splitlines()
+        self.assertEqual(lines[0], '"id","char_field","model_b.model_c.char_field"')
+        self.assertEqual(len(lines), 6)
+        self.assertEqual(lines[1], '"1","{0}","{0}"'.format(UNICODE_STRING))
+        self.assertEqual(lines[5], '"5","{}",""'.format(UNICODE_STRING))
+
+    def test_default_fields(self):
+        content = export('testapp.ModelA')
+        header = content.splitlines()[0]
+        fields = [f.name for f in ModelA._meta.get_fields() if not f.is_relation]
+        self.assertEqual(header, ','.join('"{}"'.format(f) for f in fields))
+
+    def test_filter_and_output(self):
+        with tempfile.TemporaryDirectory() as tmpdir:
+            path = os.path.join(tmpdir, 'export.csv')
+            call_command('csvexport', 'testapp.ModelA', fields='id', filter=['id__gt=3'], output=path)
+            with open(path) as file:
+                self.assertEqual(file.read(), '"id"\n"4"\n"5"\n')
+
+    def test_format(self):
+        content = export('testapp.ModelA', fields='id,char_field', format='jsonl')
+        self.assertEqual(content.splitlines()[0], '{{"id": 1, "char_field": "{}"}}'.format(UNICODE_STRING))
+
+    def test_unique(self):
+        content = export('testapp.ModelA', fields='model_b.model_c.char_field', unique=True)
+        self.assertEqual(len(content.splitlines()), 3)
+
+    def test_export_fields(self):
+        # Fields are resolved like for the modeladmin of the model.
+        self.assertTrue(export('testapp.ModelB', fields='model_c.char_field'))
+        with self.assertRaises(CommandError):
+            export('testapp.ModelB', fields='model_c.integer_field')
+
+    def test_checkpoint(self):
+        with self.assertRaises(CommandError):
+            export('testapp.ModelA', fields='id', checkpoint='nightly')
+        with patch.object(ModelAAdmin, 'csvexport_incremental_field', 'integer_field', create=True):
+            self.assertEqual(len(export('testapp.ModelA', fields='id', checkpoint='nightly').splitlines()), 6)
+            self.assertEqual(len(export('testapp.ModelA', fields='id', checkpoint='nightly').splitlines()), 1)
+
+    def test_errors(self):
+        with self.assertRaises(CommandError):
+            export('testapp.NoModel')
+        with self.assertRaises(CommandError):
+            export('testapp.ModelA', fields='no_field')
+        with self.assertRaises(CommandError):
+            export('testapp.ModelA', fields='id', filter=['no_field=1'])
+
+
+class ParallelCommandTest(TransactionTestCase):
+    def setUp(self):
+        create_test_data()
+
+    @patch('csvexport.export.get_executor', ThreadPoolExecutor)
+    def test_workers(self):
+        fields = 'id,char_field,binary_field,model_b.model_c.char_field'
+        content = export('testapp.ModelA', fields=fields)
+        for workers in [2, 3]:
+            self.assertEqual(content, export('testapp.ModelA', fields=fields, workers=workers))
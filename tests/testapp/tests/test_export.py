@@ -1,24 +1,64 @@
 
+import io
 import re
+import gzip
+import json
+from unittest import skipIf
 from unittest.mock import MagicMock
+from unittest.mock import patch
+from concurrent.futures import ThreadPoolExecutor
 from django.test import TestCase
+from django.test import TransactionTestCase
 from django.test import Client
 from django.contrib.auth.models import User
 from django.urls import reverse
+from django.db import connection
+from django.db.models import CharField
+from django.db.models import F
+from django.db.models import Value
+from django.db.models.functions import Concat
+from django.db.models.query import QuerySet
+from django.db.models.signals import class_prepared
+from django.test.utils import CaptureQueriesContext
+from django.utils import timezone
 
 from csvexport import settings
 from csvexport.forms import CSVFieldsForm
 from csvexport.forms import CSVFormatForm
 from csvexport.forms import UniqueForm
 from csvexport.actions import model_tree_factory
+from csvexport.utils import get_model_tree
+from csvexport.compression import get_compression
+from csvexport.utils import CSVData
+from csvexport.utils import ViewPermissions
+from csvexport.utils import read_blocks
+from csvexport.engines import get_keyset_ordering
+from csvexport.export import CSVExport
+from csvexport.engines import iterate_keyset
+from csvexport.parallel import get_executor
+from csvexport.parallel import iterate_shards
+from csvexport.models import ExportCheckpoint
+from csvexport.models import ExportJob
+from csvexport.preview import estimate_count
+from csvexport.writers import openpyxl
+from csvexport.writers import pyarrow
 from ..models import ModelA
+from ..models import ModelC
 from ..models import ModelD
 from ..models import UNICODE_STRING
 from ..models import BYTE_STRING
+from ..admin import ModelAAdmin
 from ..admin import ModelBAdmin
+from ..admin import ModelDAdmin
 from ..management.commands.testapp import create_test_data
 
 
+# Output of QuerySet.explain(format='json') on postgresql.
+POSTGRESQL_PLAN = """[{"Plan": {"Node Type": "Seq Scan", "Parallel Aware": false, "Async Capable": false, \
+"Relation Name": "testapp_modela", "Alias": "testapp_modela", "Startup Cost": 0.0, "Total Cost": 11.2, \
+"Plan Rows": 42, "Plan Width": 1334}}]"""
+
+
 class AlterSettings:
     def __init__(self, **kwargs):
         self.settings = kwargs
@@ -34,7 +74,7 @@ class AlterSettings:
             setattr(settings, setting, value)
 
 
-class ExportTest(TestCase):
+class BaseTestCase(TestCase):
     @classmethod
     def setUpTestData(cls):
         create_test_data()
@@ -46,11 +86,9 @@ class ExportTest(TestCase):
         self.fields = dict()
 
         request = MagicMock(user=self.admin)
-        modeladmin = MagicMock(spec=[])
-        tree_class = model_tree_factory(modeladmin, request)
-        tree = tree_class(ModelA)
+        tree = get_model_tree(MagicMock(spec=[], model=ModelA))
         field_names = [f.name for f in ModelA._meta.get_fields() if not f.is_relation]
-        for node in tree.iterate_nodes_with_choices_and_permission():
+        for node in tree.iterate_nodes_with_choices_and_permission(request):
             self.fields[node.field_name] = list()
             path = node.field_name.replace('root', '').replace('model_a__', '').replace('__', '.')
             for field in field_names:
@@ -86,6 +124,9 @@ class ExportTest(TestCase):
         for option in self.options:
             self.assertIn(option, content.decode('utf8'))
 
+
+
+class ExportTest(BaseTestCase):
     def test_form(self):
         format_form = CSVFormatForm()
         resp = self.client.post(self.url_a, self.form_post_data)
@@ -137,6 +178,29 @@ class ExportTest(TestCase):
             for field_name in ['model_b__model_d', 'model_b__model_c', 'model_b__model_c__model_d']:
                 self.assertNotIn(field_name, resp.content.decode('utf-8'))
 
+    def test_form_with_select_across(self):
+        resp = self.client.post(self.url_a, self.form_post_data)
+        self.assertEqual(resp.content.decode('utf-8').count('name="_selected_action"'), 5)
+        self.assertNotIn('name="select_across"', resp.content.decode('utf-8'))
+
+        # with all items selected only the select-across-flag and a single
+        # pk are passed on.
+        form_post_data = self.form_post_data.copy()
+        form_post_data['select_across'] = '1'
+        resp = self.client.post(self.url_a + '?id__gte=3', form_post_data)
+        self.assertEqual(resp.content.decode('utf-8').count('name="_selected_action"'), 1)
+        self.assertIn('name="select_across" value="1"', resp.content.decode('utf-8'))
+
+        post_data = self.export_post_data.copy()
+        post_data.update(self.fields)
+        post_data.update(self.csv_format)
+        post_data['_selected_action'] = ['1']
+        post_data['select_across'] = '1'
+        post_data['csvexport_download'] = 'Download'
+        resp = self.client.post(self.url_a + '?id__gte=3', post_data)
+        self.assertEqual(resp.status_code, 200)
+        self.assertEqual(len(resp.content.splitlines()), 4)
+
     def test_invalid_form(self):
         # test without any selected field...
         post_data = self.export_post_data.copy()
@@ -154,7 +218,8 @@ class ExportTest(TestCase):
         post_data['escapechar'] = ''
 
         # Without quotechar and escapechar the data couldn't be processed by csv
-        resp = self.client.post(self.url_a, post_data)
+        with self.assertLogs('csvexport.metrics', 'WARNING'):
+            resp = self.client.post(self.url_a, post_data)
         self.assertEqual(resp.status_code, 200)
         self.assertIn('Could not write csv-file', resp.content.decode('utf-8'))
 
@@ -177,6 +242,55 @@ class ExportTest(TestCase):
         self.assertIn("text/plain", resp.get('Content-Type'))
         self.check_content(resp.content, post_data)
 
+    def test_preview(self):
+        post_data = self.export_post_data.copy()
+        post_data.update(self.csv_format)
+        post_data['root'] = ['id', 'char_field', 'binary_field']
+        post_data['model_b'] = ['model_b.char_field']
+        post_data['csvexport_view'] = 'View'
+        with AlterSettings(CSV_EXPORT_PREVIEW_ROWS=2):
+            with CaptureQueriesContext(connection) as queries:
+                resp = self.client.post(self.url_a, post_data)
+        self.assertEqual(resp.status_code, 200)
+        self.assertIn('text/html', resp.get('Content-Type'))
+        self.assertEqual(resp.context['header'], ['id', 'char_field', 'binary_field', 'model_b.char_field'])
+        self.assertEqual(len(resp.context['rows']), 2)
+        self.assertEqual(resp.context['rows'][0][1], UNICODE_STRING)
+        self.assertIsNone(resp.context['estimate'])
+        self.assertIn('<th scope="col">model_b.char_field</th>', resp.content.decode('utf-8'))
+        # the rows are limited by the query
+        exports = [q['sql'] for q in queries if '"testapp_modelb"."char_field"' in q['sql']]
+        self.assertEqual(len(exports), 1)
+        self.assertIn('LIMIT 2', exports[0])
+
+        # an estimate of the planner is shown
+        with AlterSettings(CSV_EXPORT_PREVIEW_ROWS=2):
+            with patch('csvexport.actions.estimate_count', return_value=1000):
+                resp = self.client.post(self.url_a, post_data)
+        self.assertIn('about 1000 rows', resp.content.decode('utf-8'))
+
+        # the estimate is taken from the plan of postgresql
+        queryset = ModelA.objects.all()
+        with patch.object(connection, 'vendor', 'postgresql'):
+            with patch.object(QuerySet, 'explain', return_value=POSTGRESQL_PLAN):
+                self.assertEqual(estimate_count(queryset), 42)
+
+            # unexpected plans give no estimate
+            for plan in ['[]', '{}', '[{"Plan": []}]', '[{"Plan": {}}]', '[{"Plan": {"Plan Rows": "42"}}]', 'Seq Scan']:
+                with patch.object(QuerySet, 'explain', return_value=plan):
+                    self.assertIsNone(estimate_count(queryset))
+            with patch.object(QuerySet, 'explain', return_value=POSTGRESQL_PLAN[1:-1]):
+                self.assertEqual(estimate_count(queryset), 42)
+            with patch.object(QuerySet, 'explain', side_effect=KeyError('Plan')):
+                self.assertIsNone(estimate_count(queryset))
+
+        # downloads are not limited
+        del post_data['csvexport_view']
+        post_data['csvexport_download'] = 'Download'
+        with AlterSettings(CSV_EXPORT_PREVIEW_ROWS=2):
+            resp = self.client.post(self.url_a, post_data)
+        self.assertEqual(len(resp.content.splitlines()), 6)
+
     def test_csv_download(self):
         post_data = self.export_post_data.copy()
         post_data.update(self.fields)
@@ -196,6 +310,216 @@ class ExportTest(TestCase):
         self.assertEqual(resp.status_code, 200)
         self.assertEqual(resp.get('Content-Type'), "text/csv")
 
+    def test_csv_streaming(self):
+        post_data = self.export_post_data.copy()
+        post_data.update(self.fields)
+        post_data.update(self.csv_format)
+
+        with AlterSettings(CSV_EXPORT_STREAMING=True):
+            post_data['csvexport_view'] = 'View'
+            resp = self.client.post(self.url_a, post_data)
+            self.assertEqual(resp.status_code, 200)
+            self.assertTrue(resp.streaming)
+            self.assertIn("text/plain", resp.get('Content-Type'))
+            content = b''.join(resp.streaming_content)
+            self.check_content(content, post_data)
+            self.assertEqual(len(content.splitlines()), 6)
+
+            del post_data['csvexport_view']
+            post_data['csvexport_download'] = 'Download'
+            resp = self.client.post(self.url_a, post_data)
+            self.assertEqual(resp.status_code, 200)
+            self.assertTrue(resp.streaming)
+            self.assertEqual(resp.get('Content-Type'), "text/csv")
+            self.check_content(b''.join(resp.streaming_content), post_data)
+
+    def test_csv_streaming_error(self):
+        post_data = self.export_post_data.copy()
+        post_data.update(self.fields)
+        post_data.update(self.csv_format)
+        post_data['csvexport_view'] = 'View'
+        post_data['doublequote'] = ''
+        post_data['escapechar'] = ''
+
+        # Errors within the first row are catched before streaming starts.
+        with AlterSettings(CSV_EXPORT_STREAMING=True):
+            with self.assertLogs('csvexport.metrics', 'WARNING'):
+                resp = self.client.post(self.url_a, post_data)
+            self.assertEqual(resp.status_code, 200)
+            self.assertFalse(resp.streaming)
+            self.assertIn('Could not write csv-file', resp.content.decode('utf-8'))
+
+    def test_chunk_size(self):
+        post_data = self.export_post_data.copy()
+        post_data.update(self.fields)
+        post_data.update(self.csv_format)
+        post_data['csvexport_download'] = 'Download'
+
+        iterator = QuerySet.iterator
+        with patch.object(QuerySet, 'iterator', autospec=True, side_effect=iterator) as mock:
+            with AlterSettings(CSV_EXPORT_CHUNK_SIZE=2):
+                resp = self.client.post(self.url_a, post_data)
+            self.assertEqual(mock.call_args.kwargs['chunk_size'], 2)
+            self.check_content(resp.content, post_data)
+            self.assertEqual(len(resp.content.splitlines()), 6)
+
+            with patch.object(ModelAAdmin, 'csvexport_chunk_size', 3, create=True):
+                resp = self.client.post(self.url_a, post_data)
+            self.assertEqual(mock.call_args.kwargs['chunk_size'], 3)
+
+    def test_keyset_engine(self):
+        post_data = self.export_post_data.copy()
+        post_data.update(self.fields)
+        post_data.update(self.csv_format)
+        post_data['csvexport_download'] = 'Download'
+        resp = self.client.post(self.url_a, post_data)
+
+        with AlterSettings(CSV_EXPORT_ENGINE='keyset', CSV_EXPORT_CHUNK_SIZE=2):
+            with CaptureQueriesContext(connection) as queries:
+                keyset_resp = self.client.post(self.url_a, post_data)
+            self.assertEqual(resp.content, keyset_resp.content)
+            pages = [q for q in queries.captured_queries if re.search(r'LIMIT 2\b', q['sql'])]
+            self.assertEqual(len(pages), 3)
+
+            # Other orderings than by pk are not supported by the keyset engine.
+            with patch.object(ModelAAdmin, 'ordering', ['-char_field', 'pk']):
+                with self.assertLogs('csvexport.export', 'WARNING'):
+                    ordered_resp = self.client.post(self.url_a, post_data)
+                self.assertEqual(len(ordered_resp.content.splitlines()), 6)
+
+    def test_keyset_ordering(self):
+        queryset = ModelA.objects.all()
+        self.assertEqual(get_keyset_ordering(queryset), 'pk')
+        self.assertEqual(get_keyset_ordering(queryset.order_by('id')), 'pk')
+        self.assertEqual(get_keyset_ordering(queryset.order_by('-pk')), '-pk')
+        self.assertIsNone(get_keyset_ordering(queryset.order_by('char_field')))
+        self.assertIsNone(get_keyset_ordering(queryset.distinct()))
+        self.assertIsNone(get_keyset_ordering(queryset[:2]))
+
+        rows = list(iterate_keyset(queryset.order_by('-pk'), ['id'], 2))
+        self.assertEqual(rows, [(i,) for i in range(5, 0, -1)])
+
+    def test_compression_form(self):
+        resp = self.client.post(self.url_a, self.form_post_data)
+        self.assertNotIn('name="compression"', resp.content.decode('utf-8'))
+        with AlterSettings(CSV_EXPORT_COMPRESSION_FORM=True):
+            resp = self.client.post(self.url_a, self.form_post_data)
+            self.assertIn('name="compression"', resp.content.decode('utf-8'))
+            self.assertIn('value="gzip"', resp.content.decode('utf-8'))
+
+    def test_gzip_compression(self):
+        post_data = self.export_post_data.copy()
+        post_data.update(self.fields)
+        post_data.update(self.csv_format)
+        post_data['compression'] = 'gzip'
+        post_data['csvexport_download'] = 'Download'
+
+        with AlterSettings(CSV_EXPORT_COMPRESSION_FORM=True):
+            resp = self.client.post(self.url_a, post_data)
+            self.assertEqual(resp.get('Content-Type'), 'application/gzip')
+            self.assertIn('modela.csv.gz', resp.get('Content-Disposition'))
+            self.check_content(gzip.decompress(resp.content), post_data)
+
+            with AlterSettings(CSV_EXPORT_STREAMING=True):
+                resp = self.client.post(self.url_a, post_data)
+                content = gzip.decompress(b''.join(resp.streaming_content))
+                self.check_content(content, post_data)
+                self.assertEqual(len(content.splitlines()), 6)
+
+            del post_data['csvexport_download']
+            post_data['csvexport_view'] = 'View'
+            resp = self.client.post(self.url_a, post_data)
+            self.assertIn('text/plain', resp.get('Content-Type'))
+            self.assertEqual(resp.get('Content-Encoding'), 'gzip')
+            self.check_content(gzip.decompress(resp.content), post_data)
+
+        # compression by settings
+        with AlterSettings(CSV_EXPORT_COMPRESSION='gzip'):
+            resp = self.client.post(self.url_a, post_data)
+            self.assertEqual(resp.get('Content-Encoding'), 'gzip')
+
+    @skipIf(get_compression('zstd') is None, 'zstd is not available')
+    def test_zstd_compression(self):
+        post_data = self.export_post_data.copy()
+        post_data.update(self.fields)
+        post_data.update(self.csv_format)
+        post_data['csvexport_download'] = 'Download'
+        with AlterSettings(CSV_EXPORT_COMPRESSION='zstd'):
+            resp = self.client.post(self.url_a, post_data)
+            self.assertEqual(resp.get('Content-Type'), 'application/zstd')
+            self.assertIn('modela.csv.zst', resp.get('Content-Disposition'))
+
+    def test_output_format_form(self):
+        resp = self.client.post(self.url_a, self.form_post_data)
+        self.assertNotIn('name="output_format"', resp.content.decode('utf-8'))
+        with AlterSettings(CSV_EXPORT_FORMATS=['csv', 'jsonl', 'unknown']):
+            resp = self.client.post(self.url_a, self.form_post_data)
+            self.assertIn('name="output_format"', resp.content.decode('utf-8'))
+            self.assertIn('value="jsonl"', resp.content.decode('utf-8'))
+            self.assertNotIn('value="unknown"', resp.content.decode('utf-8'))
+
+    def get_format_post_data(self, output_format):
+        post_data = self.export_post_data.copy()
+        post_data.update(self.csv_format)
+        post_data['model_b'] = ['model_b.id', 'model_b.char_field', 'model_b.binary_field']
+        post_data['model_b__model_c'] = ['model_b.model_c.date_field']
+        post_data['output_format'] = output_format
+        post_data['csvexport_download'] = 'Download'
+        return post_data
+
+    def test_jsonl_format(self):
+        post_data = self.get_format_post_data('jsonl')
+        with patch.object(ModelAAdmin, 'csvexport_formats', ['csv', 'jsonl'], create=True):
+            resp = self.client.post(self.url_a, post_data)
+        self.assertEqual(resp.get('Content-Type'), 'application/x-ndjson')
+        self.assertIn('modela.jsonl', resp.get('Content-Disposition'))
+        rows = [json.loads(line) for line in resp.content.decode('utf-8').splitlines()]
+        self.assertEqual(len(rows), 5)
+        self.assertEqual(rows[0]['model_b.char_field'], UNICODE_STRING)
+        self.assertEqual(rows[0]['model_b.binary_field'], 'YWJjZGU=')
+        self.assertIn(None, [r['model_b.model_c.date_field'] for r in rows])
+
+        # jsonl could be viewed and uniqued like csv
+        post_data['csvexport_view'] = 'View'
+        post_data['unique'] = True
+        del post_data['csvexport_download']
+        post_data['model_b'] = ['model_b.char_field']
+        with AlterSettings(CSV_EXPORT_FORMATS=['csv', 'jsonl'], CSV_EXPORT_UNIQUE_FORM=True):
+            resp = self.client.post(self.url_a, post_data)
+        self.assertEqual(resp.get('Content-Type'), 'text/plain;charset=utf-8')
+        self.assertEqual(len(resp.content.splitlines()), 2)
+
+    @skipIf(openpyxl is None, 'openpyxl is not installed')
+    def test_xlsx_format(self):
+        post_data = self.get_format_post_data('xlsx')
+        post_data['csvexport_view'] = 'View'
+        with AlterSettings(CSV_EXPORT_FORMATS=['csv', 'xlsx'], CSV_EXPORT_STREAMING=True):
+            resp = self.client.post(self.url_a, post_data)
+            content = b''.join(resp.streaming_content)
+        # binary formats are always downloaded
+        self.assertIn('modela.xlsx', resp.get('Content-Disposition'))
+        workbook = openpyxl.load_workbook(io.BytesIO(content), read_only=True)
+        rows = list(workbook.active.values)
+        self.assertEqual(len(rows), 6)
+        self.assertEqual(rows[0], tuple(post_data['model_b'] + post_data['model_b__model_c']))
+        self.assertEqual(rows[1][1], UNICODE_STRING)
+
+    @skipIf(pyarrow is None, 'pyarrow is not installed')
+    def test_parquet_format(self):
+        import pyarrow.parquet
+        post_data = self.get_format_post_data('parquet')
+        with AlterSettings(CSV_EXPORT_FORMATS=['parquet'], CSV_EXPORT_CHUNK_SIZE=2):
+            resp = self.client.post(self.url_a, post_data)
+        self.assertEqual(resp.get('Content-Type'), 'application/vnd.apache.parquet')
+        parquet_file = pyarrow.parquet.ParquetFile(io.BytesIO(resp.content))
+        self.assertEqual(parquet_file.metadata.num_row_groups, 3)
+        table = parquet_file.read()
+        self.assertEqual(table.schema.field('model_b.id').type, pyarrow.int64())
+        self.assertEqual(table.schema.field('model_b.model_c.date_field').type, pyarrow.date32())
+        self.assertEqual(table.column('model_b.char_field').to_pylist(), [UNICODE_STRING] * 5)
+        self.assertEqual(table.column('model_b.binary_field').to_pylist(), [BYTE_STRING] * 5)
+        self.assertIn(None, table.column('model_b.model_c.date_field').to_pylist())
+
     def test_custom_fields(self):
         field_names = [f.name for f in ModelD._meta.get_fields() if not f.is_relation]
         self.assertIn('custom_field', field_names)
@@ -215,6 +539,39 @@ class ExportTest(TestCase):
         with AlterSettings(CSV_EXPORT_UNIQUE_FORM=True):
             resp = self.client.post(self.url_a, post_data)
             self.assertEqual(len(resp.content.splitlines()), 3)
+            self.assertEqual(resp.get('X-CSV-Export-Unique'), 'sql')
+
+        with AlterSettings(CSV_EXPORT_UNIQUE_FORM=True, CSV_EXPORT_STREAMING=True):
+            resp = self.client.post(self.url_a, post_data)
+            self.assertEqual(len(b''.join(resp.streaming_content).splitlines()), 3)
+
+        # the ordering of the changelist is kept if its fields are exported
+        post_data['root'] = ['id']
+        with AlterSettings(CSV_EXPORT_UNIQUE_FORM=True):
+            resp = self.client.post(self.url_a, post_data)
+            self.assertEqual(resp.get('X-CSV-Export-Unique'), 'sql')
+            ids = [line.split(b',')[0] for line in resp.content.splitlines()[1:]]
+            self.assertEqual(ids, [b'"5"', b'"4"', b'"3"', b'"2"', b'"1"'])
+        del post_data['root']
+
+        for backend in ['bloom', 'disk']:
+            with AlterSettings(CSV_EXPORT_UNIQUE_FORM=True, CSV_EXPORT_UNIQUE_BACKEND=backend):
+                resp = self.client.post(self.url_a, post_data)
+                self.assertEqual(len(resp.content.splitlines()), 3)
+
+    def test_uniq_result_with_binary_field(self):
+        post_data = self.export_post_data.copy()
+        post_data.update(self.csv_format)
+        post_data['model_b'] = ['model_b.char_field', 'model_b.binary_field']
+        post_data['model_b__model_c'] = ['model_b.model_c.char_field']
+        post_data['csvexport_view'] = 'View'
+        post_data['unique'] = True
+
+        # binary fields are not distinct-able by every backend
+        with AlterSettings(CSV_EXPORT_UNIQUE_FORM=True):
+            resp = self.client.post(self.url_a, post_data)
+            self.assertEqual(len(resp.content.splitlines()), 3)
+            self.assertEqual(resp.get('X-CSV-Export-Unique'), 'python')
 
     def test_permissions(self):
         client = Client()
@@ -232,9 +589,265 @@ class ExportTest(TestCase):
             else:
                 self.assertIn('value="{}"'.format(option), resp.content.decode('utf-8'))
 
+    def test_model_tree_cache(self):
+        modeladmin = MagicMock(spec=[], model=ModelA)
+        tree = get_model_tree(modeladmin)
+        self.assertIs(tree, get_model_tree(modeladmin))
+        self.assertIsNot(tree, get_model_tree(ModelBAdmin, ModelA))
+        with AlterSettings(CSV_EXPORT_REFERENCE_DEPTH=1):
+            self.assertIsNot(tree, get_model_tree(modeladmin))
+
+        # permissions are regarded per request
+        admin_nodes = list(tree.iterate_nodes_with_choices_and_permission(MagicMock(user=self.admin)))
+        anyuser_nodes = list(tree.iterate_nodes_with_choices_and_permission(MagicMock(user=self.anyuser)))
+        self.assertLess(len(anyuser_nodes), len(admin_nodes))
+
+        # without request permissions are only ignored explicitly
+        self.assertEqual(list(tree.iterate_nodes_with_choices_and_permission()), [])
+        all_nodes = list(tree.iterate_nodes_with_choices_and_permission(ignore_permissions=True))
+        self.assertEqual(all_nodes, admin_nodes)
+
+        # the cache is cleared if models are (re)loaded
+        class_prepared.send(sender=ModelA)
+        self.assertIsNot(tree, get_model_tree(modeladmin))
+
+    def test_deprecated_model_tree_factory(self):
+        request = MagicMock(user=self.anyuser)
+        modeladmin = MagicMock(spec=[], model=ModelA)
+        with self.assertWarns(DeprecationWarning):
+            tree_class = model_tree_factory(modeladmin, request)
+        tree = tree_class(ModelA)
+        nodes = list(tree.iterate_nodes_with_choices_and_permission())
+        self.assertEqual(
+            [n.field_path for n in nodes],
+            [n.field_path for n in get_model_tree(modeladmin).iterate_nodes_with_choices_and_permission(request)])
+        self.assertTrue(tree.user_has_view_permission)
+
+        # overriding user_has_view_permission is still regarded
+        class DeniedTree(tree_class):
+            user_has_view_permission = False
+        with self.assertWarns(DeprecationWarning):
+            self.assertEqual(list(DeniedTree(ModelA).iterate_nodes_with_choices_and_permission()), [])
+
+    def test_read_blocks(self):
+        with patch('csvexport.utils.BLOCK_SIZE', 4):
+            self.assertEqual(list(read_blocks(io.BytesIO(b'0123456789'))), [b'0123', b'4567', b'89'])
+            file = io.StringIO('0123456789')
+            file.seek(3)
+            self.assertEqual(list(read_blocks(file, 6)), ['3456', '78'])
+
+    def test_deprecated_csv_data(self):
+        with self.assertWarns(DeprecationWarning):
+            data = CSVData(unique=True)
+        for line in ['a\n', 'b\n', 'a\n']:
+            data.write(line)
+        data.close()
+        self.assertEqual(str(data), 'a\nb\n')
+
+    def test_batch_permissions(self):
+        tree = get_model_tree(MagicMock(spec=[], model=ModelA))
+        request = MagicMock(user=self.anyuser)
+        get_all_permissions = User.get_all_permissions
+        with patch.object(User, 'has_perm') as has_perm:
+            with patch.object(User, 'get_all_permissions', autospec=True, side_effect=get_all_permissions) as mock:
+                nodes = list(tree.iterate_nodes_with_choices_and_permission(request))
+                self.assertEqual(nodes, list(tree.iterate_nodes_with_choices_and_permission(request)))
+                self.assertEqual(mock.call_count, 1)
+            self.assertFalse(has_perm.called)
+        self.assertNotIn('ModelC', [n.model.__name__ for n in nodes])
+        self.assertIn('ModelD', [n.model.__name__ for n in nodes])
+
+        # superusers and inactive users
+        self.assertTrue(ViewPermissions(self.admin).has_view_permission(ModelC))
+        self.anyuser.is_active = False
+        self.assertFalse(ViewPermissions(self.anyuser).has_view_permission(ModelA))
+
     def test_issue6_same_model_relations(self):
         resp = self.client.post(self.url_a, self.form_post_data)
         self.assertEqual(resp.status_code, 200)
         # check that both relations to ModelD from ModelC are present
         self.assertIn('name="model_c__model_d"', resp.content.decode('utf-8'))
         self.assertIn('name="model_c__model_dd"', resp.content.decode('utf-8'))
+
+    def test_to_many_relations(self):
+        url_d = reverse('admin:testapp_modeld_changelist')
+        resp = self.client.post(url_d, self.form_post_data)
+        self.assertNotIn('name="modelc"', resp.content.decode('utf-8'))
+
+        post_data = self.export_post_data.copy()
+        post_data.update(self.csv_format)
+        post_data['root'] = ['id']
+        post_data['modelc'] = ['modelc.integer_field']
+        post_data['model_c_dd__modela'] = ['model_c_dd.modela.char_field']
+        post_data['csvexport_view'] = 'View'
+        with patch.object(ModelDAdmin, 'csvexport_to_many', True, create=True):
+            resp = self.client.post(url_d, self.form_post_data)
+            self.assertIn('name="modelc"', resp.content.decode('utf-8'))
+            self.assertIn('name="model_c_dd__modela"', resp.content.decode('utf-8'))
+
+            with AlterSettings(CSV_EXPORT_TO_MANY_SEPARATOR='|'):
+                with CaptureQueriesContext(connection) as queries:
+                    resp = self.client.post(url_d, post_data)
+        lines = resp.content.decode('utf-8').splitlines()
+        self.assertEqual(lines[0], '"id","modelc.integer_field","model_c_dd.modela.char_field"')
+        self.assertEqual(len(lines), 6)
+        for line in lines[1:]:
+            self.assertTrue(line.endswith('"1234|1234",""'))
+
+        # The related values are aggregated within the query of the export.
+        exports = [q for q in queries if 'testapp_modelc' in q['sql']]
+        self.assertEqual(len(exports), 1)
+
+    def test_to_many_relations_with_keyset_engine(self):
+        url_d = reverse('admin:testapp_modeld_changelist')
+        post_data = self.export_post_data.copy()
+        post_data.update(self.csv_format)
+        post_data['root'] = ['id']
+        post_data['modelc'] = ['modelc.integer_field']
+        post_data['csvexport_view'] = 'View'
+        with AlterSettings(CSV_EXPORT_TO_MANY=True, CSV_EXPORT_ENGINE='keyset', CSV_EXPORT_CHUNK_SIZE=2):
+            resp = self.client.post(url_d, post_data)
+        lines = resp.content.decode('utf-8').splitlines()
+        self.assertEqual(len(lines), 6)
+        for line in lines[1:]:
+            self.assertTrue(line.endswith('"1234, 1234"'))
+
+    def test_annotations(self):
+        annotations = {
+            'double_integer': F('integer_field') * 2,
+            'names': Concat('char_field', Value('|'), 'model_b__model_c__char_field', output_field=CharField()),
+        }
+        post_data = self.export_post_data.copy()
+        post_data.update(self.csv_format)
+        post_data['root'] = ['id', 'double_integer', 'names']
+        post_data['csvexport_view'] = 'View'
+        with patch.object(ModelAAdmin, 'csvexport_annotations', annotations, create=True):
+            resp = self.client.post(self.url_a, self.form_post_data)
+            self.assertIn('value="double_integer"', resp.content.decode('utf-8'))
+            self.assertIn('value="names"', resp.content.decode('utf-8'))
+
+            with CaptureQueriesContext(connection) as queries:
+                resp = self.client.post(self.url_a, post_data)
+
+        lines = resp.content.decode('utf-8').splitlines()
+        self.assertEqual(lines[0], '"id","double_integer","names"')
+        self.assertEqual(len(lines), 6)
+        self.assertEqual(lines[2], '"4","2468","{0}|{0}"'.format(UNICODE_STRING))
+        # The annotations are evaluated within the query of the export.
+        exports = [q for q in queries if '"testapp_modela"."integer_field" * 2' in q['sql']]
+        self.assertEqual(len(exports), 1)
+
+        # annotations are only available for modeladmins defining them
+        resp = self.client.post(self.url_a, post_data)
+        self.assertIn('Select a valid choice', resp.content.decode('utf-8'))
+
+    def test_incremental_export(self):
+        post_data = self.export_post_data.copy()
+        post_data.update(self.csv_format)
+        post_data['root'] = ['id', 'integer_field']
+        post_data['csvexport_download'] = 'Download'
+        post_data['incremental'] = 'on'
+        with patch.object(ModelAAdmin, 'csvexport_incremental_field', 'integer_field', create=True):
+            resp = self.client.post(self.url_a, self.form_post_data)
+            self.assertIn('name="incremental"', resp.content.decode('utf-8'))
+
+            resp = self.client.post(self.url_a, post_data)
+            self.assertEqual(len(resp.content.decode('utf-8').splitlines()), 6)
+            checkpoint = ExportCheckpoint.objects.get()
+            self.assertEqual(checkpoint.user.username, 'admin')
+            self.assertEqual(checkpoint.get_value(), 1234)
+
+            # nothing changed
+            resp = self.client.post(self.url_a, post_data)
+            self.assertEqual(len(resp.content.decode('utf-8').splitlines()), 1)
+
+            # only the changed item is exported
+            item = ModelA.objects.first()
+            ModelA.objects.filter(pk=item.pk).update(integer_field=1300)
+            resp = self.client.post(self.url_a, post_data)
+            self.assertEqual(resp.content.decode('utf-8').splitlines()[1:], ['"{}","1300"'.format(item.pk)])
+            self.assertEqual(ExportCheckpoint.objects.get().value, '1300')
+
+            # the checkpoint of a streaming export advances when it is consumed
+            ModelA.objects.filter(pk=item.pk).update(integer_field=1400)
+            with AlterSettings(CSV_EXPORT_STREAMING=True):
+                resp = self.client.post(self.url_a, post_data)
+                self.assertEqual(ExportCheckpoint.objects.get().value, '1300')
+                self.assertEqual(len(b''.join(resp.streaming_content).splitlines()), 2)
+            self.assertEqual(ExportCheckpoint.objects.get().value, '1400')
+
+            # viewing the changes does not advance the checkpoint
+            ModelA.objects.filter(pk=item.pk).update(integer_field=1500)
+            view_data = post_data.copy()
+            del view_data['csvexport_download']
+            view_data['csvexport_view'] = 'View'
+            resp = self.client.post(self.url_a, view_data)
+            self.assertEqual(resp.content.decode('utf-8').splitlines()[1:], ['"{}","1500"'.format(item.pk)])
+            self.assertEqual(ExportCheckpoint.objects.get().value, '1400')
+            resp = self.client.post(self.url_a, post_data)
+            self.assertEqual(resp.content.decode('utf-8').splitlines()[1:], ['"{}","1500"'.format(item.pk)])
+            self.assertEqual(ExportCheckpoint.objects.get().value, '1500')
+
+            # a named checkpoint starts with a full export
+            post_data['checkpoint'] = 'shared'
+            resp = self.client.post(self.url_a, post_data)
+            self.assertEqual(len(resp.content.decode('utf-8').splitlines()), 6)
+            checkpoint = ExportCheckpoint.objects.get(name='shared')
+            self.assertIsNone(checkpoint.user)
+
+        # without an incremental field the option is ignored
+        del post_data['checkpoint']
+        resp = self.client.post(self.url_a, post_data)
+        self.assertEqual(len(resp.content.decode('utf-8').splitlines()), 6)
+
+
+class ParallelExportTest(TransactionTestCase):
+    def setUp(self):
+        create_test_data()
+        self.client.force_login(User.objects.get(username='admin'))
+        self.url = reverse('admin:testapp_modela_changelist')
+
+    @patch('csvexport.export.get_executor', ThreadPoolExecutor)
+    def test_parallel_export(self):
+        post_data = dict()
+        post_data['action'] = 'csvexport'
+        post_data['csvexport'] = 'csvexport'
+        # Sequences are not reset for sqlite before django 3.1.
+        post_data['_selected_action'] = list(ModelA.objects.values_list('pk', flat=True))
+        post_data['root'] = ['id', 'char_field', 'binary_field', 'uuid_field']
+        post_data['model_b__model_c'] = ['model_b.model_c.char_field']
+        post_data['csvexport_download'] = 'Download'
+        post_data['delimiter'] = ','
+        post_data['quotechar'] = '"'
+        post_data['lineterminator'] = r'\n'
+        post_data['quoting'] = 'QUOTE_MINIMAL'
+
+        resp = self.client.post(self.url, post_data)
+        self.assertEqual(len(resp.content.splitlines()), 6)
+        with AlterSettings(CSV_EXPORT_WORKERS=2):
+            with patch('csvexport.export.iterate_shards', wraps=iterate_shards) as mock:
+                parallel_resp = self.client.post(self.url, post_data)
+            self.assertTrue(mock.called)
+        self.assertEqual(resp.content, parallel_resp.content)
+
+        with AlterSettings(CSV_EXPORT_WORKERS=3, CSV_EXPORT_STREAMING=True):
+            parallel_resp = self.client.post(self.url, post_data)
+        self.assertEqual(resp.content, b''.join(parallel_resp.streaming_content))
+
+    @patch('csvexport.export.get_executor', ThreadPoolExecutor)
+    def test_parallel_timezone(self):
+        # The shards are written in the timezone active for the export.
+        for _ in range(4):
+            ExportJob.objects.create(model='testapp.ModelA', header='[]', csv_format='{}')
+        queryset = ExportJob.objects.order_by('pk')
+        with timezone.override('Asia/Tokyo'):
+            content = ''.join(CSVExport(queryset, ['id', 'created'], dict()))
+            parallel_content = ''.join(CSVExport(queryset, ['id', 'created'], dict(), workers=2))
+        self.assertIn('+09:00', content)
+        self.assertEqual(content, parallel_content)
+
+    def test_shared_executor(self):
+        with patch('csvexport.parallel._executor', None), patch('csvexport.parallel.create_process_pool') as create:
+            executor = get_executor(2)
+            self.assertIs(executor, get_executor(4))
+            create.assert_called_once_with(2)
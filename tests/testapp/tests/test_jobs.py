@@ -0,0 +1,245 @@
+import json
+import shutil
+import tempfile
+from unittest import skipIf
+from unittest.mock import patch
+import django
+from django.contrib import admin
+from django.contrib.admin import AdminSite
+from django.db.models import F
+from django.test import override_settings
+from django.urls import NoReverseMatch
+from django.urls import reverse
+from django.utils import timezone
+
+from csvexport.actions import get_job_url
+from csvexport.export import CSVExport
+from csvexport.models import ExportCheckpoint
+from csvexport.models import ExportJob
+from csvexport.jobs import run_job
+from csvexport.jobs import run_pooled_job
+from ..admin import ModelAAdmin
+from ..models import ModelA
+from .test_export import AlterSettings
+from .test_export import BaseTestCase
+
+
+class ExportJobTest(BaseTestCase):
+    def setUp(self):
+        super().setUp()
+        self.media_root = tempfile.mkdtemp()
+        self.media_settings = override_settings(MEDIA_ROOT=self.media_root)
+        self.media_settings.enable()
+        self.modeladmin = admin.site._registry[ModelA]
+
+    def tearDown(self):
+        self.media_settings.disable()
+        shutil.rmtree(self.media_root)
+        super().tearDown()
+
+    def post_job(self, url, post_data):
+        # Jobs are submitted when the transaction of the request is committed.
+        # Within the transaction of the testcase this never happens.
+        if hasattr(self, 'captureOnCommitCallbacks'):
+            on_commit = self.captureOnCommitCallbacks(execute=True)
+        else:
+            on_commit = patch('csvexport.actions.transaction.on_commit', lambda func: func())
+        with AlterSettings(CSV_EXPORT_JOB_RUNNER='csvexport.jobs.run_job'), on_commit:
+            return self.client.post(url, post_data)
+
+    def start_job(self):
+        post_data = self.export_post_data.copy()
+        post_data.update(self.fields)
+        post_data.update(self.csv_format)
+        post_data['csvexport_background'] = 'Export in background'
+        return self.post_job(self.url_a, post_data)
+
+    def test_background_button(self):
+        resp = self.client.post(self.url_a, self.form_post_data)
+        self.assertNotIn('csvexport_background', resp.content.decode('utf-8'))
+        with AlterSettings(CSV_EXPORT_BACKGROUND=True):
+            resp = self.client.post(self.url_a, self.form_post_data)
+            self.assertIn('csvexport_background', resp.content.decode('utf-8'))
+
+    def test_background_export(self):
+        resp = self.start_job()
+        job = ExportJob.objects.get()
+        self.assertRedirects(resp, reverse('admin:csvexport_exportjob_change', args=(job.pk,)))
+        self.assertEqual(job.status, ExportJob.FINISHED)
+        self.assertEqual(job.rows, 5)
+        self.assertEqual(job.user, self.admin)
+
+        # check status
+        resp = self.client.get(reverse('admin:csvexport_exportjob_status', args=(job.pk,)))
+        status = json.loads(resp.content)
+        self.assertTrue(status['done'])
+        self.assertEqual(status['status'], ExportJob.FINISHED)
+        self.assertEqual(status['download_url'], reverse('admin:csvexport_exportjob_download', args=(job.pk,)))
+
+        # check status-page
+        resp = self.client.get(reverse('admin:csvexport_exportjob_change', args=(job.pk,)))
+        self.assertEqual(resp.status_code, 200)
+        self.assertIn(status['download_url'], resp.content.decode('utf-8'))
+
+        # check download
+        resp = self.client.get(status['download_url'])
+        self.assertEqual(resp.status_code, 200)
+        content = b''.join(resp.streaming_content)
+        self.check_content(content, None)
+        self.assertEqual(len(content.splitlines()), 6)
+
+    def test_resume_download(self):
+        self.start_job()
+        job = ExportJob.objects.get()
+        url = reverse('admin:csvexport_exportjob_download', args=(job.pk,))
+        resp = self.client.get(url)
+        content = b''.join(resp.streaming_content)
+        etag = resp['ETag']
+        self.assertEqual(resp['Accept-Ranges'], 'bytes')
+        self.assertEqual(resp['Cache-Control'], 'private, no-cache')
+        self.assertTrue(resp['Last-Modified'])
+
+        # partial content
+        resp = self.client.get(url, HTTP_RANGE='bytes=10-19')
+        self.assertEqual(resp.status_code, 206)
+        self.assertEqual(resp['Content-Range'], 'bytes 10-19/{}'.format(len(content)))
+        self.assertEqual(b''.join(resp.streaming_content), content[10:20])
+        resp = self.client.get(url, HTTP_RANGE='bytes=100-', HTTP_IF_RANGE=etag)
+        self.assertEqual(resp.status_code, 206)
+        self.assertEqual(b''.join(resp.streaming_content), content[100:])
+        resp = self.client.get(url, HTTP_RANGE='bytes=-5')
+        self.assertEqual(b''.join(resp.streaming_content), content[-5:])
+
+        # a changed file is served completely
+        resp = self.client.get(url, HTTP_RANGE='bytes=100-', HTTP_IF_RANGE='"other"')
+        self.assertEqual(resp.status_code, 200)
+        self.assertEqual(b''.join(resp.streaming_content), content)
+
+        # invalid and unsatisfiable ranges
+        resp = self.client.get(url, HTTP_RANGE='bytes=20-10')
+        self.assertEqual(resp.status_code, 200)
+        resp = self.client.get(url, HTTP_RANGE='bytes={}-'.format(len(content)))
+        self.assertEqual(resp.status_code, 416)
+        self.assertEqual(resp['Content-Range'], 'bytes */{}'.format(len(content)))
+
+        # unchanged files are not send again
+        resp = self.client.get(url, HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(resp.status_code, 304)
+        self.assertEqual(resp['Cache-Control'], 'private, no-cache')
+        resp = self.client.get(url, HTTP_IF_MODIFIED_SINCE=resp['Last-Modified'])
+        self.assertEqual(resp.status_code, 304)
+
+    def test_job_queryset(self):
+        # all items of the filtered changelist
+        job = ExportJob.objects.create_job(self.modeladmin, ['id'], dict(), filters=dict(id__gt=['2'], p=['2']))
+        self.assertEqual(list(job.get_queryset().values_list('pk', flat=True)), [5, 4, 3])
+
+        # selected items of the changelist
+        job = ExportJob.objects.create_job(
+            self.modeladmin, ['id'], dict(), filters=dict(id__gt=['2']), pks=[1, 3, 4])
+        self.assertEqual(list(job.get_queryset().values_list('pk', flat=True)), [4, 3])
+
+        # the queryset is rebuilt with the user's modeladmin-queryset
+        job.user = self.anyuser
+        with patch.object(ModelAAdmin, 'get_queryset', lambda self, request: ModelA.objects.filter(
+                pk__in=[] if request.user.username == 'anyuser' else [1, 2, 3])):
+            self.assertFalse(job.get_queryset().exists())
+
+        job.admin_site = 'nosite'
+        self.assertRaises(LookupError, job.get_queryset)
+
+    def test_background_select_across(self):
+        post_data = self.export_post_data.copy()
+        post_data.update(self.csv_format)
+        post_data['root'] = ['id']
+        post_data['select_across'] = '1'
+        post_data['_selected_action'] = ['5']
+        post_data['csvexport_background'] = 'Export in background'
+        self.post_job(self.url_a + '?id__gt=2', post_data)
+        job = ExportJob.objects.get()
+        self.assertEqual(job.rows, 3)
+        self.assertEqual(job.file.read().decode('utf-8').splitlines()[1:], ['"5"', '"4"', '"3"'])
+
+    @skipIf(django.VERSION < (3, 2), 'Capturing on-commit callbacks needs django 3.2 or higher.')
+    def test_submit_on_commit(self):
+        post_data = self.export_post_data.copy()
+        post_data.update(self.fields)
+        post_data.update(self.csv_format)
+        post_data['csvexport_background'] = 'Export in background'
+        with patch('csvexport.actions.submit_job') as submit_job:
+            with self.captureOnCommitCallbacks() as callbacks:
+                self.client.post(self.url_a, post_data)
+            submit_job.assert_not_called()
+            self.assertEqual(len(callbacks), 1)
+            callbacks[0]()
+            submit_job.assert_called_once_with(ExportJob.objects.get())
+
+    def test_pooled_job_error(self):
+        # errors of jobs run by the pool are logged
+        with self.assertLogs('csvexport.jobs', 'ERROR'), patch('csvexport.jobs.connections'):
+            run_pooled_job(0)
+
+    def test_job_url(self):
+        # the job-admin is not registered on the admin-site of the modeladmin
+        site = AdminSite(name='othersite')
+        with patch.object(self.modeladmin, 'admin_site', site):
+            job = ExportJob.objects.create_job(self.modeladmin, ['id'], dict())
+            url = reverse('admin:csvexport_exportjob_change', args=(job.pk,))
+            self.assertEqual(get_job_url(self.modeladmin, job), url)
+        with patch('csvexport.actions.reverse', side_effect=NoReverseMatch):
+            self.assertIsNone(get_job_url(self.modeladmin, job))
+
+    def test_job_with_annotations(self):
+        annotations = dict(double_integer=F('integer_field') * 2)
+        with patch.object(ModelAAdmin, 'csvexport_annotations', annotations, create=True):
+            job = ExportJob.objects.create_job(self.modeladmin, ['id', 'double_integer'], dict())
+            run_job(job.pk)
+        job.refresh_from_db()
+        self.assertEqual(job.status, ExportJob.FINISHED)
+        self.assertEqual(job.file.read().decode('utf-8').splitlines()[:2], ['id,double_integer', '5,2468'])
+
+    def test_job_timezone(self):
+        with timezone.override('Asia/Tokyo'):
+            job = ExportJob.objects.create_job(self.modeladmin, ['id'], dict())
+        self.assertEqual(job.time_zone, 'Asia/Tokyo')
+
+        # the job is written in the timezone active when it was created
+        timezones = list()
+
+        def create_export(*args):
+            timezones.append(timezone.get_current_timezone_name())
+            return CSVExport(*args)
+        with patch('csvexport.jobs.CSVExport', side_effect=create_export):
+            run_job(job.pk)
+        self.assertEqual(timezones, ['Asia/Tokyo'])
+        self.assertEqual(ExportJob.objects.get(pk=job.pk).status, ExportJob.FINISHED)
+
+    def test_incremental_job(self):
+        checkpoint = ExportCheckpoint.objects.get_checkpoint(ModelA, 'integer_field', name='nightly')
+        job = ExportJob.objects.create_job(self.modeladmin, ['id'], dict(), checkpoint=checkpoint)
+        run_job(job.pk)
+        checkpoint.refresh_from_db()
+        self.assertEqual(checkpoint.value, '1234')
+        self.assertEqual(ExportJob.objects.get(pk=job.pk).rows, 5)
+
+        checkpoint = ExportCheckpoint.objects.get_checkpoint(ModelA, 'integer_field', name='nightly')
+        job = ExportJob.objects.create_job(self.modeladmin, ['id'], dict(), checkpoint=checkpoint)
+        run_job(job.pk)
+        self.assertEqual(ExportJob.objects.get(pk=job.pk).rows, 0)
+
+    def test_failed_job(self):
+        job = ExportJob.objects.create_job(self.modeladmin, ['no_field'], dict())
+        with self.assertLogs('csvexport.jobs', 'ERROR'):
+            run_job(job.pk)
+        job.refresh_from_db()
+        self.assertEqual(job.status, ExportJob.FAILED)
+        self.assertTrue(job.error)
+        resp = self.client.get(reverse('admin:csvexport_exportjob_download', args=(job.pk,)))
+        self.assertEqual(resp.status_code, 404)
+
+    def test_foreign_jobs(self):
+        self.start_job()
+        job = ExportJob.objects.get()
+        self.client.force_login(self.anyuser)
+        resp = self.client.get(reverse('admin:csvexport_exportjob_download', args=(job.pk,)))
+        self.assertEqual(resp.status_code, 404)
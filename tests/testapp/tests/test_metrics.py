@@ -0,0 +1,85 @@
+import socket
+from unittest.mock import MagicMock
+
+from csvexport.signals import export_finished
+from csvexport.signals import export_started
+from ..models import ModelA
+from .test_export import AlterSettings
+from .test_export import BaseTestCase
+
+
+class MetricsTest(BaseTestCase):
+    def setUp(self):
+        super().setUp()
+        self.post_data = self.export_post_data.copy()
+        self.post_data.update(self.csv_format)
+        self.post_data['root'] = ['id', 'char_field']
+        self.post_data['model_b'] = ['model_b.char_field']
+        self.post_data['csvexport_view'] = 'View'
+
+        self.started = MagicMock()
+        self.finished = MagicMock()
+        export_started.connect(self.started)
+        export_finished.connect(self.finished)
+        self.addCleanup(export_started.disconnect, self.started)
+        self.addCleanup(export_finished.disconnect, self.finished)
+
+    def test_signals(self):
+        resp = self.client.post(self.url_a, self.post_data)
+        self.assertEqual(self.started.call_count, 1)
+        self.assertEqual(self.finished.call_count, 1)
+        kwargs = self.finished.call_args[1]
+        self.assertEqual(kwargs['sender'], ModelA)
+        self.assertEqual(kwargs['rows'], 5)
+        self.assertEqual(kwargs['bytes'], len(resp.content))
+        self.assertIsNone(kwargs['error'])
+        self.assertEqual(kwargs['export'].field_paths, ['id', 'char_field', 'model_b__char_field'])
+        self.assertEqual(set(kwargs['durations']), {'tree', 'query', 'rows', 'response'})
+
+    def test_signals_with_streaming(self):
+        with AlterSettings(CSV_EXPORT_STREAMING=True):
+            resp = self.client.post(self.url_a, self.post_data)
+            self.assertEqual(self.started.call_count, 1)
+            self.assertEqual(self.finished.call_count, 0)
+            content = b''.join(resp.streaming_content)
+        self.assertEqual(self.finished.call_count, 1)
+        self.assertEqual(self.finished.call_args[1]['bytes'], len(content))
+        self.assertEqual(self.finished.call_args[1]['rows'], 5)
+
+    def test_log_record(self):
+        with self.assertLogs('csvexport.metrics', 'INFO') as logs:
+            self.client.post(self.url_a, self.post_data)
+        record = logs.records[0].csvexport
+        self.assertEqual(record['model'], 'testapp.ModelA')
+        self.assertEqual(record['rows'], 5)
+        self.assertIn('"testapp_modelb"."char_field"', record['sql'])
+        self.assertEqual(record['fields'], ['id', 'char_field', 'model_b__char_field'])
+
+    def test_failed_export(self):
+        self.post_data['quoting'] = 'QUOTE_NONE'
+        self.post_data['root'] = ['text_field']
+        with self.assertLogs('csvexport.metrics', 'WARNING'):
+            self.client.post(self.url_a, self.post_data)
+        self.assertIsNotNone(self.finished.call_args[1]['error'])
+
+    def test_statsd_hook(self):
+        with socket.socket(socket.AF_INET, socket.SOCK_DGRAM) as sock:
+            sock.bind(('127.0.0.1', 0))
+            sock.settimeout(5)
+            port = sock.getsockname()[1]
+            with AlterSettings(CSV_EXPORT_METRICS_HOOK='csvexport.metrics.send_to_statsd',
+                               CSV_EXPORT_STATSD_HOST='127.0.0.1',
+                               CSV_EXPORT_STATSD_PORT=port):
+                self.client.post(self.url_a, self.post_data)
+            metrics = sock.recv(4096).decode('ascii').splitlines()
+
+        self.assertIn('csvexport.exports:1|c', metrics)
+        self.assertIn('csvexport.rows:5|c', metrics)
+        for phase in ['tree', 'query', 'rows', 'response']:
+            self.assertTrue(any(m.startswith('csvexport.{}:'.format(phase)) and m.endswith('|ms') for m in metrics))
+
+    def test_failing_hook(self):
+        with AlterSettings(CSV_EXPORT_METRICS_HOOK='csvexport.metrics.unknown_hook'):
+            with self.assertLogs('csvexport.metrics', 'ERROR'):
+                resp = self.client.post(self.url_a, self.post_data)
+        self.assertEqual(resp.status_code, 200)
@@ -0,0 +1,64 @@
+from datetime import datetime
+from datetime import timezone as dt_timezone
+from django.db import models
+from django.test import SimpleTestCase
+from django.test import override_settings
+
+from csvexport.plan import ExportPlan
+from csvexport.plan import get_csv_converter
+from csvexport.utils import get_model_field
+from csvexport.utils import is_nullable
+from ..models import ModelA
+from ..models import ModelC
+from .test_export import AlterSettings
+
+
+class ExportPlanTest(SimpleTestCase):
+    def test_is_nullable(self):
+        self.assertFalse(is_nullable(ModelA, 'char_field'))
+        self.assertFalse(is_nullable(ModelA, 'model_c__model_d__char_field'))
+        self.assertTrue(is_nullable(ModelA, 'model_b__model_c__char_field'))
+        self.assertTrue(is_nullable(ModelC, 'model_dd__integer_field'))
+        self.assertTrue(is_nullable(ModelC, 'model_dd'))
+
+    def test_plain_columns(self):
+        # Columns that could be written as they are get no converter.
+        for path in ['integer_field', 'char_field', 'uuid_field', 'model_b__model_c__char_field']:
+            field = get_model_field(ModelA, path)
+            self.assertIsNone(get_csv_converter(field, is_nullable(ModelA, path)))
+
+        rows = [(1, 'a'), (2, 'b')]
+        plan = ExportPlan([None, None])
+        self.assertFalse(plan)
+        self.assertEqual(list(plan.convert(rows)), rows)
+
+    def test_empty_value(self):
+        with AlterSettings(CSV_EXPORT_EMPTY_VALUE='-'):
+            integer_field = get_model_field(ModelA, 'integer_field')
+            char_field = get_model_field(ModelA, 'char_field')
+            self.assertIsNone(get_csv_converter(integer_field, False))
+            plan = ExportPlan([
+                get_csv_converter(integer_field, True),
+                get_csv_converter(char_field, False),
+            ])
+            rows = list(plan.convert([(None, ''), (1, 'a')]))
+        self.assertEqual(rows, [['-', '-'], [1, 'a']])
+
+    @override_settings(USE_TZ=True, TIME_ZONE='Europe/Berlin')
+    def test_datetime_localtime(self):
+        converter = get_csv_converter(models.DateTimeField(null=True), True)
+        value = datetime(2020, 1, 1, 12, tzinfo=dt_timezone.utc)
+        self.assertEqual(str(converter(value)), '2020-01-01 13:00:00+01:00')
+        self.assertIsNone(converter(None))
+
+    def test_binary_field(self):
+        converter = get_csv_converter(get_model_field(ModelA, 'binary_field'), False)
+        self.assertEqual(converter(memoryview(b'abcde')), b'abcde')
+
+    def test_choices_display(self):
+        field = models.IntegerField(choices=[(1, 'One'), (2, 'Two')])
+        self.assertIsNone(get_csv_converter(field, False))
+        with AlterSettings(CSV_EXPORT_CHOICES_DISPLAY=True):
+            converter = get_csv_converter(field, False)
+        self.assertEqual(converter(1), 'One')
+        self.assertEqual(converter(3), 3)
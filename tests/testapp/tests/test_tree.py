@@ -0,0 +1,219 @@
+import json
+from unittest.mock import MagicMock
+from unittest.mock import patch
+from django.db import connection
+from django.test import Client
+from django.test.utils import CaptureQueriesContext
+from django.urls import reverse
+
+from csvexport.actions import get_lazy_field_paths
+from csvexport.search import FieldPathIndex
+from csvexport.search import get_field_path_index
+from csvexport.utils import get_model_tree
+from csvexport.utils import get_partial_model_tree
+from csvexport.utils import is_relation_path
+from ..admin import ModelAAdmin
+from ..admin import ModelBAdmin
+from ..models import ModelA
+from ..models import ModelB
+from .test_export import AlterSettings
+from .test_export import BaseTestCase
+
+
+class LazyTreeTest(BaseTestCase):
+    def request_node(self, field_path, client=None, url=None):
+        post_data = self.form_post_data.copy()
+        post_data['csvexport_tree'] = field_path
+        return (client or self.client).post(url or self.url_a, post_data)
+
+    def get_node(self, field_path, client=None):
+        resp = self.request_node(field_path, client)
+        self.assertEqual(resp.status_code, 200)
+        return json.loads(resp.content)
+
+    def test_partial_model_tree(self):
+        modeladmin = ModelAAdmin(ModelA, None)
+        tree = get_partial_model_tree(modeladmin, ['model_b__model_c'])
+        self.assertEqual(
+            [n.field_path for n in tree.iterate()],
+            [None, 'model_b', 'model_b__model_c'])
+        self.assertIs(tree, get_partial_model_tree(modeladmin, ['model_b__model_c']))
+
+        # unknown paths are ignored
+        tree = get_partial_model_tree(modeladmin, ['no_field', 'model_b__no_field'])
+        self.assertEqual([n.field_path for n in tree.iterate()], [None, 'model_b'])
+        tree = get_partial_model_tree(modeladmin, [])
+        self.assertEqual(len(list(tree.iterate())), 1)
+
+        # the nodes equal those of the complete tree
+        full_tree = get_model_tree(ModelBAdmin(ModelB, None))
+        tree = get_partial_model_tree(ModelBAdmin(ModelB, None), ['model_c__model_d'])
+        node = tree.get('model_c__model_d')
+        full_node = full_tree.get('model_c__model_d')
+        self.assertEqual(node.choices, full_node.choices)
+        self.assertEqual(node.initial, full_node.initial)
+
+    def test_relation_path(self):
+        self.assertTrue(is_relation_path(ModelA, 'model_b'))
+        self.assertTrue(is_relation_path(ModelA, 'model_b__model_c__model_d', 3))
+        self.assertFalse(is_relation_path(ModelA, 'model_b__model_c__model_d__model_c', 3))
+        self.assertFalse(is_relation_path(ModelA, 'model_b__char_field'))
+        self.assertFalse(is_relation_path(ModelA, 'csrfmiddlewaretoken'))
+        self.assertFalse(is_relation_path(ModelA, ''))
+
+    def test_lazy_form(self):
+        with AlterSettings(CSV_EXPORT_LAZY_TREE=True):
+            resp = self.client.post(self.url_a, self.form_post_data)
+        content = resp.content.decode('utf-8')
+        self.assertIn('name="root"', content)
+        self.assertNotIn('name="model_b"', content)
+        self.assertIn('id="csvexport-tree"', content)
+        self.assertIn('data-node="model_b"', content)
+
+        # nodes with selected fields are rendered right away
+        with AlterSettings(CSV_EXPORT_LAZY_TREE=True):
+            resp = self.client.post(self.url_b, self.form_post_data)
+        content = resp.content.decode('utf-8')
+        self.assertIn('name="model_c__model_d"', content)
+
+    def test_tree_view(self):
+        node = self.get_node('model_b')
+        self.assertEqual(node['field_name'], 'model_b')
+        self.assertIn(['model_b.char_field', 'char_field'], node['choices'])
+        self.assertIn('name="model_b"', node['html'])
+        self.assertIn('model_b__model_c', [c['field_name'] for c in node['children']])
+        child = [c for c in node['children'] if c['field_name'] == 'model_b__model_c'][0]
+        self.assertEqual(self.get_node(child['field_path'])['field_name'], 'model_b__model_c')
+
+        root = self.get_node('')
+        self.assertEqual(root['field_name'], 'root')
+        self.assertIn('model_b', [c['field_name'] for c in root['children']])
+
+        # the reference-depth is regarded
+        resp = self.request_node('model_b__model_c__model_d__model_c')
+        self.assertEqual(resp.status_code, 404)
+        resp = self.request_node('char_field')
+        self.assertEqual(resp.status_code, 404)
+        resp = self.request_node('no_field')
+        self.assertEqual(resp.status_code, 404)
+
+    def test_tree_view_permissions(self):
+        client = Client()
+        client.force_login(self.anyuser)
+        node = self.get_node('model_b__model_c', client)
+        self.assertEqual(node['choices'], [])
+        self.assertEqual(node['html'], '')
+        self.assertTrue(self.get_node('model_b', client)['choices'])
+
+        # permissions are checked against the exported model
+        self.assertEqual(self.request_node('', client, self.url_c).status_code, 403)
+
+    def test_tree_url(self):
+        url = reverse('admin:testapp_modela_csvexport_tree')
+        with AlterSettings(CSV_EXPORT_LAZY_TREE=True):
+            resp = self.client.post(self.url_a, self.form_post_data)
+            self.assertIn('data-url="{}"'.format(url), resp.content.decode('utf-8'))
+            resp = self.client.post(self.url_b, self.form_post_data)
+            self.assertIn('id="csvexport-tree" data-url=""', resp.content.decode('utf-8'))
+
+        # the changelist is not build
+        with CaptureQueriesContext(connection) as queries:
+            resp = self.request_node('model_b', url=url)
+        self.assertEqual(json.loads(resp.content)['field_name'], 'model_b')
+        self.assertFalse([q for q in queries if 'COUNT(' in q['sql']])
+
+        self.assertEqual(self.client.get(url).status_code, 405)
+        client = Client()
+        client.force_login(self.anyuser)
+        with patch.object(ModelAAdmin, 'has_view_permission', return_value=False):
+            self.assertEqual(self.request_node('', client, url).status_code, 403)
+
+    def test_lazy_export(self):
+        post_data = self.export_post_data.copy()
+        post_data.update(self.csv_format)
+        post_data['root'] = ['id']
+        post_data['model_b__model_c'] = ['model_b.model_c.char_field']
+        post_data['csvexport_view'] = 'View'
+        with AlterSettings(CSV_EXPORT_LAZY_TREE=True):
+            resp = self.client.post(self.url_a, post_data)
+            self.assertEqual(resp.content.decode('utf-8').splitlines()[0], '"id","model_b.model_c.char_field"')
+
+            # only submitted field-paths of relations are regarded
+            request = MagicMock(POST=post_data)
+            field_paths = get_lazy_field_paths(ModelAAdmin(ModelA, None), request)
+            self.assertIn('model_b__model_c', field_paths)
+            self.assertNotIn('delimiter', field_paths)
+            self.assertNotIn('csvexport', field_paths)
+
+            # submitted fields are validated
+            post_data['model_b__model_c'] = ['model_b.model_c.no_field']
+            resp = self.client.post(self.url_a, post_data)
+            self.assertIn('Select a valid choice', resp.content.decode('utf-8'))
+
+
+class FieldSearchTest(BaseTestCase):
+    def search(self, query, client=None, url=None):
+        post_data = self.form_post_data.copy()
+        post_data['csvexport_search'] = query
+        resp = (client or self.client).post(url or self.url_a, post_data)
+        self.assertEqual(resp.status_code, 200)
+        return json.loads(resp.content)['results']
+
+    def test_index(self):
+        index = FieldPathIndex([(v, 'root', None) for v in ['b.char', 'a.char', 'a.int', 'b.a.char', 'char']])
+        self.assertEqual([e[0] for e in index.search('a.')], ['a.char', 'a.int', 'b.a.char'])
+        self.assertEqual([e[0] for e in index.search('CHAR')], ['char', 'a.char', 'b.a.char', 'b.char'])
+        self.assertEqual([e[0] for e in index.search('ch', limit=2)], ['char', 'a.char'])
+        self.assertEqual(index.search(''), [])
+        self.assertEqual(index.search('nothing'), [])
+
+    def test_large_index(self):
+        entries = ['model_{}.relation_{}.field_{}'.format(a, b, c)
+                   for a in range(20) for b in range(50) for c in range(50)]
+        index = FieldPathIndex([(e, 'root', None) for e in entries])
+        self.assertEqual(len(index), 50000)
+        self.assertEqual(index.search('model_7.relation_42.field_3')[0][0], 'model_7.relation_42.field_3')
+        self.assertEqual(len(index.search('relation_42.field_49', limit=100)), 20)
+
+    def test_model_tree_index(self):
+        index = get_field_path_index(ModelAAdmin(ModelA, None))
+        self.assertIs(index, get_field_path_index(ModelAAdmin(ModelA, None)))
+        tree = get_model_tree(ModelAAdmin(ModelA, None))
+        nodes = tree.iterate_nodes_with_choices_and_permission(ignore_permissions=True)
+        self.assertEqual(len(index), sum(len(n.choices) for n in nodes))
+
+        # the export-fields of the modeladmin are regarded
+        index = get_field_path_index(ModelBAdmin(ModelB, None))
+        self.assertEqual([e[0] for e in index.search('model_d.')], [
+            'model_c.model_d.boolean_field', 'model_c.model_d.char_field', 'model_c.model_d.date_field'])
+
+    def test_search_view(self):
+        results = self.search('model_b.model_c.char')
+        self.assertEqual(results[0], dict(value='model_b.model_c.char_field', field_name='model_b__model_c'))
+        self.assertTrue(self.search('char_field'))
+
+        # only fields of models the user has view-permission for
+        client = Client()
+        client.force_login(self.anyuser)
+        self.assertEqual(self.search('model_b.model_c.char', client), [])
+        self.assertTrue(self.search('model_b.char', client))
+        post_data = self.form_post_data.copy()
+        post_data['csvexport_search'] = 'char'
+        self.assertEqual(client.post(self.url_c, post_data).status_code, 403)
+
+    def test_search_url(self):
+        url = reverse('admin:testapp_modela_csvexport_search')
+        with AlterSettings(CSV_EXPORT_FIELD_SEARCH=True):
+            resp = self.client.post(self.url_a, self.form_post_data)
+        self.assertIn('data-url="{}"'.format(url), resp.content.decode('utf-8'))
+        with CaptureQueriesContext(connection) as queries:
+            results = self.search('model_b.model_c.char', url=url)
+        self.assertEqual(results[0]['value'], 'model_b.model_c.char_field')
+        self.assertFalse([q for q in queries if 'COUNT(' in q['sql']])
+
+    def test_search_form(self):
+        resp = self.client.post(self.url_a, self.form_post_data)
+        self.assertNotIn('csvexport-search', resp.content.decode('utf-8'))
+        with AlterSettings(CSV_EXPORT_FIELD_SEARCH=True):
+            resp = self.client.post(self.url_a, self.form_post_data)
+        self.assertIn('id="csvexport-search"', resp.content.decode('utf-8'))
@@ -0,0 +1,50 @@
+import os
+from django.test import SimpleTestCase
+
+from csvexport.unique import DigestSet
+from csvexport.unique import BloomFilter
+from csvexport.unique import PartitionedDigestSet
+from csvexport.unique import get_row_filter
+from .test_export import AlterSettings
+
+
+class RowFilterTest(SimpleTestCase):
+    def check_filter(self, row_filter):
+        rows = ['"{}","ℋ ℌ"\n'.format(i % 100) for i in range(1000)]
+        unique_rows = [r for r in rows if row_filter.add(r)]
+        row_filter.close()
+        self.assertEqual(unique_rows, rows[:100])
+
+    def test_digest_set(self):
+        self.check_filter(DigestSet())
+
+    def test_bloom_filter(self):
+        self.check_filter(BloomFilter(1000, 0.0001))
+
+    def test_partitioned_digest_set(self):
+        row_filter = PartitionedDigestSet(8, partitions=4)
+        rows = ['"{}","ℋ ℌ"\n'.format(i % 100) for i in range(1000)]
+        unique_rows = [r for r in rows[:100] if row_filter.add(r)]
+        self.assertEqual(unique_rows, rows[:100])
+
+        # the partitions were spilled to disk
+        self.assertIsNotNone(row_filter.tempdir)
+        path = row_filter.tempdir.name
+        self.assertTrue(os.listdir(path))
+        spilled = sum(db.execute('SELECT COUNT(*) FROM digests').fetchone()[0]
+                      for db in row_filter.databases if db is not None)
+        in_memory = sum(len(p) for p in row_filter.partitions)
+        self.assertGreater(spilled, 0)
+        self.assertEqual(spilled + in_memory, 100)
+
+        # duplicates of spilled rows are still removed
+        self.assertEqual([r for r in rows[100:] if row_filter.add(r)], [])
+        row_filter.close()
+        self.assertFalse(os.path.exists(path))
+
+    def test_get_row_filter(self):
+        for backend, cls in [('memory', DigestSet), ('bloom', BloomFilter), ('disk', PartitionedDigestSet)]:
+            with AlterSettings(CSV_EXPORT_UNIQUE_BACKEND=backend):
+                self.assertIsInstance(get_row_filter(), cls)
+        with AlterSettings(CSV_EXPORT_UNIQUE_BACKEND='unknown'):
+            self.assertRaises(ValueError, get_row_filter)